@@ -0,0 +1,151 @@
+"""
+Loading a review CSV into the foodreview table, the 30-row executemany loop of
+AzureSQL_AISearch_IntegratedVectorization.ipynb vs. bulk_load.py.
+
+The database is a SQLite stand-in charging `--rtt-ms` per round trip the way
+pyodbc talks to Azure SQL: executemany sends one row per round trip, unless the
+cursor has fast_executemany set, then the whole parameter array goes in one.
+Commits cost a round trip too. The stand-in serializes the inserts themselves,
+so what the workers overlap is the network time; bandwidth and the server's log
+throughput are not modelled. The CSVs repeat the rows of Reviews_small.csv with
+new ids. The notebook loop runs up to `--notebook-max-rows` rows, it takes about
+rows x rtt.
+
+    python benchmark/bench_bulk_load.py --rows 10000 100000 1000000 --rtt-ms 2
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bulk_load  # noqa: E402
+
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "DataSet", "Reviews_small.csv")
+
+CREATE_TABLE = """CREATE TABLE foodreview (Id int NOT NULL PRIMARY KEY, ProductId text, UserId text, ProfileName text,
+                  HelpfulnessNumerator integer, HelpfulnessDenominator integer, Score integer, Time bigint,
+                  Summary text, Text text, TextConcat text)"""
+
+
+class StandinCursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self.fast_executemany = False
+
+    def setinputsizes(self, sizes):
+        pass
+
+    def execute(self, statement, params=()):
+        time.sleep(self._conn.rtt)
+        with self._conn.lock:
+            self._conn.db.execute(statement, params)
+
+    def executemany(self, statement, rows):
+        time.sleep(self._conn.rtt * (1 if self.fast_executemany else len(rows)))
+        with self._conn.lock:
+            self._conn.db.executemany(statement, rows)
+
+    def close(self):
+        pass
+
+
+class StandinConnection:
+    """pyodbc-like connection to a SQLite file shared by every connection of the load."""
+
+    def __init__(self, db, lock, rtt, autocommit=False):
+        self.db, self.lock, self.rtt, self.autocommit = db, lock, rtt, autocommit
+
+    def cursor(self):
+        return StandinCursor(self)
+
+    def commit(self):
+        time.sleep(self.rtt)
+        with self.lock:
+            self.db.commit()
+
+    def rollback(self):
+        with self.lock:
+            self.db.rollback()
+
+    def close(self):
+        pass
+
+
+def make_database(rtt):
+    db = sqlite3.connect(os.path.join(tempfile.mkdtemp(), "reviews.db"), check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute(CREATE_TABLE)
+    lock = threading.Lock()
+    return db, lambda conn_str, autocommit=False: StandinConnection(db, lock, rtt, autocommit)
+
+
+def make_csv(rows: int) -> str:
+    sample = pd.read_csv(SAMPLE, dtype=str)
+    path = os.path.join(tempfile.mkdtemp(), f"reviews_{rows}.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(sample.columns)
+        records = list(sample.itertuples(index=False, name=None))
+        for i in range(rows):
+            writer.writerow((i + 1,) + records[i % len(records)][1:])
+    return path
+
+
+def notebook(path, connect):
+    # the cells of the notebook, on a connection opened with autocommit=True
+    conn = connect("", autocommit=True)
+    cursor = conn.cursor()
+    df_all = pd.read_csv(path)
+    df_all["TextConcat"] = df_all.apply(lambda row: f"Summary: {row['Summary']} | Review: {row['Text']}", axis=1)
+    batch_size = 30
+    batches = [df_all[i:i + batch_size] for i in range(0, len(df_all), batch_size)]
+    for batch in batches:
+        rows = [tuple(row) for row in batch.itertuples(index=False)]
+        query = ("INSERT INTO foodreview (Id, ProductId, UserId, ProfileName, HelpfulnessNumerator, "
+                 "HelpfulnessDenominator, Score, Time, Summary, Text, TextConcat) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+        cursor.executemany(query, rows)
+        # autocommit, every row is its own transaction
+        conn.db.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="simulated SQL round trip")
+    parser.add_argument("--workers", type=int, default=bulk_load.BULK_LOAD_WORKERS)
+    parser.add_argument("--chunk-rows", type=int, default=bulk_load.BULK_LOAD_CHUNK_ROWS)
+    parser.add_argument("--notebook-max-rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'loader':<10} {'seconds':>8} {'rows/s':>9} {'in table':>9}")
+    for rows in args.rows:
+        path = make_csv(rows)
+        runs = [("bulk_load", lambda connect: bulk_load.load_csv(path, "", connect=connect, workers=args.workers,
+                                                                 chunk_rows=args.chunk_rows))]
+        if rows <= args.notebook_max_rows:
+            runs.insert(0, ("notebook", lambda connect: notebook(path, connect)))
+        tables = {}
+        for name, run in runs:
+            db, connect = make_database(args.rtt_ms / 1000)
+            start = time.perf_counter()
+            run(connect)
+            seconds = time.perf_counter() - start
+            count = db.execute("SELECT count(*) FROM foodreview").fetchone()[0]
+            tables[name] = db.execute("SELECT * FROM foodreview ORDER BY Id LIMIT 1000").fetchall()
+            print(f"{rows:>9} {name:<10} {seconds:8.2f} {rows / seconds:9.0f} {count:>9}")
+            db.close()
+        if len(tables) == 2:
+            print(f"{'':>9} same rows as the notebook: {tables['notebook'] == tables['bulk_load']}")
+        os.remove(path)
@@ -0,0 +1,162 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Bulk loads a review CSV such as ../DataSet/Reviews_small.csv into the foodreview table.
+
+The file is read in chunks of BULK_LOAD_CHUNK_ROWS rows, so memory stays bounded
+by the chunks in flight whatever the size of the file. Each chunk gets its
+TextConcat column like in the notebook and is inserted with one parameter-array
+executemany (pyodbc fast_executemany) in its own transaction. BULK_LOAD_WORKERS
+threads insert chunks in parallel, each over its own connection kept for the
+whole load, while the next chunks are read.
+
+    python bulk_load.py ../DataSet/Reviews_small.csv --table foodreview
+"""
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterator
+
+import pandas as pd
+
+BULK_LOAD_WORKERS = int(os.environ.get("BULK_LOAD_WORKERS", "4"))
+BULK_LOAD_CHUNK_ROWS = int(os.environ.get("BULK_LOAD_CHUNK_ROWS", "10000"))
+
+COLUMNS = ("Id", "ProductId", "UserId", "ProfileName", "HelpfulnessNumerator", "HelpfulnessDenominator", "Score",
+           "Time", "Summary", "Text", "TextConcat")
+_STRING_COLUMNS = ("ProductId", "UserId", "ProfileName", "Summary", "Text", "TextConcat")
+_DTYPES = {column: str for column in _STRING_COLUMNS if column != "TextConcat"}
+
+# pyodbc.SQL_WVARCHAR, without importing pyodbc for connections that are not ODBC
+_SQL_WVARCHAR = -9
+# longest nvarchar(n) parameter, longer strings are bound as nvarchar(max)
+_MAX_NVARCHAR = 4000
+
+
+def read_chunks(path: str, chunk_rows: int = BULK_LOAD_CHUNK_ROWS) -> Iterator[list]:
+    """Rows of the CSV at `path` as lists of tuples in COLUMNS order, `chunk_rows` at a time."""
+    for df in pd.read_csv(path, chunksize=chunk_rows, dtype=_DTYPES):
+        # same text as the notebook's f-string, missing values included
+        df["TextConcat"] = "Summary: " + df["Summary"].astype(str) + " | Review: " + df["Text"].astype(str)
+        df = df[list(COLUMNS)].astype(object)
+        yield list(df.where(df.notna(), None).itertuples(index=False, name=None))
+
+
+def _utf16_len(value: str) -> int:
+    # nvarchar sizes count UTF-16 code units, characters outside the BMP (emoji) take two
+    return len(value.encode('utf-16-le')) // 2
+
+
+def _input_sizes(rows: list) -> list:
+    """
+    Parameter sizes of a chunk. Left to itself fast_executemany sizes the buffers
+    from the column type, 2 GB per value for the text columns of foodreview.
+    """
+    sizes = []
+    for i, column in enumerate(COLUMNS):
+        if column in _STRING_COLUMNS:
+            longest = max((_utf16_len(row[i]) for row in rows if row[i] is not None), default=1)
+            sizes.append((_SQL_WVARCHAR, longest if longest <= _MAX_NVARCHAR else 0, 0))
+        else:
+            sizes.append(None)
+    return sizes
+
+
+def _insert(conn, statement: str, rows: list):
+    cursor = conn.cursor()
+    try:
+        if hasattr(cursor, "fast_executemany"):
+            # the whole chunk goes as one parameter array instead of one round trip per row
+            cursor.fast_executemany = True
+            cursor.setinputsizes(_input_sizes(rows))
+        cursor.executemany(statement, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def load_csv(path: str, conn_str: str, table: str = "foodreview", connect: Callable = None,
+             workers: int = BULK_LOAD_WORKERS, chunk_rows: int = BULK_LOAD_CHUNK_ROWS,
+             on_progress: Callable = None) -> dict:
+    """
+    Insert the rows of the CSV at `path` into `table`. `connect(conn_str)` opens the
+    connections, pyodbc.connect by default. `on_progress` is called with the stats
+    after each chunk. Returns rows, chunks, seconds and rows_per_s.
+
+    Chunks are committed on their own: when a chunk fails the load stops and
+    raises, the chunks committed before stay in the table.
+    """
+    if connect is None:
+        import pyodbc
+        connect = pyodbc.connect
+    statement = f"INSERT INTO {table} ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+    local = threading.local()
+    connections = []
+    lock = threading.Lock()
+
+    def load(rows):
+        if not hasattr(local, "conn"):
+            local.conn = connect(conn_str)
+            with lock:
+                connections.append(local.conn)
+        _insert(local.conn, statement, rows)
+        return len(rows)
+
+    start = time.perf_counter()
+    stats = {"rows": 0, "chunks": 0, "seconds": 0.0, "rows_per_s": 0.0}
+
+    def done(futures):
+        for future in futures:
+            stats["rows"] += future.result()
+            stats["chunks"] += 1
+            stats["seconds"] = time.perf_counter() - start
+            stats["rows_per_s"] = stats["rows"] / stats["seconds"]
+            if on_progress:
+                on_progress(dict(stats))
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    pending = set()
+    try:
+        for rows in read_chunks(path, chunk_rows):
+            # one chunk read ahead of the workers at most
+            if len(pending) > workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                done(finished)
+            pending.add(pool.submit(load, rows))
+        finished, pending = wait(pending)
+        done(finished)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        for conn in connections:
+            conn.close()
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_s"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+if __name__ == "__main__":
+    from dotenv import dotenv_values
+
+    parser = argparse.ArgumentParser(description="Bulk load a review CSV into Azure SQL.")
+    parser.add_argument("csv", nargs="?", default="../DataSet/Reviews_small.csv")
+    parser.add_argument("--table", default="foodreview")
+    parser.add_argument("--workers", type=int, default=BULK_LOAD_WORKERS)
+    parser.add_argument("--chunk-rows", type=int, default=BULK_LOAD_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    config = dotenv_values("../../.env")
+
+    def progress(stats):
+        print(f"{stats['rows']} rows, {stats['rows_per_s']:.0f} rows/s")
+
+    stats = load_csv(args.csv, config['AZURE_SQL_CONNECTION_STRING'], args.table, workers=args.workers,
+                     chunk_rows=args.chunk_rows, on_progress=progress)
+    print(f"loaded {stats['rows']} rows in {stats['chunks']} chunks, {stats['seconds']:.1f} s, "
+          f"{stats['rows_per_s']:.0f} rows/s")
@@ -0,0 +1,249 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Keeps the product search index in sync with the database through SQL change tracking.
+
+Each run reads the ids of the products whose document changed since the last
+synced version from CHANGETABLE(CHANGES ...) on the tables the documents are
+built from, loads just those products and re-embeds only the texts whose hash
+differs from the one last indexed. Changed products are merged into the index,
+deleted ones removed, and the new version is saved as the watermark once the
+index acknowledged every action, so a failed run is simply repeated. The work
+of a run follows the number of changes, not the size of the catalog.
+
+The hashes and the watermark are kept in a SQLite file in DELTA_SYNC_DIR. The
+first run, a run after the change tracking retention dropped the versions since
+the watermark, or after the embeddings deployment changed, indexes the whole
+catalog with product_ingestion.
+
+    python product_delta_sync.py --enable-change-tracking   # once
+    python product_delta_sync.py                            # one sync, e.g. from cron
+    python product_delta_sync.py --every 300                # or keep syncing every 5 minutes
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+# product_ingestion puts the promptflow folder on the path
+from product_ingestion import (INGEST_UPLOAD_CHUNK, KEY_FIELD, VECTOR_FIELDS, buffered_sender, embed_texts,
+                               ingest_products, load_products)
+from embedding_cache import normalize_text
+from sql_executor import execute_sql, get_pool
+from sql_query_store import (product_change_tables, query_change_tracking_version, query_product_catalog_byID,
+                             query_product_changes, query_product_min_valid_versions, statements_enable_change_tracking)
+
+DELTA_SYNC_DIR = os.environ.get("DELTA_SYNC_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".delta_sync"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watermark (
+    index_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    deployment TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    index_name TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    hashes TEXT NOT NULL,
+    PRIMARY KEY (index_name, product_id)
+);
+"""
+
+
+def text_hashes(doc: dict) -> dict:
+    """sha256 of the normalized text behind each vector field of `doc`."""
+    return {field: hashlib.sha256(normalize_text(doc[source].strip()).encode("utf-8")).hexdigest()
+            for field, source in VECTOR_FIELDS.items()}
+
+
+class SyncState:
+    """Watermark and text hashes of the documents of each index, in `state.db` under `path`."""
+
+    def __init__(self, path: str = DELTA_SYNC_DIR):
+        os.makedirs(path, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(path, "state.db"), check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def watermark(self, index_name: str):
+        """(version, deployment) of the last sync of `index_name`, or None."""
+        with self._lock:
+            return self._db.execute("SELECT version, deployment FROM watermark WHERE index_name = ?",
+                                    (index_name,)).fetchone()
+
+    def hashes(self, index_name: str, product_ids: list) -> dict:
+        with self._lock:
+            rows = self._db.execute("SELECT product_id, hashes FROM documents WHERE index_name = ? "
+                                    "AND product_id IN (SELECT value FROM json_each(?))",
+                                    (index_name, json.dumps(product_ids))).fetchall()
+        return {product_id: json.loads(hashes) for product_id, hashes in rows}
+
+    def product_ids(self, index_name: str) -> set:
+        with self._lock:
+            rows = self._db.execute("SELECT product_id FROM documents WHERE index_name = ?", (index_name,)).fetchall()
+        return {product_id for product_id, in rows}
+
+    def commit(self, index_name: str, version: int, deployment: str, hashes: dict, deleted: list = (),
+               replace: bool = False):
+        """Save the hashes of the indexed documents and the new watermark in one transaction."""
+        with self._lock, self._db:
+            if replace:
+                self._db.execute("DELETE FROM documents WHERE index_name = ?", (index_name,))
+            self._db.executemany("DELETE FROM documents WHERE index_name = ? AND product_id = ?",
+                                 [(index_name, product_id) for product_id in deleted])
+            self._db.executemany("INSERT OR REPLACE INTO documents VALUES (?, ?, ?)",
+                                 [(index_name, product_id, json.dumps(h)) for product_id, h in hashes.items()])
+            self._db.execute("INSERT OR REPLACE INTO watermark VALUES (?, ?, ?, ?)",
+                             (index_name, version, deployment, time.time()))
+
+    def close(self):
+        self._db.close()
+
+
+def enable_change_tracking(conn_db: dict):
+    """Turn on change tracking for the database and the product tables, like the integrated vectorization sample."""
+    with get_pool(conn_db['CONNECTION-STRING']).connection() as conn:
+        cursor = conn.cursor()
+        for statement in statements_enable_change_tracking:
+            try:
+                cursor.execute(statement)
+            except Exception as e:
+                # already enabled
+                print(e)
+        cursor.close()
+
+
+def _min_valid_version(conn_db: dict) -> int:
+    versions = execute_sql(query_product_min_valid_versions, conn_db)[0]
+    disabled = [table for table in product_change_tables if versions[table] is None]
+    if disabled:
+        raise RuntimeError(f"Change tracking is not enabled on {', '.join(disabled)}, "
+                           "run product_delta_sync.py --enable-change-tracking")
+    return max(versions.values())
+
+
+def _upload(conn: dict, upserts: list, deletes: list, upload_chunk: int = INGEST_UPLOAD_CHUNK) -> int:
+    """Merge `upserts` into the index and delete `deletes`, return the number of failed actions."""
+    failures = []
+    sender = buffered_sender(conn, upload_chunk, on_error=failures.append)
+    try:
+        # queued a chunk at a time, see product_ingestion
+        for offset in range(0, len(upserts), upload_chunk):
+            sender.merge_or_upload_documents(upserts[offset:offset + upload_chunk])
+        for offset in range(0, len(deletes), upload_chunk):
+            sender.delete_documents([{KEY_FIELD: product_id} for product_id in deletes[offset:offset + upload_chunk]])
+    finally:
+        sender.close()
+    return len(failures)
+
+
+def full_sync(conn: dict, conn_db: dict, state: SyncState, version: int, **kwargs) -> dict:
+    """Index the whole catalog and delete the documents of products that are gone."""
+    index_name = conn['AZURE_SEARCH_INDEX']
+    documents = load_products(conn_db)
+    stats = ingest_products(documents, conn, **kwargs)
+    deleted = sorted(state.product_ids(index_name) - {doc[KEY_FIELD] for doc in documents})
+    stats["failed"] += _upload(conn, [], deleted) if deleted else 0
+    stats.update(mode="full", version=version, deleted=len(deleted))
+    if not stats["failed"]:
+        state.commit(index_name, version, conn['AZURE_OPENAI_API_EMB_DEPLOYMENT'],
+                     {doc[KEY_FIELD]: text_hashes(doc) for doc in documents}, replace=True)
+    return stats
+
+
+def sync(conn: dict, conn_db: dict, state: SyncState = None, full: bool = False, **kwargs) -> dict:
+    """
+    Bring the index of `conn` up to date with the database of `conn_db`. `kwargs`
+    go to the embedding, see product_ingestion. Returns the stats of the run, the
+    watermark only moves when `failed` is 0.
+    """
+    start = time.perf_counter()
+    state = state or SyncState()
+    index_name = conn['AZURE_SEARCH_INDEX']
+    deployment = conn['AZURE_OPENAI_API_EMB_DEPLOYMENT']
+    # read before the changes, so changes made meanwhile are picked up again by the next run
+    version = execute_sql(query_change_tracking_version, conn_db)[0]['version']
+    min_valid_version = _min_valid_version(conn_db)
+    watermark = state.watermark(index_name)
+    if full or watermark is None or watermark[1] != deployment or watermark[0] < min_valid_version:
+        stats = full_sync(conn, conn_db, state, version, **kwargs)
+        stats["seconds"] = time.perf_counter() - start
+        return stats
+
+    stats = {"mode": "delta", "version": version, "changed": 0, "merged": 0, "deleted": 0, "texts_embedded": 0,
+             "texts_unchanged": 0, "failed": 0}
+    if version == watermark[0]:
+        stats["seconds"] = time.perf_counter() - start
+        return stats
+    changed = sorted({row['ProductID'] for row in execute_sql(query_product_changes, conn_db, (watermark[0],) * 4)})
+    rows = execute_sql(query_product_catalog_byID, conn_db, (json.dumps(changed),)) if changed else []
+    documents = {}
+    for doc in rows:
+        doc[KEY_FIELD] = str(doc[KEY_FIELD])
+        documents[doc[KEY_FIELD]] = doc
+    deleted = [product_id for product_id in map(str, changed) if product_id not in documents]
+
+    # only the texts whose hash changed are embedded, merging leaves the other vectors in place
+    previous = state.hashes(index_name, list(documents))
+    hashes = {product_id: text_hashes(doc) for product_id, doc in documents.items()}
+    texts = {}
+    for product_id, doc in documents.items():
+        for field, source in VECTOR_FIELDS.items():
+            if previous.get(product_id, {}).get(field) == hashes[product_id][field]:
+                stats["texts_unchanged"] += 1
+            else:
+                texts.setdefault(hashes[product_id][field], doc[source].strip())
+    vectors = dict(zip(texts, embed_texts(list(texts.values()), conn, **kwargs))) if texts else {}
+    for product_id, doc in documents.items():
+        for field in VECTOR_FIELDS:
+            if hashes[product_id][field] in vectors:
+                doc[field] = vectors[hashes[product_id][field]]
+
+    stats["failed"] = _upload(conn, list(documents.values()), deleted) if documents or deleted else 0
+    stats.update(changed=len(changed), merged=len(documents), deleted=len(deleted), texts_embedded=len(texts))
+    if not stats["failed"]:
+        state.commit(index_name, version, deployment, hashes, deleted)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+if __name__ == "__main__":
+    from dotenv import dotenv_values
+
+    parser = argparse.ArgumentParser(description="Sync the product search index with the changes in the database.")
+    parser.add_argument("--every", type=float, help="keep running, one sync every that many seconds")
+    parser.add_argument("--full", action="store_true", help="reindex the whole catalog")
+    parser.add_argument("--enable-change-tracking", action="store_true",
+                        help="turn on change tracking for the database and the product tables, then exit")
+    args = parser.parse_args()
+
+    config = dotenv_values('../../../../.env')
+    conn = {key: config[key] for key in ['AZURE_OPENAI_API_EMB_BASE', 'AZURE_OPENAI_API_EMB_KEY',
+                                         'AZURE_OPENAI_API_EMB_VERSION', 'AZURE_OPENAI_API_EMB_DEPLOYMENT',
+                                         'AZURE_SEARCH_ENDPOINT', 'AZURE_SEARCH_INDEX']}
+    conn['ACS-SEARCH-KEY'] = config['AZURE_SEARCH_KEY']
+    conn_db = {'CONNECTION-STRING': config['AZURE_SQL_CONNECTION_STRING']}
+    if args.enable_change_tracking:
+        enable_change_tracking(conn_db)
+        sys.exit(0)
+
+    state = SyncState()
+    if args.every is None:
+        stats = sync(conn, conn_db, state, full=args.full)
+        print(json.dumps(stats))
+        sys.exit(1 if stats["failed"] else 0)
+    while True:
+        try:
+            print(json.dumps(sync(conn, conn_db, state, full=args.full)))
+            args.full = False
+        except Exception as e:
+            # the watermark did not move, the next run retries the same changes
+            print(f"sync failed: {e}")
+        time.sleep(args.every)
@@ -0,0 +1,293 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Embeds the product documents of the search index and uploads them.
+
+The distinct texts of the vector fields are embedded once each, the category
+names first, `EMBEDDING_BATCH_SIZE` inputs per request, by a pool of
+`INGEST_WORKERS` threads behind token bucket rate limiters on requests and
+tokens per minute. Requests go through the shared transport of
+`promptflow/http_transport.py`, which retries throttled requests. A document is
+sent to the index as soon as both its vectors are known, through a
+`SearchIndexingBufferedSender` that uploads `INGEST_UPLOAD_CHUNK` documents per
+request, so uploading overlaps embedding.
+
+With a checkpoint folder, embedded vectors and the keys of acknowledged
+documents are appended to it as they come in, and a rerun after a crash only
+embeds and uploads what is missing.
+
+    python product_ingestion.py --checkpoint .ingest_checkpoint
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "promptflow"))
+from context_builder import count_tokens  # noqa: E402
+from embedding_cache import EMBEDDING_BATCH_SIZE, EmbeddingCache, get_client  # noqa: E402
+from sql_executor import execute_sql  # noqa: E402
+from sql_query_store import query_product_catalog  # noqa: E402
+
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "4"))
+# quota of the embeddings deployment, 0 disables the limit
+INGEST_REQUESTS_PER_MIN = float(os.environ.get("INGEST_REQUESTS_PER_MIN", "1440"))
+INGEST_TOKENS_PER_MIN = float(os.environ.get("INGEST_TOKENS_PER_MIN", "240000"))
+# 100 documents with two 1536 dimension vectors stay well below the 16 MB request limit of the
+# service, and the buffered sender matches results to actions in time quadratic in the chunk
+INGEST_UPLOAD_CHUNK = int(os.environ.get("INGEST_UPLOAD_CHUNK", "100"))
+
+KEY_FIELD = "ProductId"
+# vector field: field of the text it embeds, category names first since many products share them
+VECTOR_FIELDS = {"ProductCategoryNameVector": "ProductCategoryName", "DescriptionVector": "Description"}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at `per_minute / 60` tokens per second.
+
+    It holds up to 10 seconds worth of tokens, the window Azure OpenAI checks its
+    rate limits over. `acquire` takes the tokens right away, going into debt if
+    there are not enough, and sleeps until the debt would be paid back, so
+    callers are served in order and a request larger than the bucket still passes.
+    """
+
+    def __init__(self, per_minute: float, burst_s: float = 10.0):
+        self.rate = per_minute / 60.0
+        self.capacity = self.rate * burst_s
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            wait_s = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait_s:
+            time.sleep(wait_s)
+
+
+class Checkpoint:
+    """
+    Progress of an ingestion in `path`: `embeddings.jsonl` holds one {"key", "vector"}
+    line per embedded text and `uploaded.txt` the keys of the documents the index
+    acknowledged. Both are only appended to; a line cut short by a crash is skipped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.vectors = {}
+        self.uploaded = set()
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        for line in self._lines("embeddings.jsonl"):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            self.vectors[entry["key"]] = entry["vector"]
+        self.uploaded.update(line for line in self._lines("uploaded.txt") if line)
+        self._embeddings = open(os.path.join(path, "embeddings.jsonl"), "a", encoding="utf-8")
+        self._keys = open(os.path.join(path, "uploaded.txt"), "a", encoding="utf-8")
+
+    def _lines(self, name: str):
+        file = os.path.join(self.path, name)
+        if not os.path.exists(file):
+            return []
+        with open(file, encoding="utf-8") as f:
+            return [line.rstrip("\n") for line in f]
+
+    def add_vectors(self, vectors: dict):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._embeddings.write(json.dumps({"key": key, "vector": vector}) + "\n")
+            self._embeddings.flush()
+
+    def add_uploaded(self, key: str):
+        with self._lock:
+            self._keys.write(key + "\n")
+            self._keys.flush()
+
+    def close(self):
+        self._embeddings.close()
+        self._keys.close()
+
+
+def load_products(conn_db: dict) -> list:
+    """The product documents, as rows of `query_product_catalog`."""
+    return execute_sql(query_product_catalog, conn_db)
+
+
+def _embed(client, deployment: str, texts: list, requests: TokenBucket, tokens: TokenBucket) -> list:
+    requests.acquire()
+    tokens.acquire(sum(count_tokens(text) for text in texts))
+    response = client.embeddings.create(input=texts, model=deployment)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+def embed_texts(texts: list, conn: dict, workers: int = INGEST_WORKERS, batch_size: int = EMBEDDING_BATCH_SIZE,
+                requests_per_min: float = INGEST_REQUESTS_PER_MIN, tokens_per_min: float = INGEST_TOKENS_PER_MIN) -> list:
+    """Embeddings of `texts` in order, `batch_size` per request on `workers` threads within the rate limits."""
+    client = get_client(conn)
+    deployment = conn['AZURE_OPENAI_API_EMB_DEPLOYMENT']
+    request_bucket, token_bucket = TokenBucket(requests_per_min), TokenBucket(tokens_per_min)
+    batches = [texts[offset:offset + batch_size] for offset in range(0, len(texts), batch_size)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(lambda batch: _embed(client, deployment, batch, request_bucket, token_bucket), batches)
+        return [vector for vectors in results for vector in vectors]
+
+
+def buffered_sender(conn: dict, upload_chunk: int = INGEST_UPLOAD_CHUNK, on_progress=None, on_error=None):
+    """SearchIndexingBufferedSender for the index of `conn`, sending `upload_chunk` actions per request."""
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents import SearchIndexingBufferedSender
+
+    return SearchIndexingBufferedSender(conn['AZURE_SEARCH_ENDPOINT'], conn['AZURE_SEARCH_INDEX'],
+                                        AzureKeyCredential(conn['ACS-SEARCH-KEY']),
+                                        initial_batch_action_count=upload_chunk,
+                                        on_progress=on_progress, on_error=on_error)
+
+
+def _action_key(action) -> str:
+    # IndexAction is a mapping in azure-search-documents 12, it kept the document in additional_properties before
+    return action.get(KEY_FIELD) if hasattr(action, "get") else action.additional_properties[KEY_FIELD]
+
+
+def ingest_products(documents: list, conn: dict, checkpoint_dir: str = None, upload: bool = True,
+                    workers: int = INGEST_WORKERS, batch_size: int = EMBEDDING_BATCH_SIZE,
+                    upload_chunk: int = INGEST_UPLOAD_CHUNK, requests_per_min: float = INGEST_REQUESTS_PER_MIN,
+                    tokens_per_min: float = INGEST_TOKENS_PER_MIN, on_batch=None) -> dict:
+    """
+    Set the vector fields of `documents` in place and, with `upload`, upload them
+    to the index of `conn`, which has the keys of the flow's search connection.
+
+    `on_batch(stats)` is called after each embeddings request. Returns the stats:
+    documents, texts embedded and taken from the checkpoint, embeddings requests,
+    documents uploaded, skipped as already uploaded and failed, and seconds.
+    """
+    start = time.perf_counter()
+    deployment = conn['AZURE_OPENAI_API_EMB_DEPLOYMENT']
+    checkpoint = Checkpoint(checkpoint_dir) if checkpoint_dir else None
+    vectors = dict(checkpoint.vectors) if checkpoint else {}
+    stats = {"documents": len(documents), "texts_embedded": 0, "texts_from_checkpoint": 0, "requests": 0,
+             "uploaded": 0, "skipped": 0, "failed": 0}
+
+    # documents waiting for the vector of each distinct text
+    keys = []
+    waiting = {}
+    texts = {}
+    for field, source in VECTOR_FIELDS.items():
+        for i, doc in enumerate(documents):
+            # the key field of the index is a string
+            doc[KEY_FIELD] = str(doc[KEY_FIELD])
+            text = doc[source].strip()
+            key = EmbeddingCache.key(deployment, text)
+            keys.append((i, field, key))
+            if key not in vectors:
+                waiting.setdefault(key, []).append((i, field))
+                texts.setdefault(key, text)
+    missing = list(texts)
+    stats["texts_from_checkpoint"] = len({key for _, _, key in keys}) - len(missing)
+    remaining = [len(VECTOR_FIELDS)] * len(documents)
+    for i, field, key in keys:
+        if key in vectors:
+            documents[i][field] = vectors[key]
+            remaining[i] -= 1
+
+    done = set(checkpoint.uploaded) if checkpoint and upload else set()
+    failures = []
+
+    def on_progress(action):
+        stats["uploaded"] += 1
+        if checkpoint:
+            checkpoint.add_uploaded(_action_key(action))
+
+    def on_error(action):
+        failures.append(action)
+
+    sender = buffered_sender(conn, upload_chunk, on_progress, on_error) if upload else None
+
+    def send(indices):
+        # the sender uploads everything queued once upload_chunk documents are, so they are queued a chunk at a time
+        if sender is None:
+            return
+        docs = [documents[i] for i in indices if documents[i][KEY_FIELD] not in done]
+        stats["skipped"] += len(indices) - len(docs)
+        for offset in range(0, len(docs), upload_chunk):
+            sender.upload_documents(docs[offset:offset + upload_chunk])
+
+    client = get_client(conn)
+    request_bucket, token_bucket = TokenBucket(requests_per_min), TokenBucket(tokens_per_min)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    pending = {}
+    try:
+        send([i for i, n in enumerate(remaining) if n == 0])
+        for offset in range(0, len(missing), batch_size):
+            batch = missing[offset:offset + batch_size]
+            future = pool.submit(_embed, client, deployment, [texts[key] for key in batch], request_bucket, token_bucket)
+            pending[future] = batch
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                batch = pending.pop(future)
+                embedded = dict(zip(batch, future.result()))
+                if checkpoint:
+                    checkpoint.add_vectors(embedded)
+                stats["requests"] += 1
+                stats["texts_embedded"] += len(batch)
+                completed = []
+                for key, vector in embedded.items():
+                    for i, field in waiting.pop(key):
+                        documents[i][field] = vector
+                        remaining[i] -= 1
+                        if remaining[i] == 0:
+                            completed.append(i)
+                send(completed)
+                if on_batch is not None:
+                    on_batch(stats)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        if checkpoint:
+            # when stopped early, keep what the requests still in flight returned for the rerun
+            for future, batch in pending.items():
+                if not future.cancelled() and future.exception() is None:
+                    checkpoint.add_vectors(dict(zip(batch, future.result())))
+        try:
+            if sender is not None:
+                # uploads the queued documents, also when stopped early, their vectors are checkpointed
+                sender.close()
+        finally:
+            if checkpoint:
+                checkpoint.close()
+    stats["failed"] = len(failures)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+if __name__ == "__main__":
+    from dotenv import dotenv_values
+
+    parser = argparse.ArgumentParser(description="Embed the products of the database and upload them to the search index.")
+    parser.add_argument("--checkpoint", default=".ingest_checkpoint", help="folder of the progress, reruns resume from it")
+    parser.add_argument("--no-upload", action="store_true", help="only embed, e.g. before the index is created")
+    args = parser.parse_args()
+
+    config = dotenv_values('../../../../.env')
+    conn = {key: config[key] for key in ['AZURE_OPENAI_API_EMB_BASE', 'AZURE_OPENAI_API_EMB_KEY',
+                                         'AZURE_OPENAI_API_EMB_VERSION', 'AZURE_OPENAI_API_EMB_DEPLOYMENT',
+                                         'AZURE_SEARCH_ENDPOINT', 'AZURE_SEARCH_INDEX']}
+    conn['ACS-SEARCH-KEY'] = config['AZURE_SEARCH_KEY']
+    products = load_products({'CONNECTION-STRING': config['AZURE_SQL_CONNECTION_STRING']})
+    print(f"Total records to be indexed: {len(products)}")
+    stats = ingest_products(products, conn, checkpoint_dir=args.checkpoint, upload=not args.no_upload)
+    print(json.dumps(stats, indent=2))
@@ -6,6 +6,7 @@ from azure.identity import DefaultAzureCredential, InteractiveBrowserCredential
 # azure version promptflow apis
 from promptflow.client import PFClient
 import json
+import sys
 import yaml
 from azure.core.credentials import TokenCredential
 from dotenv import dotenv_values
@@ -42,6 +43,42 @@ if __name__ == "__main__":
     data_path = "./data/batch_run_data.jsonl"
     # assume you have existing runtime with this name provisioned
     runtime = config["PROMPTFLOW_RUNTIME"]
+    column_mapping = {  # map the url field from the data to the url input of the flow
+        "chat_history": "${data.chat_history}",
+        "question": "${data.question}",
+        "customer": "${data.customer}"
+    }
+
+    # BATCH_RETRIEVAL_SIZE retrieves the customers, orders, products and sales stats of that many
+    # lines at once with bulk queries here, and the run only generates the answers
+    if config.get('BATCH_RETRIEVAL_SIZE'):
+        sys.path.insert(0, "./promptflow")
+        from batch_retrieval import OUTPUT_COLUMNS, retrieve_file
+
+        print("Retrieving in batches of", config['BATCH_RETRIEVAL_SIZE'])
+        conn_db = {'CONNECTION-STRING': config['AZURE_SQL_CONNECTION_STRING']}
+        conn = {key: config[key] for key in ['AZURE_OPENAI_API_EMB_BASE', 'AZURE_OPENAI_API_EMB_VERSION',
+                                             'AZURE_OPENAI_API_EMB_DEPLOYMENT', 'AZURE_OPENAI_API_EMB_KEY',
+                                             'AZURE_SEARCH_API_VERSION', 'AZURE_SEARCH_ENDPOINT', 'AZURE_SEARCH_INDEX']}
+        conn['ACS-SEARCH-KEY'] = config['AZURE_SEARCH_KEY']
+        conn['SEARCH_ENGINE'] = config.get('SEARCH_ENGINE') or 'remote'
+        conn['LOCAL_SEARCH_INDEX_PATH'] = config.get('LOCAL_SEARCH_INDEX_PATH') or 'local_index'
+        retrieved_path = "./data/batch_run_data.retrieved.jsonl"
+        retrieve_file(data_path, retrieved_path, conn, conn_db, batch_size=int(config['BATCH_RETRIEVAL_SIZE']))
+        data_path = retrieved_path
+        column_mapping.update({column: "${data." + column + "}" for column in OUTPUT_COLUMNS.values()})
+
+        with open('./promptflow/flow.dag.batch.sample.yaml') as f:
+            config_flow = yaml.load(f, Loader=yaml.FullLoader)
+        for node in config_flow['nodes']:
+            if node.get('api') == "chat":
+                if 'deployment_name' in node['inputs']:
+                    node['inputs']['deployment_name'] = config['AZURE_OPENAI_API_GPT_DEPLOYMENT']
+                if 'connection' in node:
+                    node['connection'] = config['AZURE_OPENAI_CONNECTION_NAME']
+        flow_path = "./promptflow/flow.dag.batch.yaml"
+        with open(flow_path, 'w') as f:
+            yaml.dump(config_flow, f)
 
     # create a run, stream it until it's finished
     base_run = pf.run(
@@ -49,11 +86,7 @@ if __name__ == "__main__":
         data=data_path,
         runtime=runtime,
         stream=True,
-        column_mapping={  # map the url field from the data to the url input of the flow
-            "chat_history": "${data.chat_history}",
-            "question": "${data.question}",
-            "customer": "${data.customer}"
-        }
+        column_mapping=column_mapping
     )
 
     details = pf.get_details(base_run)
@@ -85,6 +118,11 @@ if __name__ == "__main__":
                 node['inputs']['conn_db'] = config['AZURE_SQL_CONNECTION_NAME']
             if 'conn' in node['inputs']:
                 node['inputs']['conn'] = config['AZURE_SEARCH_CONNECTION_NAME']
+            # groundedness_score calls the model itself, behind the judgment cache
+            if 'connection' in node['inputs']:
+                node['inputs']['connection'] = config['AZURE_OPENAI_CONNECTION_NAME']
+            if 'deployment_name' in node['inputs']:
+                node['inputs']['deployment_name'] = config['AZURE_OPENAI_API_GPT_DEPLOYMENT']
 
     # write the yaml file back
     with open('./evaluation/flow.dag.yaml', 'w') as f:
@@ -0,0 +1,90 @@
+"""
+Aggregation of evaluation metrics, the previous list + np.nanmean version vs.
+evaluation/aggregate_variants_results.py on streaming_metrics.
+
+Rows are shaped like the output of concat_scores, groundedness scores 1-5 with
+some unparsable ones. Reports the best time of `--repeat` runs and, in a
+separate run under tracemalloc, the peak memory allocated by the aggregation
+itself (the input rows excluded), and checks the means agree.
+
+    python benchmark/bench_aggregation.py --rows 10000 1000000
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import inspect
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import standin
+
+sys.path.insert(0, os.path.join(os.path.dirname(standin.FLOW_DIR), "evaluation"))
+from aggregate_variants_results import aggregate_variants_results  # noqa: E402
+
+
+def previous(results):
+    aggregate_results = {}
+    for result in results:
+        for name, value in result.items():
+            if name not in aggregate_results.keys():
+                aggregate_results[name] = []
+            try:
+                float_val = float(value)
+            except Exception:
+                float_val = np.nan
+            aggregate_results[name].append(float_val)
+    for name, value in aggregate_results.items():
+        aggregate_results[name] = np.nanmean(value)
+        if 'pass_rate' in name:
+            aggregate_results[name] = aggregate_results[name] * 100.0
+        aggregate_results[name] = round(aggregate_results[name], 2)
+    return aggregate_results
+
+
+def make_rows(n, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        score = rng.choice([1.0, 1.0, 3.0, 4.0, 5.0, 5.0, 5.0, math.nan])
+        rows.append({'gpt_groundedness': score, 'gpt_groundedness_pass_rate': 1 if score > 3 else 0})
+    return rows
+
+
+def measure(fn, rows, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(rows)
+        seconds.append(time.perf_counter() - start)
+    # tracemalloc slows allocations down, memory is measured apart
+    tracemalloc.start()
+    fn(rows)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, min(seconds), peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 1000000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    streaming = inspect.unwrap(aggregate_variants_results)
+    print(f"{'rows':>9} {'version':<10} {'seconds':>8} {'peak MiB':>9} {'groundedness':>13} {'pass %':>7}")
+    for n in args.rows:
+        rows = make_rows(n)
+        for name, fn in (("previous", previous), ("streaming", streaming)):
+            result, seconds, peak = measure(fn, rows, args.repeat)
+            print(f"{n:>9} {name:<10} {seconds:8.3f} {peak / 2**20:9.1f} {result['gpt_groundedness']:13.2f} "
+                  f"{result['gpt_groundedness_pass_rate']:7.2f}")
+        print(f"{'':>9} p50 {result['gpt_groundedness_p50']}, p90 {result['gpt_groundedness_p90']}, "
+              f"95% CI [{result['gpt_groundedness_ci95_low']}, {result['gpt_groundedness_ci95_high']}]")
@@ -0,0 +1,120 @@
+"""
+Chat turns with and without the answer cache of promptflow/answer_cache.py.
+
+Replays `--turns` questions drawn from batch_run_data.jsonl, each asked by its
+own customer or, one time in five, by another one, and rewritten like users
+repeat a question: other case, no question mark, "please" added, extra spaces.
+flow.dag.sample.yaml answers every turn with the chat node, flow.dag.cached.sample.yaml
+only the misses of the cache. The mock services run with `semantic` embeddings,
+so paraphrases get close vectors and mostly the same products.
+
+Then checks what must never be served from the cache: a cached question asked by
+another customer, and the same question once a retrieved product changed in
+the database and the change tracking poll of query_cache saw it.
+
+    python benchmark/bench_answer_cache.py --turns 100 --chat-ms 500 --threshold 0.95
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import standin
+import sql_executor
+import answer_cache
+import query_cache
+from flow_replay import FlowReplay
+from mock_services import MockServices
+from run_suite import DEMO_DIR, database_for, load_questions, percentile
+
+REWRITES = (
+    lambda q: q,
+    lambda q: q.lower(),
+    lambda q: q.rstrip("?"),
+    lambda q: f"Please, {q[0].lower()}{q[1:]}",
+    lambda q: q.replace(" ", "  "),
+)
+
+
+def production_stream(questions: list, turns: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    customers = [question["customer"] for question in questions]
+    stream = []
+    for _ in range(turns):
+        question = rng.choice(questions)
+        customer = question["customer"] if rng.random() < 0.8 else rng.choice(customers)
+        stream.append({"question": rng.choice(REWRITES)(question["question"]), "customer": customer,
+                       "chat_history": []})
+    return stream
+
+
+def outcome(replay: FlowReplay, turn: dict) -> str:
+    """'hit' or 'miss' of the answer cache for `turn`."""
+    hits = answer_cache.get_cache().stats()["hits"]
+    replay.run(turn)
+    return "hit" if answer_cache.get_cache().stats()["hits"] > hits else "miss"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--chat-ms", type=float, default=500.0, help="latency of mock chat completions")
+    parser.add_argument("--http-ms", type=float, default=20.0, help="mock embeddings/search latency")
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="simulated SQL round trip")
+    parser.add_argument("--threshold", type=float, default=answer_cache.ANSWER_CACHE_THRESHOLD)
+    args = parser.parse_args()
+
+    questions = load_questions(os.path.join(DEMO_DIR, "data", "batch_run_data.jsonl"))
+    # a copy, the product update below must not leak into the database other benchmarks reuse
+    db_path = os.path.join(tempfile.mkdtemp(), "adventureworks.db")
+    shutil.copy(database_for(1.0, sorted({q["customer"] for q in questions})), db_path)
+    standin.enable_change_tracking(db_path)
+    conn_db = {'CONNECTION-STRING': f"sqlite:{db_path}"}
+    sql_executor.get_pool(conn_db['CONNECTION-STRING'], connect=standin.make_connect(db_path, rtt=args.rtt_ms / 1000))
+    services = MockServices(latency=args.http_ms / 1000, chat_latency=args.chat_ms / 1000, semantic=True).start()
+    connections = {'conn_db': conn_db, 'conn': services.search_connection()}
+    answer_cache.get_cache().threshold = args.threshold
+    stream = production_stream(questions, args.turns)
+
+    print(f"{args.turns} turns, chat {args.chat_ms:g} ms, similarity threshold {args.threshold:g}")
+    print(f"{'flow':<30} {'chat calls':>10} {'hit rate':>9} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for flow in ("flow.dag.sample.yaml", "flow.dag.cached.sample.yaml"):
+        replay = FlowReplay(os.path.join(standin.FLOW_DIR, flow), connections, services.chat_connection())
+        answer_cache.get_cache().clear()
+        before = answer_cache.get_cache().stats()
+        services.requests.clear()
+        latencies = []
+        for turn in stream:
+            start = time.perf_counter()
+            replay.run(turn)
+            latencies.append(time.perf_counter() - start)
+        stats = answer_cache.get_cache().stats()
+        lookups = stats["hits"] + stats["misses"] - before["hits"] - before["misses"]
+        hit_rate = (stats["hits"] - before["hits"]) / lookups if lookups else 0.0
+        calls = sum(n for path, n in services.requests.items() if path.endswith("/chat/completions"))
+        print(f"{flow:<30} {calls:>10} {hit_rate:9.0%} {statistics.mean(latencies) * 1000:9.1f} "
+              f"{percentile(latencies, 50) * 1000:8.1f} {percentile(latencies, 95) * 1000:8.1f}")
+    print(f"near misses (same data, similarity below the threshold): {stats['near_misses']}")
+
+    turn = dict(stream[0], customer=questions[0]["customer"])
+    other = next(q["customer"] for q in questions if q["customer"] != turn["customer"])
+    outcome(replay, turn)
+    print(f"\nsame question, same customer and data: {outcome(replay, turn)}")
+    print(f"same question, another customer:       {outcome(replay, dict(turn, customer=other))}")
+    outputs, _ = replay.run(turn)
+    product = outputs["retrieved_documents"]["Retrieved relevant products"][0]["Name"]
+    with sqlite3.connect(db_path) as db:
+        db.execute("UPDATE Product SET ListPrice = ListPrice + 1 WHERE Name = ?", (product,))
+    # the next poll of CHANGE_TRACKING_CURRENT_VERSION() sees the update
+    time.sleep(query_cache.get_cache().poll_interval)
+    print(f"same question after a price change:    {outcome(replay, turn)}")
+    print(f"and once more:                         {outcome(replay, turn)}")
+    services.stop()
@@ -0,0 +1,94 @@
+"""
+Retrieval of a batch run, the per-line nodes vs. promptflow/batch_retrieval.py.
+
+`--lines` input lines are made from the batch run file, each question suffixed
+with its line number so they are all distinct. The per-line path calls
+get_customer, get_orders, get_product and get_sales_stat for each line like a
+batch run of flow.dag.sample.yaml does; the batch path retrieves `--batch-size`
+lines at a time. Reports the time, SQL statements and embedding and search
+requests of both, and checks that every line got the same results.
+
+    python benchmark/bench_batch_retrieval.py --lines 1000 --batch-size 500 --http-ms 30
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import os
+import time
+
+import standin
+from mock_services import MockServices
+from run_suite import DEMO_DIR, database_for, load_questions
+import batch_retrieval
+import customer_index
+import embedding_cache
+import query_cache
+import sql_executor
+from sql_query_store import sql_query_prep
+from get_customer import get_customer
+from get_pastorders import get_orders
+from get_product import get_product
+from get_product_stats import get_sales_stat
+
+
+def per_line(lines, conn, conn_db, top_k):
+    queries = sql_query_prep()
+    results = []
+    for line in lines:
+        customer = get_customer(line["customer"], conn_db)
+        products = get_product(line["question"], queries, conn, conn_db, top_k)
+        results.append({'customer': customer, 'orders': get_orders(customer, queries, conn_db),
+                        'products': products, 'sales_stat': get_sales_stat(products, queries, conn_db)})
+    return results
+
+
+def batched(lines, conn, conn_db, top_k, batch_size):
+    results = []
+    for start in range(0, len(lines), batch_size):
+        results += batch_retrieval.retrieve_batch(lines[start:start + batch_size], conn, conn_db, top_k)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--data", default="data/batch_run_data.jsonl")
+    parser.add_argument("--http-ms", type=float, default=30.0, help="mock search/embedding latency")
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="simulated SQL round trip")
+    args = parser.parse_args()
+
+    questions = load_questions(os.path.join(DEMO_DIR, args.data))
+    lines = [{"customer": q["customer"], "question": f"{q['question']} ({i})"}
+             for i, q in ((i, questions[i % len(questions)]) for i in range(args.lines))]
+    db_path = database_for(args.scale, sorted({q["customer"] for q in questions}))
+    conn_db = {'CONNECTION-STRING': f"sqlite:{db_path}"}
+    connect = standin.make_connect(db_path, rtt=args.rtt_ms / 1000)
+    sql_executor.get_pool(conn_db['CONNECTION-STRING'], connect=connect)
+    services = MockServices(latency=args.http_ms / 1000, n_products=max(10, int(300 * args.scale))).start()
+    conn = services.search_connection()
+    customer_index.get_index(conn_db)
+
+    print(f"{'mode':<10} {'lines':>6} {'seconds':>8} {'lines/s':>8} {'SQL':>6} {'embed':>6} {'search':>7}")
+    results = {}
+    for mode, run in (("per-line", lambda: per_line(lines, conn, conn_db, args.top_k)),
+                      ("batch", lambda: batched(lines, conn, conn_db, args.top_k, args.batch_size))):
+        query_cache.get_cache().clear()
+        embedding_cache.get_cache()._lru.clear()
+        services.requests.clear()
+        executions = connect.plan_cache.executions
+        start = time.perf_counter()
+        results[mode] = run()
+        seconds = time.perf_counter() - start
+        embed = sum(n for path, n in services.requests.items() if path.endswith("/embeddings"))
+        search = sum(n for path, n in services.requests.items() if "/docs/search" in path)
+        print(f"{mode:<10} {len(lines):>6} {seconds:8.2f} {len(lines) / seconds:8.1f} "
+              f"{connect.plan_cache.executions - executions:>6} {embed:>6} {search:>7}")
+    services.stop()
+
+    mismatches = sum(a != b for a, b in zip(results["per-line"], results["batch"]))
+    print(f"lines with different results: {mismatches}")
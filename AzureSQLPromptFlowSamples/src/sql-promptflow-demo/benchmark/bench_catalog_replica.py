@@ -0,0 +1,95 @@
+"""
+Product details and sales stats, a query per turn vs. promptflow/catalog_replica.py.
+
+Draws `--lookups` id lists like get_product and get_sales_stat send them: the
+`--top-k` product ids of a search result, with now and then an id the database
+does not have, and the categories of those products. Each list is answered with
+`query_prod_byID` and `query_sales_stat` on the SQLite stand-in and by the
+replica; the results must be the same records (the products in any order, the
+node sorts them by search rank) and the sales stats in the same order. Reports
+the load time of the replica and the latency per lookup.
+
+    python benchmark/bench_catalog_replica.py --scale 20 --rtt-ms 2 --lookups 500
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+
+import standin
+from run_suite import DEMO_DIR, database_for, load_questions, percentile
+import catalog_replica
+import sql_executor
+from sql_query_store import query_prod_byID, query_sales_stat
+
+
+def id_lists(product_ids: list, categories: dict, lookups: int, top_k: int, seed: int = 0) -> list:
+    """(product ids, category ids) pairs; ids are strings like the search index returns them."""
+    rng = random.Random(seed)
+    lists = []
+    for _ in range(lookups):
+        ids = rng.sample(product_ids, min(top_k, len(product_ids)))
+        if rng.random() < 0.2:
+            ids[-1] = max(product_ids) + 1
+        lists.append(([str(i) for i in ids], [categories.get(i) for i in ids]))
+    return lists
+
+
+def timed(fn, *args) -> tuple:
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def by_id(records: list) -> list:
+    return sorted(records, key=lambda record: record['ProductID'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--data", default="data/batch_run_data.jsonl")
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="simulated SQL round trip")
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    names = sorted({question["customer"] for question in load_questions(os.path.join(DEMO_DIR, args.data))})
+    db_path = database_for(args.scale, names)
+    conn_db = {'CONNECTION-STRING': f"sqlite:{db_path}"}
+    sql_executor.get_pool(conn_db['CONNECTION-STRING'], connect=standin.make_connect(db_path, rtt=args.rtt_ms / 1000))
+
+    start = time.perf_counter()
+    replica = catalog_replica.get_replica(conn_db)
+    print(f"replica of {replica.size} products and the top sellers of {len(replica.categories)} categories "
+          f"loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    products = sql_executor.execute_sql("SELECT ProductID, ProductCategoryID FROM SalesLT.Product", conn_db)
+    lists = id_lists([p['ProductID'] for p in products], {p['ProductID']: p['ProductCategoryID'] for p in products},
+                     args.lookups, args.top_k)
+
+    lookups = {
+        "products": (lambda ids: sql_executor.execute_sql(query_prod_byID, conn_db, (json.dumps(ids),)),
+                     lambda ids: catalog_replica.lookup(query_prod_byID, ids, conn_db), by_id),
+        "sales stats": (lambda ids: sql_executor.execute_sql(query_sales_stat, conn_db, (json.dumps(ids),)),
+                        lambda ids: catalog_replica.lookup(query_sales_stat, ids, conn_db), list),
+    }
+    print(f"{args.lookups} lookups of {args.top_k} ids, SQL round trip {args.rtt_ms:g} ms")
+    print(f"{'lookup':<12} {'source':<8} {'p50 us':>10} {'p95 us':>10} {'rows':>8} {'mismatches':>11}")
+    for i, (name, (sql_lookup, replica_lookup, canonical)) in enumerate(lookups.items()):
+        sql_times, replica_times, rows, mismatches = [], [], 0, 0
+        for ids in lists:
+            expected, sql_time = timed(sql_lookup, ids[i])
+            actual, replica_time = timed(replica_lookup, ids[i])
+            sql_times.append(sql_time)
+            replica_times.append(replica_time)
+            rows += len(actual)
+            mismatches += canonical(expected) != canonical(actual)
+        for source, times in (("sql", sql_times), ("replica", replica_times)):
+            print(f"{name:<12} {source:<8} {percentile(times, 50) * 1e6:10.1f} {percentile(times, 95) * 1e6:10.1f} "
+                  f"{rows:>8} {mismatches if source == 'replica' else '':>11}")
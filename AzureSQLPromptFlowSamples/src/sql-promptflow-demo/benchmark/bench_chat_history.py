@@ -0,0 +1,87 @@
+"""
+Prompt tokens per turn of a long conversation, the whole chat history in the
+prompt vs. promptflow/chat_history.py.
+
+One customer asks `--turns` questions in a row, drawn from batch_run_data.jsonl,
+each turn sending the chat history of the turns before like a chat client does.
+The mock chat completions answer with `--answer-tokens` tokens. The conversation
+is replayed through `--flow`, a flow without the answer cache, with
+CHAT_HISTORY_COMPACTION and CHAT_SESSION_MEMO off, then on, and the tokens of
+the messages sent to the chat deployment are counted with the tokenizer of
+context_builder.py. Also reports the time spent in get_customer, memoized for
+the conversation, and get_past_orders.
+
+    python benchmark/bench_chat_history.py --turns 30 --answer-tokens 150 --rtt-ms 2
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import os
+import statistics
+
+import standin
+import chat_history
+import context_builder
+import query_cache
+import sql_executor
+from flow_replay import FlowReplay
+from mock_services import MockServices
+from run_suite import DEMO_DIR, database_for, load_questions
+
+RETRIEVAL = ("get_customer", "get_past_orders")
+
+
+def replay_conversation(replay: FlowReplay, services: MockServices, customer: str, questions: list) -> list:
+    """(prompt tokens, retrieval seconds) of each turn of the conversation."""
+    history, turns = [], []
+    for question in questions:
+        outputs, timings = replay.run({"question": question, "customer": customer, "chat_history": history})
+        tokens = sum(context_builder.count_tokens(message["content"]) for message in services.last_messages)
+        turns.append((tokens, sum(timings.get(node, 0.0) for node in RETRIEVAL)))
+        history = history + [{"inputs": {"question": question}, "outputs": {"answer": outputs["answer"]}}]
+    return turns
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flow", default="flow.dag.sample.yaml")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--answer-tokens", type=int, default=150, help="length of the mock chat answers")
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="simulated SQL round trip")
+    parser.add_argument("--scale", type=float, default=1.0)
+    args = parser.parse_args()
+
+    questions = load_questions(os.path.join(DEMO_DIR, "data", "batch_run_data.jsonl"))
+    customer = questions[0]["customer"]
+    conversation = [questions[i % len(questions)]["question"] for i in range(args.turns)]
+    db_path = database_for(args.scale, sorted({q["customer"] for q in questions}))
+    conn_db = {'CONNECTION-STRING': f"sqlite:{db_path}"}
+    sql_executor.get_pool(conn_db['CONNECTION-STRING'], connect=standin.make_connect(db_path, rtt=args.rtt_ms / 1000))
+    services = MockServices(completion_tokens=args.answer_tokens).start()
+    replay = FlowReplay(os.path.join(standin.FLOW_DIR, args.flow), {'conn_db': conn_db, 'conn': services.search_connection()},
+                        services.chat_connection())
+
+    results = {}
+    for mode in ("before", "after"):
+        chat_history.CHAT_HISTORY_COMPACTION = chat_history.CHAT_SESSION_MEMO = mode == "after"
+        chat_history.get_sessions().clear()
+        query_cache.get_cache().clear()
+        results[mode] = replay_conversation(replay, services, customer, conversation)
+    services.stop()
+
+    tokenizer = "tiktoken " + context_builder.CONTEXT_TOKENIZER if context_builder._get_encoder() else "estimate"
+    print(f"{args.flow}, {args.turns} turns of {customer}, answers of {args.answer_tokens} tokens, "
+          f"last {chat_history.CHAT_HISTORY_TURNS} turns verbatim, summary budget "
+          f"{chat_history.CHAT_HISTORY_SUMMARY_TOKENS} tokens, token counts: {tokenizer}")
+    print(f"{'turn':>5} {'prompt tokens before':>21} {'after':>8} {'saved %':>8}")
+    for turn in range(args.turns):
+        before, after = results["before"][turn][0], results["after"][turn][0]
+        print(f"{turn + 1:>5} {before:>21} {after:>8} {(before - after) / before:8.1%}")
+    for mode in ("before", "after"):
+        tokens = [t for t, _ in results[mode]]
+        retrieval = [s for _, s in results[mode]]
+        print(f"{mode:<7} prompt tokens mean {statistics.mean(tokens):7.0f}, total {sum(tokens):7d}; "
+              f"customer and orders retrieval mean {statistics.mean(retrieval) * 1000:6.2f} ms per turn")
+    print(f"chat history: {chat_history.get_sessions().stats()}")
@@ -0,0 +1,108 @@
+"""
+Cold start of a serving instance: import time of the flow nodes and latency of
+the first chat turns, without and with the warm-up of promptflow/warmup.py.
+
+Every run is a fresh python process. It imports promptflow, then the python
+nodes of the flow (reporting which of numpy, pandas, sqlalchemy, pyodbc the
+nodes pulled in), then replays turns against the SQLite stand-in with a
+`--connect-ms` login cost and the mock services, whose new connections wait
+`--handshake-ms` like a TLS handshake. With `--warm` the process runs
+warmup.warm_up first, as a deployment does before /ready answers 200.
+
+    python benchmark/bench_cold_start.py --runs 3 --connect-ms 150 --handshake-ms 60
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FLOW_DIR = os.path.join(BENCH_DIR, "..", "promptflow")
+HEAVY = ("numpy", "pandas", "sqlalchemy", "pyodbc")
+
+
+def child(args):
+    start = time.perf_counter()
+    import promptflow.core  # noqa: F401
+    import promptflow.connections  # noqa: F401
+    result = {"import_promptflow": time.perf_counter() - start}
+
+    import yaml
+    with open(os.path.join(FLOW_DIR, args.flow)) as f:
+        modules = [os.path.splitext(node['source']['path'])[0] for node in yaml.safe_load(f)['nodes']
+                   if node['type'] == 'python']
+    sys.path.insert(0, FLOW_DIR)
+    loaded = set(sys.modules)
+    start = time.perf_counter()
+    for module in modules:
+        __import__(module)
+    result["import_nodes"] = time.perf_counter() - start
+    result["heavy"] = sorted(m for m in HEAVY if m in sys.modules and m not in loaded)
+
+    import standin
+    import sql_executor
+    import warmup
+    from flow_replay import FlowReplay
+    from mock_services import MockServices
+    from run_suite import database_for, load_questions
+
+    questions = load_questions(os.path.join(BENCH_DIR, "..", "data", "batch_run_data.jsonl"))
+    db_path = database_for(args.scale, sorted({q["customer"] for q in questions}))
+    conn_db = {'CONNECTION-STRING': f"sqlite:{db_path}"}
+    sql_executor.get_pool(conn_db['CONNECTION-STRING'],
+                          connect=standin.make_connect(db_path, connect_latency=args.connect_ms / 1000,
+                                                       rtt=args.rtt_ms / 1000))
+    services = MockServices(latency=args.http_ms / 1000, handshake=args.handshake_ms / 1000).start()
+    connections = {'conn_db': conn_db, 'conn': services.search_connection()}
+    replay = FlowReplay(os.path.join(FLOW_DIR, args.flow), connections, services.chat_connection())
+
+    result["warm_up"] = 0.0
+    if args.warm:
+        start = time.perf_counter()
+        outcome = warmup.warm_up(connections)
+        result["warm_up"] = time.perf_counter() - start
+        if outcome["errors"]:
+            raise RuntimeError(outcome["errors"])
+    for i in range(2):
+        start = time.perf_counter()
+        replay.run(questions[i % len(questions)])
+        result[f"turn_{i + 1}"] = time.perf_counter() - start
+    services.stop()
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--flow", default="flow.dag.sample.yaml")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--connect-ms", type=float, default=150.0, help="simulated SQL login")
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="simulated SQL round trip")
+    parser.add_argument("--http-ms", type=float, default=20.0, help="mock embeddings/search/chat latency")
+    parser.add_argument("--handshake-ms", type=float, default=60.0, help="simulated TLS handshake per connection")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warm", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        sys.exit(0)
+
+    passed = ["--flow", args.flow, "--scale", str(args.scale), "--connect-ms", str(args.connect_ms),
+              "--rtt-ms", str(args.rtt_ms), "--http-ms", str(args.http_ms), "--handshake-ms", str(args.handshake_ms)]
+    columns = ("import_promptflow", "import_nodes", "warm_up", "turn_1", "turn_2")
+    print(f"{'':<8}" + "".join(f"{c:>18}" for c in columns) + "  (median ms)")
+    for mode in ("cold", "warm"):
+        runs = []
+        for _ in range(args.runs):
+            command = [sys.executable, os.path.abspath(__file__), "--child"] + passed + (["--warm"] if mode == "warm" else [])
+            output = subprocess.run(command, capture_output=True, text=True, check=True, cwd=BENCH_DIR).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        print(f"{mode:<8}" + "".join(f"{statistics.median(r[c] for r in runs) * 1000:18.1f}" for c in columns))
+    print(f"heavy modules imported by the nodes: {runs[-1]['heavy'] or 'none'}")
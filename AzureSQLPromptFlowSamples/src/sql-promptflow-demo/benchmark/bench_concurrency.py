@@ -0,0 +1,113 @@
+"""
+Throughput of the sync retrieval nodes vs. their async variants at increasing concurrency.
+
+A request runs the retrieval part of a chat turn: get_customer, then get_orders
+and get_product, then get_sales_stat, against the SQLite stand-in and the mock
+search and embedding services. The sync nodes are served by `--sync-workers`
+threads, as a synchronous worker would; the async nodes by one event loop.
+
+    python benchmark/bench_concurrency.py --concurrency 1 8 32 128 --requests 256
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import standin
+from mock_services import MockServices
+import embedding_cache
+import query_cache
+import sql_executor
+from sql_query_store import sql_query_prep
+from get_customer import get_customer
+from get_pastorders import get_orders
+from get_product import get_product
+from get_product_stats import get_sales_stat
+import get_customer_async
+import get_pastorders_async
+import get_product_async
+import get_product_stats_async
+
+CUSTOMERS = [f"{first} {last}" for first in standin.FIRST_NAMES for last in standin.LAST_NAMES]
+
+
+def sync_request(i, conn, conn_db, queries):
+    start = time.perf_counter()
+    customer = get_customer(CUSTOMERS[i % len(CUSTOMERS)], conn_db)
+    get_orders(customer, queries, conn_db)
+    products = get_product(f"question {i}", queries, conn, conn_db, 5)
+    get_sales_stat(products, queries, conn_db)
+    return time.perf_counter() - start
+
+
+async def async_request(i, conn, conn_db, queries):
+    start = time.perf_counter()
+    customer = await get_customer_async.get_customer(CUSTOMERS[i % len(CUSTOMERS)], conn_db)
+    _, products = await asyncio.gather(
+        get_pastorders_async.get_orders(customer, queries, conn_db),
+        get_product_async.get_product(f"question {i}", queries, conn, conn_db, 5))
+    await get_product_stats_async.get_sales_stat(products, queries, conn_db)
+    return time.perf_counter() - start
+
+
+def run_sync(concurrency, requests, workers, offset, *args):
+    with ThreadPoolExecutor(max_workers=min(workers, concurrency)) as pool:
+        start = time.perf_counter()
+        latencies = list(pool.map(lambda i: sync_request(offset + i, *args), range(requests)))
+    return time.perf_counter() - start, latencies
+
+
+def run_async(concurrency, requests, offset, *args):
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            async with semaphore:
+                return await async_request(offset + i, *args)
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one(i) for i in range(requests)))
+        return time.perf_counter() - start, latencies
+    return asyncio.run(main())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--sync-workers", type=int, default=1)
+    parser.add_argument("--http-ms", type=float, default=50.0, help="mock search/embedding latency")
+    parser.add_argument("--rtt-ms", type=float, default=10.0, help="simulated SQL round trip")
+    args = parser.parse_args()
+
+    # measure the network paths, not the caches
+    query_cache.SQL_RESULT_CACHE = False
+    embedding_cache.get_cache().max_size = 0
+
+    services = MockServices(latency=args.http_ms / 1000).start()
+    conn = services.search_connection()
+    db_path = standin.build_database(os.path.join(tempfile.gettempdir(), "adventureworks_1.0.db"))
+    conn_db = {'CONNECTION-STRING': f"sqlite:{db_path}"}
+    sql_executor.get_pool(conn_db['CONNECTION-STRING'], connect=standin.make_connect(db_path, rtt=args.rtt_ms / 1000))
+    queries = sql_query_prep()
+
+    print(f"{'mode':<6} {'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    offset = 0
+    for concurrency in args.concurrency:
+        for mode in ("sync", "async"):
+            offset += args.requests
+            if mode == "sync":
+                elapsed, latencies = run_sync(concurrency, args.requests, args.sync_workers, offset, conn, conn_db, queries)
+            else:
+                elapsed, latencies = run_async(concurrency, args.requests, offset, conn, conn_db, queries)
+            latencies = sorted(latencies)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            print(f"{mode:<6} {concurrency:>5} {args.requests / elapsed:>8.1f} "
+                  f"{statistics.median(latencies) * 1000:>8.1f} {p95 * 1000:>8.1f}")
+    services.stop()
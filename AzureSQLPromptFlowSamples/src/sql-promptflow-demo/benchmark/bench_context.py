@@ -0,0 +1,67 @@
+"""
+Prompt tokens of the retrieved context before and after promptflow/context_builder.py.
+
+Replays the batch run questions through the retrieval nodes against the SQLite
+stand-in and the mock services, then builds the context at each token budget
+and reports tokens per turn, tokens saved and build time.
+
+    python benchmark/bench_context.py --budgets 0 3000 1500 --top-k 5
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+import standin
+from mock_services import MockServices
+from run_suite import DEMO_DIR, database_for, load_questions
+import context_builder
+import sql_executor
+from sql_query_store import sql_query_prep
+from get_customer import get_customer
+from get_pastorders import get_orders
+from get_product import get_product
+from get_product_stats import get_sales_stat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budgets", type=int, nargs="+", default=[0, 3000, 1500])
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--data", default="data/batch_run_data.jsonl")
+    args = parser.parse_args()
+
+    questions = load_questions(os.path.join(DEMO_DIR, args.data))
+    db_path = database_for(args.scale, sorted({q["customer"] for q in questions}))
+    conn_db = {'CONNECTION-STRING': f"sqlite:{db_path}"}
+    sql_executor.get_pool(conn_db['CONNECTION-STRING'], connect=standin.make_connect(db_path))
+    services = MockServices(n_products=max(10, int(300 * args.scale))).start()
+    conn = services.search_connection()
+    queries = sql_query_prep()
+
+    retrieved = []
+    for question in questions:
+        customer = get_customer(question["customer"], conn_db)
+        products = get_product(question["question"], queries, conn, conn_db, args.top_k)
+        retrieved.append((get_orders(customer, queries, conn_db), products, get_sales_stat(products, queries, conn_db)))
+    services.stop()
+
+    tokenizer = "tiktoken " + context_builder.CONTEXT_TOKENIZER if context_builder._get_encoder() else "estimate"
+    print(f"token counts: {tokenizer}")
+    print(f"{'budget':>7} {'before':>8} {'after':>8} {'saved':>8} {'saved %':>8} {'dupes':>6} {'cut':>5} {'build ms':>9}")
+    for budget in args.budgets:
+        runs = []
+        for orders, products, sales_stat in retrieved:
+            start = time.perf_counter()
+            _, stats = context_builder.build_context(orders, products, sales_stat, token_budget=budget)
+            runs.append((stats, time.perf_counter() - start))
+        before = statistics.mean(s.tokens_before for s, _ in runs)
+        after = statistics.mean(s.tokens_after for s, _ in runs)
+        print(f"{budget or 'none':>7} {before:8.0f} {after:8.0f} {before - after:8.0f} {(before - after) / before:8.1%} "
+              f"{statistics.mean(s.duplicates for s, _ in runs):6.1f} {statistics.mean(s.truncated for s, _ in runs):5.1f} "
+              f"{statistics.mean(t for _, t in runs) * 1000:9.2f}")
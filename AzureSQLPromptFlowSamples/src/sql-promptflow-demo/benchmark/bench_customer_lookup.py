@@ -0,0 +1,82 @@
+"""
+Customer lookup, the FirstName/LastName query per turn vs. promptflow/customer_index.py.
+
+The customers of the batch run file are added to the SQLite stand-in and looked
+up as written and as typed variants (lower case, an initial, a middle name, a
+typo in the last name). Reports the share of variants that found the customer,
+the share that returned another customer, and the latency per lookup with a
+simulated SQL round trip.
+
+    python benchmark/bench_customer_lookup.py --scale 20 --rtt-ms 2
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import os
+import time
+
+import standin
+from run_suite import DEMO_DIR, database_for, load_questions, percentile
+import customer_index
+import sql_executor
+from sql_query_store import query_customer
+
+
+def variants(name: str) -> dict:
+    first, last = customer_index.split_name(name)
+    typo = last[:2] + last[3] + last[2] + last[4:] if len(last) > 4 else last + last[-1]
+    return {
+        "as written": name,
+        "lower case": name.lower(),
+        "initial": f"{first[0]}. {last}",
+        "middle name": f"{first} J. {last}",
+        "typo": f"{first} {typo}",
+    }
+
+
+def sql_lookup(name: str, conn_db: dict) -> list:
+    return sql_executor.execute_sql(sql_query=query_customer, conn_db=conn_db, params=customer_index.split_name(name))
+
+
+def index_lookup(name: str, conn_db: dict) -> list:
+    return customer_index.find_customer(name, conn_db)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--data", default="data/batch_run_data.jsonl")
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="simulated SQL round trip")
+    args = parser.parse_args()
+
+    names = sorted({question["customer"] for question in load_questions(os.path.join(DEMO_DIR, args.data))})
+    db_path = database_for(args.scale, names)
+    conn_db = {'CONNECTION-STRING': f"sqlite:{db_path}"}
+    sql_executor.get_pool(conn_db['CONNECTION-STRING'], connect=standin.make_connect(db_path, rtt=args.rtt_ms / 1000))
+
+    start = time.perf_counter()
+    index = customer_index.get_index(conn_db)
+    print(f"index of {index.size} customers loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    print(f"{'lookup':<8} {'variant':<12} {'found':>6} {'wrong':>6} {'p50 us':>9} {'p95 us':>9}")
+    for label, lookup in (("sql", sql_lookup), ("index", index_lookup)):
+        for variant in variants(names[0]):
+            found, wrong, latencies = 0, 0, []
+            for name in names:
+                query = variants(name)[variant]
+                start = time.perf_counter()
+                customers = lookup(query, conn_db)
+                latencies.append(time.perf_counter() - start)
+                found += any(f"{c['FirstName']} {c['LastName']}" == name for c in customers)
+                wrong += any(f"{c['FirstName']} {c['LastName']}" != name for c in customers)
+            print(f"{label:<8} {variant:<12} {found / len(names):6.0%} {wrong / len(names):6.0%} "
+                  f"{percentile(latencies, 50) * 1e6:9.1f} {percentile(latencies, 95) * 1e6:9.1f}")
+
+    for variant in ("as written", "typo"):
+        query = variants(names[0])[variant]
+        start = time.perf_counter()
+        for _ in range(1000):
+            index.lookup(query) or index.close_match(query)
+        print(f"index lookup, {variant}: {(time.perf_counter() - start) / 1000 * 1e6:.1f} us")
@@ -0,0 +1,113 @@
+"""
+Refreshing the product search index after catalog changes, a full reindex vs. the
+change-tracked delta sync of acs/product_delta_sync.py.
+
+Change tracking is emulated on the SQLite stand-in with triggers (see
+standin.enable_change_tracking). After the initial full sync, each round changes
+`--changes` products: half get a new price, a third a new description text, the
+rest are deleted or added. The round is then synced incrementally, and the time a
+full reindex of the same catalog takes is reported next to it. At the end the
+index is compared with one built from scratch.
+
+    python benchmark/bench_delta_sync.py --scale 5 --changes 10 100 500
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import standin
+from mock_services import MockServices
+from run_suite import database_for
+import sql_executor
+
+sys.path.insert(0, os.path.join(os.path.dirname(standin.FLOW_DIR), "acs"))
+import product_delta_sync  # noqa: E402
+
+
+def change_catalog(path: str, n: int, rng: random.Random):
+    conn = sqlite3.connect(path)
+    conn.execute("ATTACH DATABASE ? AS SalesLT", (path,))
+    ids = [row[0] for row in conn.execute("SELECT ProductID FROM SalesLT.Product")]
+    models = [row[0] for row in conn.execute("SELECT ProductModelID FROM SalesLT.ProductModel")]
+    picked = rng.sample(ids, min(n, len(ids)))
+    n_price, n_text = len(picked) // 2, len(picked) // 3
+    for product_id in picked[:n_price]:
+        conn.execute("UPDATE SalesLT.Product SET ListPrice = ListPrice * 1.1 WHERE ProductID = ?", (product_id,))
+    for product_id in picked[n_price:n_price + n_text]:
+        # a new English description for the model of the product, shared by the other products of the model
+        conn.execute("UPDATE SalesLT.ProductDescription SET Description = Description || ? WHERE ProductDescriptionID IN ("
+                     "SELECT pmpd.ProductDescriptionID FROM SalesLT.ProductModelProductDescription pmpd "
+                     "INNER JOIN SalesLT.Product p ON p.ProductModelID = pmpd.ProductModelID "
+                     "WHERE p.ProductID = ? AND pmpd.Culture = 'en')", (f" rev{rng.randint(0, 10**6)}", product_id))
+    rest = picked[n_price + n_text:]
+    for product_id in rest[:len(rest) // 2]:
+        conn.execute("DELETE FROM SalesLT.Product WHERE ProductID = ?", (product_id,))
+    next_id = max(ids) + 1
+    for i in range(len(rest) - len(rest) // 2):
+        conn.execute("INSERT INTO SalesLT.Product VALUES (?, ?, ?, 'Black', 10, 20, 'M', NULL, ?, ?)",
+                     (next_id + i, f"New product {next_id + i}", f"PN-{next_id + i:05d}",
+                      rng.randint(1, len(standin.CATEGORIES)), rng.choice(models)))
+    conn.commit()
+    conn.close()
+
+
+def requests(services, suffix):
+    return sum(n for path, n in services.requests.items() if path.endswith(suffix))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=5.0)
+    parser.add_argument("--changes", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--http-ms", type=float, default=50.0, help="mock embeddings/search latency")
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="simulated SQL round trip")
+    parser.add_argument("--batch-size", type=int, default=16, help="inputs per embeddings request")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "adventureworks_ct.db")
+    shutil.copy(database_for(args.scale, []), db_path)
+    standin.enable_change_tracking(db_path)
+    conn_db = {'CONNECTION-STRING': f"sqlite:{db_path}"}
+    sql_executor.get_pool(conn_db['CONNECTION-STRING'], connect=standin.make_connect(db_path, rtt=args.rtt_ms / 1000))
+    services = MockServices(latency=args.http_ms / 1000).start()
+    conn = services.search_connection()
+    state = product_delta_sync.SyncState(tempfile.mkdtemp())
+    rng = random.Random(0)
+
+    def run(**kwargs):
+        services.requests.clear()
+        start = time.perf_counter()
+        stats = product_delta_sync.sync(conn, conn_db, state, batch_size=args.batch_size, **kwargs)
+        return stats, time.perf_counter() - start
+
+    stats, seconds = run()
+    print(f"initial {stats['mode']} sync of {stats['documents']} products: {seconds:.2f} s, "
+          f"{requests(services, '/embeddings')} embeddings requests")
+    print(f"{'changes':>8} {'products':>9} {'embedded':>9} {'embed':>6} {'upload':>7} {'delta s':>8} {'full s':>7}")
+    for n in args.changes:
+        change_catalog(db_path, n, rng)
+        stats, seconds = run()
+        embed, upload = requests(services, "/embeddings"), requests(services, "/docs/search.index")
+        # what refreshing by reindexing everything costs for the same catalog
+        indexed = dict(services.indexed)
+        full_start = time.perf_counter()
+        product_delta_sync.full_sync(conn, conn_db, product_delta_sync.SyncState(tempfile.mkdtemp()),
+                                     stats["version"], batch_size=args.batch_size)
+        full_seconds = time.perf_counter() - full_start
+        print(f"{n:>8} {stats['changed']:>9} {stats['texts_embedded']:>9} {embed:>6} {upload:>7} "
+              f"{seconds:8.2f} {full_seconds:7.2f}")
+        same = indexed == services.indexed
+        print(f"{'':>8} {stats['merged']} merged, {stats['deleted']} deleted, {stats['texts_unchanged']} texts "
+              f"unchanged; index same as a full rebuild: {same}")
+    stats, seconds = run()
+    print(f"no changes: {seconds * 1000:.1f} ms, {stats['changed']} products")
+    services.stop()
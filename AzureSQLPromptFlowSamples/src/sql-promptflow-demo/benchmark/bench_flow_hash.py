@@ -0,0 +1,124 @@
+"""
+Hashing the flow folder before a deployment, the hash_folder deploy_sdk.py had vs.
+flow_manifest.py.
+
+First the hash of a copy of the promptflow folder is checked against what should
+and should not change it: the same files written in another order, byte code and
+promptflow run logs, an added empty file, an edited one. Then a folder of `--files`
+files of `--kib` KiB each is hashed cold, cold on one thread, warm from the
+manifest cache, and warm after editing `--edits` files.
+
+    python benchmark/bench_flow_hash.py --files 2000 --kib 64 --edits 5
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import flow_manifest  # noqa: E402
+
+FLOW_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "promptflow")
+
+
+def hash_folder(folder_path):
+    # deploy_sdk.hash_folder before flow_manifest
+    sha256 = hashlib.sha256()
+    for root, _, files in os.walk(folder_path):
+        for file in files:
+            file_path = os.path.join(root, file)
+            with open(file_path, 'rb') as f:
+                file_content = f.read()
+                sha256.update(file_content)
+    return sha256.hexdigest()
+
+
+def copy_flow(reverse=False):
+    target = tempfile.mkdtemp()
+    files = flow_manifest.list_files(FLOW_DIR, patterns=[])
+    for relpath in (reversed(files) if reverse else files):
+        os.makedirs(os.path.dirname(os.path.join(target, relpath)), exist_ok=True)
+        shutil.copy(os.path.join(FLOW_DIR, relpath), os.path.join(target, relpath))
+    return target
+
+
+def new_hash(folder):
+    return flow_manifest.build_manifest(folder, cache_dir=None)["hash"]
+
+
+def check(name, folder, change, should_change):
+    """Whether `change()` on `folder` changes each hash, as it should or should not."""
+    before = hash_folder(folder), new_hash(folder)
+    target = change()
+    after = hash_folder(target), new_hash(target)
+
+    def verdict(changed):
+        return "ok" if changed == should_change else ("spurious change" if changed else "missed change")
+    print(f"{name:<34} {verdict(before[0] != after[0]):>16} {verdict(before[1] != after[1]):>16}")
+
+
+def write(path, data, mode="wb"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode) as f:
+        f.write(data)
+
+
+def timed(folder, **kwargs):
+    start = time.perf_counter()
+    manifest = flow_manifest.build_manifest(folder, **kwargs)
+    return time.perf_counter() - start, manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--kib", type=int, default=64)
+    parser.add_argument("--edits", type=int, default=5)
+    args = parser.parse_args()
+
+    folder = copy_flow()
+    print(f"{'':<34} {'hash_folder':>16} {'flow_manifest':>16}")
+    check("same files, written reversed", folder, lambda: copy_flow(reverse=True), False)
+
+    def run_artifacts():
+        write(os.path.join(folder, "__pycache__", "sql_executor.cpython-311.pyc"), os.urandom(4096))
+        write(os.path.join(folder, ".promptflow", "flow.log"), "2024-05-10 12:00:00 flow run completed\n", "a")
+        return folder
+    check("byte code and run log written", folder, run_artifacts, False)
+    check("empty __init__.py added", folder, lambda: write(os.path.join(folder, "__init__.py"), b"") or folder, True)
+    check("file edited", folder, lambda: write(os.path.join(folder, "chat.jinja2"), "\n", "a") or folder, True)
+
+    big = tempfile.mkdtemp()
+    for i in range(args.files):
+        sub = os.path.join(big, f"d{i % 20:02d}")
+        os.makedirs(sub, exist_ok=True)
+        with open(os.path.join(sub, f"f{i:05d}.bin"), "wb") as f:
+            f.write(os.urandom(args.kib * 1024))
+    cache_dir = tempfile.mkdtemp()
+    print(f"\n{args.files} files of {args.kib} KiB, {os.cpu_count()} cpus")
+    start = time.perf_counter()
+    hash_folder(big)
+    print(f"{'hash_folder':<34} {time.perf_counter() - start:8.3f} s")
+    seconds, _ = timed(big, cache_dir=None, workers=1)
+    print(f"{'flow_manifest, one thread':<34} {seconds:8.3f} s")
+    seconds, manifest = timed(big, cache_dir=cache_dir)
+    print(f"{'flow_manifest, cold':<34} {seconds:8.3f} s  {manifest['hashed']} files hashed")
+    # files written within the racy window of the first run are hashed again once
+    time.sleep(flow_manifest._RACY_NS / 1e9)
+    timed(big, cache_dir=cache_dir)
+    seconds, manifest = timed(big, cache_dir=cache_dir)
+    print(f"{'flow_manifest, warm':<34} {seconds:8.3f} s  {manifest['hashed']} files hashed")
+    for relpath in flow_manifest.list_files(big)[:args.edits]:
+        with open(os.path.join(big, relpath), "r+b") as f:
+            f.write(os.urandom(16))
+    seconds, manifest = timed(big, cache_dir=cache_dir)
+    print(f"{f'flow_manifest, {args.edits} files edited':<34} {seconds:8.3f} s  {manifest['hashed']} files hashed, "
+          f"{len(manifest['modified'])} reported modified")
+    shutil.rmtree(big)
@@ -0,0 +1,89 @@
+"""
+Search and embedding calls with a fresh client per call vs. the shared transport
+of promptflow/http_transport.py, against the mock services with throttling.
+
+The baseline is what get_product did before: a new AzureOpenAI client and a bare
+requests.post per call, so every call opens new connections and a 429 from the
+search endpoint fails the turn. Reports success rate, latency, connections
+opened and the most requests the mock served at once.
+
+    python benchmark/bench_http_transport.py --calls 200 --threads 32 --throttle 0.1
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from openai import AzureOpenAI
+
+import standin  # noqa: F401  puts promptflow/ on sys.path
+from mock_services import MockServices
+import embedding_cache
+import http_transport
+from get_product import _search_request, search_products
+
+
+def baseline_call(i, conn, top_k=5):
+    client = AzureOpenAI(azure_endpoint=conn['AZURE_OPENAI_API_EMB_BASE'], api_key=conn['AZURE_OPENAI_API_EMB_KEY'],
+                         api_version=conn['AZURE_OPENAI_API_EMB_VERSION'])
+    vector = client.embeddings.create(input=f"question {i}", model=conn['AZURE_OPENAI_API_EMB_DEPLOYMENT']).data[0].embedding
+    url, headers, params, body = _search_request(f"question {i}", vector, conn, top_k)
+    response = requests.post(url, headers=headers, params=params, json=body)
+    return response.json()['value']
+
+
+def transport_call(i, conn, top_k=5):
+    return search_products(f"question {i}", conn, top_k)
+
+
+def run(name, call, conn, calls, threads, services):
+    services.requests.clear()
+    services.max_inflight = 0
+
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            call(i, conn)
+            ok = True
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(timed, range(calls)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for _, latency in results)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:<10} ok {sum(ok for ok, _ in results) / calls:6.1%}  {calls / elapsed:7.1f} calls/s  "
+          f"p50 {statistics.median(latencies) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  "
+          f"connections {services.requests.get('connections', 0):4d}  "
+          f"throttled {services.requests.get('throttled', 0):4d}  max in flight {services.max_inflight}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--throttle", type=float, default=0.1, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.05)
+    args = parser.parse_args()
+
+    # every call embeds a new question, but keep cache hits out of the picture anyway
+    embedding_cache.get_cache().max_size = 0
+    services = MockServices(latency=args.latency_ms / 1000, throttle_rate=args.throttle,
+                            retry_after=args.retry_after).start()
+    conn = services.search_connection()
+
+    run("baseline", baseline_call, conn, args.calls, args.threads, services)
+    run("transport", transport_call, conn, args.calls, args.threads, services)
+    for endpoint, histogram in http_transport.latency_histograms().items():
+        print(f"{endpoint}: {histogram.count} attempts, {histogram.retries} retried, "
+              f"p50 <= {histogram.quantile(0.5) * 1000:g} ms, p99 <= {histogram.quantile(0.99) * 1000:g} ms")
+    services.stop()
@@ -0,0 +1,119 @@
+"""
+Building the product search index, the loop of acs/azure_ai_search_prepare.ipynb
+vs. acs/product_ingestion.py, against the mock embeddings and search endpoints.
+
+The notebook path embeds Description and ProductCategoryName of every product
+with one request each, one product after the other, then uploads all documents
+in one upload_documents call. The pipeline embeds the distinct texts in
+multi-input requests on a worker pool and streams documents to the index as
+they complete. A third pass stops the pipeline halfway and resumes it from its
+checkpoint. Reports time, embeddings and upload requests, and checks every
+document got the same vectors.
+
+    python benchmark/bench_ingestion.py --scale 1 --http-ms 50 --batch-size 16
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import time
+
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents import SearchClient
+from openai import AzureOpenAI
+
+import standin
+from mock_services import MockServices
+from run_suite import database_for
+import sql_executor
+
+sys.path.insert(0, os.path.join(os.path.dirname(standin.FLOW_DIR), "acs"))
+import product_ingestion  # noqa: E402
+
+
+class Stop(Exception):
+    pass
+
+
+def notebook(documents, conn):
+    client = AzureOpenAI(azure_endpoint=conn['AZURE_OPENAI_API_EMB_BASE'], api_key=conn['AZURE_OPENAI_API_EMB_KEY'],
+                         api_version=conn['AZURE_OPENAI_API_EMB_VERSION'])
+
+    def generate_embeddings(text):
+        response = client.embeddings.create(input=text, model=conn['AZURE_OPENAI_API_EMB_DEPLOYMENT'])
+        return response.data[0].embedding
+
+    for doc in documents:
+        doc['DescriptionVector'] = generate_embeddings(doc['Description'].strip())
+        doc['ProductCategoryNameVector'] = generate_embeddings(doc['ProductCategoryName'])
+    for doc in documents:
+        doc['ProductId'] = str(doc['ProductId'])
+    search_client = SearchClient(endpoint=conn['AZURE_SEARCH_ENDPOINT'], index_name=conn['AZURE_SEARCH_INDEX'],
+                                 credential=AzureKeyCredential(conn['ACS-SEARCH-KEY']))
+    search_client.upload_documents(documents)
+
+
+def interrupted(documents, conn, checkpoint, requests, **kwargs):
+    def stop_halfway(stats):
+        if stats["requests"] * 2 >= requests:
+            raise Stop()
+    try:
+        product_ingestion.ingest_products(copy.deepcopy(documents), conn, checkpoint_dir=checkpoint,
+                                          on_batch=stop_halfway, **kwargs)
+    except Stop:
+        pass
+    return product_ingestion.ingest_products(documents, conn, checkpoint_dir=checkpoint, **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--http-ms", type=float, default=50.0, help="mock embeddings/search latency")
+    parser.add_argument("--batch-size", type=int, default=16, help="inputs per embeddings request")
+    parser.add_argument("--upload-chunk", type=int, default=100, help="documents per upload request")
+    parser.add_argument("--workers", type=int, default=product_ingestion.INGEST_WORKERS)
+    args = parser.parse_args()
+
+    db_path = database_for(args.scale, [])
+    conn_db = {'CONNECTION-STRING': f"sqlite:{db_path}"}
+    sql_executor.get_pool(conn_db['CONNECTION-STRING'], connect=standin.make_connect(db_path))
+    products = product_ingestion.load_products(conn_db)
+    services = MockServices(latency=args.http_ms / 1000).start()
+    conn = services.search_connection()
+    texts = {doc['Description'].strip() for doc in products} | {doc['ProductCategoryName'] for doc in products}
+    print(f"{len(products)} products, {len(texts)} distinct texts to embed")
+
+    options = dict(batch_size=args.batch_size, workers=args.workers, upload_chunk=args.upload_chunk)
+    passes = (
+        ("notebook", lambda docs: notebook(docs, conn)),
+        ("pipeline", lambda docs: product_ingestion.ingest_products(docs, conn, checkpoint_dir=tempfile.mkdtemp(),
+                                                                    **options)),
+        ("resumed", lambda docs: interrupted(docs, conn, tempfile.mkdtemp(), -(-len(texts) // args.batch_size),
+                                             **options)),
+    )
+    print(f"{'pass':<10} {'seconds':>8} {'docs/s':>7} {'embed':>6} {'upload':>7} {'indexed':>8}")
+    indexed = {}
+    for name, run in passes:
+        services.requests.clear()
+        services.indexed.clear()
+        start = time.perf_counter()
+        stats = run(copy.deepcopy(products))
+        seconds = time.perf_counter() - start
+        embed = sum(n for path, n in services.requests.items() if path.endswith("/embeddings"))
+        upload = sum(n for path, n in services.requests.items() if path.endswith("/docs/search.index"))
+        indexed[name] = dict(services.indexed)
+        print(f"{name:<10} {seconds:8.2f} {len(products) / seconds:7.1f} {embed:>6} {upload:>7} {len(services.indexed):>8}")
+        if name == "resumed":
+            print(f"{'':<10} after the restart: {stats['texts_from_checkpoint']} texts from the checkpoint, "
+                  f"{stats['texts_embedded']} embedded, {stats['skipped']} documents already uploaded")
+    services.stop()
+
+    fields = list(product_ingestion.VECTOR_FIELDS)
+    same = all(indexed[name].get(key, {}).get(field) == doc[field]
+               for name in ("pipeline", "resumed") for key, doc in indexed["notebook"].items() for field in fields)
+    print(f"same documents and vectors in the index: {same}")
@@ -0,0 +1,90 @@
+"""
+Per node overhead of promptflow/instrumentation.py.
+
+Runs get_customer and get_sales_stat against the SQLite stand-in without
+simulated latency, so the fixed cost of the spans is visible: uninstrumented,
+instrumentation off, sampled out, sampled with the no-op tracer and sampled
+with an OpenTelemetry SDK exporting to memory, best of `--repeat` rounds. Then
+prints the span metrics.
+
+    python benchmark/bench_instrumentation.py --calls 1000 --repeat 5
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import inspect
+import json
+import os
+import tempfile
+import time
+
+import standin
+import instrumentation
+import query_cache
+import sql_executor
+from sql_query_store import sql_query_prep
+from get_customer import get_customer
+from get_product_stats import get_sales_stat
+
+
+def run(calls, conn_db, queries, customer=get_customer, sales_stat=get_sales_stat):
+    products = [{'ProductId': 1, 'ProductCategoryID': 1}]
+    start = time.perf_counter()
+    for i in range(calls):
+        customer(f"{standin.FIRST_NAMES[i % 10]} {standin.LAST_NAMES[i % 7]}", conn_db)
+        sales_stat(products, queries, conn_db)
+    return (time.perf_counter() - start) / (2 * calls)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    query_cache.SQL_RESULT_CACHE = False
+    db_path = standin.build_database(os.path.join(tempfile.gettempdir(), "adventureworks_1.0.db"))
+    conn_db = {'CONNECTION-STRING': f"sqlite:{db_path}"}
+    sql_executor.get_pool(conn_db['CONNECTION-STRING'], connect=standin.make_connect(db_path))
+    queries = sql_query_prep()
+    run(100, conn_db, queries)
+
+    baseline = min(run(args.calls, conn_db, queries, inspect.unwrap(get_customer), inspect.unwrap(get_sales_stat))
+                   for _ in range(args.repeat))
+    print(f"{'uninstrumented':<22} {baseline * 1e6:8.1f} us/node")
+
+    def report(name):
+        per_node = min(run(args.calls, conn_db, queries) for _ in range(args.repeat))
+        print(f"{name:<22} {per_node * 1e6:8.1f} us/node   overhead {(per_node - baseline) * 1e6:+7.1f} us")
+
+    instrumentation.FLOW_INSTRUMENTATION = False
+    report("off")
+    instrumentation.FLOW_INSTRUMENTATION = True
+    instrumentation.FLOW_TRACE_SAMPLE_RATE = 0.0
+    report("sample rate 0")
+    instrumentation.FLOW_TRACE_SAMPLE_RATE = 1.0
+    report("sampled, no-op tracer")
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    except ImportError:
+        exporter = None
+    else:
+        exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+        trace.set_tracer_provider(provider)
+        report("sampled, OTel SDK")
+
+    print()
+    for (node, name), metrics in sorted(instrumentation.span_metrics().items()):
+        print(f"{node:<20} {name:<10} count {metrics['count']:6d}  "
+              f"mean {metrics['sum_s'] / metrics['count'] * 1e6:8.1f} us  rows {metrics['rows']:7d}  bytes {metrics['bytes']}")
+    if exporter is not None:
+        provider.force_flush()
+        last = exporter.get_finished_spans()[-1]
+        print("\nlast exported span:", last.name, json.dumps(dict(last.attributes)))
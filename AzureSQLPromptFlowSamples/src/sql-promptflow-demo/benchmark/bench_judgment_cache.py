@@ -0,0 +1,66 @@
+"""
+Evaluation reruns with the judgment cache of evaluation/judgment_cache.py.
+
+Scores `--lines` (question, context, answer) triples with the groundedness_score
+node against the mock chat completions endpoint: with the cache off, on a cold
+cache, on the warm cache of the previous pass, like rerunning an evaluation
+whose inputs did not change, and with another max_tokens, which must miss. Reports time, model calls and hit
+rate per pass and checks concat_results gets the same scores from cached and
+fresh judgments.
+
+    python benchmark/bench_judgment_cache.py --lines 200 --chat-ms 500
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from promptflow.connections import AzureOpenAIConnection
+
+import standin
+from mock_services import MockServices
+
+sys.path.insert(0, os.path.join(os.path.dirname(standin.FLOW_DIR), "evaluation"))
+import judgment_cache  # noqa: E402
+import groundedness_score  # noqa: E402
+from concat_scores import concat_results  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=200)
+    parser.add_argument("--chat-ms", type=float, default=500.0, help="latency of mock chat completions")
+    args = parser.parse_args()
+
+    services = MockServices(chat_latency=args.chat_ms / 1000).start()
+    chat = services.chat_connection()
+    connection = AzureOpenAIConnection(api_key=chat['api_key'], api_base=chat['api_base'], api_version=chat['api_version'])
+    lines = [{'question': f"question {i}", 'context': f"retrieved context {i % 50}", 'answer': f"answer {i}"}
+             for i in range(args.lines)]
+    judgment_cache.JUDGMENT_CACHE_DIR = tempfile.mkdtemp()
+
+    print(f"{'pass':<12} {'seconds':>8} {'calls':>6} {'hit rate':>9}")
+    scores = {}
+    # the last pass changes a request parameter, none of the earlier judgments apply
+    for name, enabled, params in (("cache off", False, {}), ("cold cache", True, {}), ("warm cache", True, {}),
+                                  ("max_tokens", True, {"max_tokens": 512})):
+        groundedness_score.JUDGMENT_CACHE = enabled
+        services.requests.clear()
+        start = time.perf_counter()
+        outputs = [groundedness_score.groundedness_score(**line, connection=connection, deployment_name="gpt-4",
+                                                         **params)
+                   for line in lines]
+        seconds = time.perf_counter() - start
+        calls = sum(n for path, n in services.requests.items() if path.endswith("/chat/completions"))
+        hit_rate = sum(output['cache_hit'] for output in outputs) / len(outputs)
+        scores[name] = [concat_results(output['output']) for output in outputs]
+        print(f"{name:<12} {seconds:8.2f} {calls:>6} {hit_rate:9.0%}")
+    services.stop()
+
+    same = all(str(a) == str(b) for a, b in zip(scores["cache off"], scores["warm cache"]))
+    print(f"same scores from cached judgments: {same}")
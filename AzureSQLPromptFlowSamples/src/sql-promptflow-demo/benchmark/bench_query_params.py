@@ -0,0 +1,65 @@
+"""
+Plan cache pressure of id lists formatted into the SQL text vs. bound as one JSON parameter.
+
+Each call of the order, product and sales stat queries gets a random id list,
+as a chat turn would. The stand-in counts a compile, and charges the simulated
+compile latency, for every query text it has not seen before.
+
+    python benchmark/bench_query_params.py --calls 200 --compile-ms 15
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import standin
+import sql_executor
+from sql_query_store import list_ids_param, query_order, query_prod_byID, query_sales_stat
+
+
+def literal_query(query, ids):
+    """The query text as the tools built it before, with the ids formatted in."""
+    return query.replace(list_ids_param, str(tuple(ids)).replace(",)", ")")), ()
+
+
+def param_query(query, ids):
+    return query, (json.dumps(ids),)
+
+
+def run(build, conn_db, calls, seed=0):
+    rng = random.Random(seed)
+    queries = [(query_order, 850), (query_prod_byID, 300), (query_sales_stat, len(standin.CATEGORIES))]
+    timings = []
+    for _ in range(calls):
+        query, max_id = rng.choice(queries)
+        ids = rng.sample(range(1, max_id + 1), rng.randint(1, 5))
+        sql, params = build(query, ids)
+        start = time.perf_counter()
+        sql_executor.execute_sql(sql, conn_db, params)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--compile-ms", type=float, default=15.0, help="simulated compile cost of a new query text")
+    args = parser.parse_args()
+
+    db_path = standin.build_database(os.path.join(tempfile.gettempdir(), "adventureworks_1.0.db"))
+    print(f"{'mode':<10} {'calls':>6} {'compiles':>9} {'mean ms':>9} {'p95 ms':>9}")
+    for mode, build in (("literal", literal_query), ("parameter", param_query)):
+        connect = standin.make_connect(db_path, plan_cache=standin.PlanCache(args.compile_ms / 1000))
+        conn_db = {'CONNECTION-STRING': f"sqlite:{db_path}:{mode}"}
+        sql_executor.get_pool(conn_db['CONNECTION-STRING'], connect=connect)
+        timings = sorted(run(build, conn_db, args.calls))
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"{mode:<10} {args.calls:>6} {connect.plan_cache.compiles:>9} "
+              f"{statistics.mean(timings) * 1000:>9.2f} {p95 * 1000:>9.2f}")
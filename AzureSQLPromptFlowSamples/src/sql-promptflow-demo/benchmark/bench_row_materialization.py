@@ -0,0 +1,97 @@
+"""
+CPU time and peak memory of turning fetched rows into records, per node call.
+
+Compares the previous DataFrame -> to_json -> json.loads path with
+`sql_executor.fetch_records`, on rows shaped like the output of
+`query_prod_byID`, and checks both produce identical records.
+
+    python benchmark/bench_row_materialization.py --rows 10 1000 100000
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import datetime
+import decimal
+import json
+import random
+import time
+import tracemalloc
+
+import standin
+import sql_executor
+
+COLUMNS = ["Name", "Category", "Color", "Size", "Weight", "ListPrice", "Description", "ProductCategoryID",
+           "ModifiedDate"]
+
+
+class FakeCursor:
+    """Minimal cursor serving prebuilt rows, so only materialization is measured."""
+
+    def __init__(self, rows):
+        self.description = [(name, None, None, None, None, None, True) for name in COLUMNS]
+        self._rows = rows
+        self._pos = 0
+
+    def fetchall(self):
+        rows, self._pos = self._rows[self._pos:], len(self._rows)
+        return rows
+
+    def fetchmany(self, size):
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+
+def make_rows(n, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        rows.append((f"Product {i}", rng.choice(standin.CATEGORIES), rng.choice(standin.COLORS),
+                     rng.choice(standin.SIZES),
+                     decimal.Decimal(f"{rng.uniform(100, 12000):.2f}") if rng.random() < 0.5 else None,
+                     decimal.Decimal(f"{rng.uniform(5, 3500):.4f}"),
+                     " ".join(rng.choice(standin.WORDS) for _ in range(30)),
+                     rng.randint(1, 41),
+                     datetime.datetime(2008, 3, 11, 10, 1, 36, 827000)))
+    return rows
+
+
+def dataframe_records(cursor):
+    import pandas as pd
+    query_out = cursor.fetchall()
+    out_df = pd.DataFrame((tuple(t) for t in query_out))
+    out_df.columns = [column[0] for column in cursor.description]
+    return json.loads(out_df.to_json(orient="records"))
+
+
+def measure(fn, rows, repeat):
+    cpu = []
+    for _ in range(repeat):
+        start = time.process_time()
+        fn(FakeCursor(rows))
+        cpu.append(time.process_time() - start)
+    tracemalloc.start()
+    out = fn(FakeCursor(rows))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(cpu), peak, out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 1000, 100000])
+    args = parser.parse_args()
+
+    # pay the pandas import once up front, it is not part of the per call cost
+    dataframe_records(FakeCursor(make_rows(1)))
+    print(f"{'rows':>8} {'path':<10} {'cpu ms':>10} {'peak MiB':>10}")
+    for n in args.rows:
+        rows = make_rows(n)
+        repeat = 20 if n <= 1000 else 3
+        df_cpu, df_peak, df_out = measure(dataframe_records, rows, repeat)
+        rec_cpu, rec_peak, rec_out = measure(sql_executor.fetch_records, rows, repeat)
+        assert df_out == rec_out, "record conversion differs from the DataFrame path"
+        print(f"{n:>8} {'dataframe':<10} {df_cpu * 1000:>10.3f} {df_peak / 2**20:>10.2f}")
+        print(f"{n:>8} {'records':<10} {rec_cpu * 1000:>10.3f} {rec_peak / 2**20:>10.2f}")
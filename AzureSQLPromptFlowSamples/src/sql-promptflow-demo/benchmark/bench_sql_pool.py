@@ -0,0 +1,82 @@
+"""
+Per chat turn SQL latency with a new connection per node vs. the pooled executor.
+
+A turn runs the four SQL nodes of the flow (customer, past orders, products by
+id, sales stats) against the SQLite stand-in with a simulated connect cost.
+
+    python benchmark/bench_sql_pool.py --turns 50 --connect-ms 40 --rtt-ms 2
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import standin
+import sql_executor
+from sql_query_store import query_customer, query_order, query_prod_byID, query_sales_stat
+
+
+def turn_queries():
+    return [
+        (query_customer, ("Donald", "Blanton")),
+        (query_order, ("[1, 2, 3]",)),
+        (query_prod_byID, ("[1, 2, 3, 4, 5]",)),
+        (query_sales_stat, ("[1, 5]",)),
+    ]
+
+
+def run_unpooled(connect, conn_db, turns):
+    """Baseline: every node opens its own connection, as the tools did before."""
+    timings = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        for sql, params in turn_queries():
+            conn = connect(conn_db['CONNECTION-STRING'])
+            cursor = conn.cursor()
+            cursor.execute(sql, *params)
+            cursor.fetchall()
+            cursor.close()
+            conn.close()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_pooled(conn_db, turns):
+    timings = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        for sql, params in turn_queries():
+            sql_executor.execute_sql(sql, conn_db, params)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<10} mean {statistics.mean(timings) * 1000:8.2f} ms   "
+          f"p50 {statistics.median(timings) * 1000:8.2f} ms   p95 {p95 * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--connect-ms", type=float, default=40.0, help="simulated TLS handshake + login")
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="simulated round trip per statement")
+    parser.add_argument("--scale", type=float, default=1.0)
+    args = parser.parse_args()
+
+    db_path = standin.build_database(os.path.join(tempfile.gettempdir(), f"adventureworks_{args.scale}.db"),
+                                     scale=args.scale)
+    connect = standin.make_connect(db_path, args.connect_ms / 1000, args.rtt_ms / 1000)
+    conn_db = {'CONNECTION-STRING': f"sqlite:{db_path}"}
+    sql_executor.get_pool(conn_db['CONNECTION-STRING'], connect=connect)
+
+    report("unpooled", run_unpooled(connect, conn_db, args.turns))
+    report("pooled", run_pooled(conn_db, args.turns))
+    print("pool stats:", sql_executor.get_pool(conn_db['CONNECTION-STRING']).stats())
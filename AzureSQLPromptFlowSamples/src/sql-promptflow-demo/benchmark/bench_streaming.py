@@ -0,0 +1,132 @@
+"""
+Time to the first answer token and to the complete response of the served flow,
+with the answer buffered (Accept: application/json) vs. streamed as server-sent
+events (Accept: text/event-stream).
+
+A copy of the promptflow folder, with `--flow` as flow.dag.yaml and its
+connections pointed at the SQLite stand-in and the mock services, is served by
+promptflow's own flask app in this process, and score_client.py calls /score.
+The mock chat completions endpoint answers after `--chat-ms`, then produces
+`--tokens` tokens `--token-ms` apart.
+
+    python benchmark/bench_streaming.py --tokens 50 200 1000 --token-ms 20 --turns 5
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+
+os.environ.setdefault("PF_LOGGING_LEVEL", "WARNING")
+os.environ.setdefault("PF_DISABLE_TRACING", "true")
+
+import httpx  # noqa: E402
+import yaml  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+import standin  # noqa: E402
+import sql_executor  # noqa: E402
+from mock_services import MockServices  # noqa: E402
+from run_suite import database_for, load_questions  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from score_client import score  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FLOW_DIR = os.path.join(BENCH_DIR, "..", "promptflow")
+CONNECTIONS = {"conn_db": "sql", "conn": "search"}
+
+
+def serving_copy(flow: str) -> str:
+    """A copy of the flow folder with `flow` as flow.dag.yaml and named connections."""
+    target = tempfile.mkdtemp()
+    shutil.copytree(FLOW_DIR, target, dirs_exist_ok=True, ignore=shutil.ignore_patterns("__pycache__", ".promptflow"))
+    with open(os.path.join(FLOW_DIR, flow)) as f:
+        dag = yaml.safe_load(f)
+    for node in dag["nodes"]:
+        if node["type"] == "llm":
+            node["connection"] = "aoai"
+            node["inputs"]["deployment_name"] = "chat"
+        for key, name in CONNECTIONS.items():
+            if key in node.get("inputs", {}):
+                node["inputs"][key] = name
+    with open(os.path.join(target, "flow.dag.yaml"), "w") as f:
+        yaml.safe_dump(dag, f, sort_keys=False)
+    return target
+
+
+def serve(flow_dir: str, connections: list):
+    """Serve `flow_dir` with promptflow's flask app on a free port, return (server, score url)."""
+    from promptflow.core._serving.app import create_app
+    for conn in connections:
+        # promptflow 1.18 calls to_execution_connection_dict on the connections of a
+        # callable provider, the connection classes name it _to_execution_connection_dict
+        if not hasattr(type(conn), "to_execution_connection_dict"):
+            type(conn).to_execution_connection_dict = type(conn)._to_execution_connection_dict
+    os.environ["PROMPTFLOW_PROJECT_PATH"] = flow_dir
+    app = create_app(connection_provider=lambda: connections)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/score"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flow", default="flow.dag.sample.yaml")
+    parser.add_argument("--tokens", type=int, nargs="+", default=[50, 200, 1000], help="answer lengths in tokens")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="simulated time per generated token")
+    parser.add_argument("--chat-ms", type=float, default=300.0, help="simulated time to the first token")
+    parser.add_argument("--http-ms", type=float, default=20.0, help="mock embeddings/search latency")
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="simulated SQL round trip")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+
+    from promptflow.entities import AzureOpenAIConnection, CustomConnection
+
+    questions = load_questions(os.path.join(BENCH_DIR, "..", "data", "batch_run_data.jsonl"))
+    db_path = database_for(args.scale, sorted({q["customer"] for q in questions}))
+    conn_string = f"sqlite:{db_path}"
+    sql_executor.get_pool(conn_string, connect=standin.make_connect(db_path, rtt=args.rtt_ms / 1000))
+    services = MockServices(latency=args.http_ms / 1000, chat_latency=args.chat_ms / 1000,
+                            token_latency=args.token_ms / 1000).start()
+    flow_dir = serving_copy(args.flow)
+    server, url = serve(flow_dir, [
+        CustomConnection(name="sql", secrets={"CONNECTION-STRING": conn_string}),
+        CustomConnection(name="search", secrets=services.search_connection()),
+        AzureOpenAIConnection(name="aoai", api_key="key", api_base=services.url, api_type="azure",
+                              api_version=services.chat_connection()["api_version"]),
+    ])
+
+    client = httpx.Client(timeout=120.0)
+    payloads = [{"question": q["question"], "customer": q["customer"], "chat_history": []} for q in questions]
+    # first request loads the flow's nodes and opens the connections
+    score(payloads[0], url=url, client=client)
+
+    print(f"{args.flow}, chat {args.chat_ms:g} ms + {args.token_ms:g} ms/token, median of {args.turns} turns")
+    print(f"{'tokens':>8} {'mode':<10} {'first token ms':>16} {'complete ms':>13}")
+    for tokens in args.tokens:
+        services.completion_tokens = tokens
+        answers = {}
+        for stream in (False, True):
+            runs = [score(payloads[i % len(payloads)], url=url, stream=stream, client=client)
+                    for i in range(args.turns)]
+            answers[stream] = [outputs for outputs, _ in runs]
+            first = statistics.median(t["first_token_s"] for _, t in runs) * 1000
+            total = statistics.median(t["total_s"] for _, t in runs) * 1000
+            print(f"{tokens:>8} {'streamed' if stream else 'buffered':<10} {first:16.1f} {total:13.1f}")
+        if answers[False] != answers[True]:
+            print("         streamed outputs differ from the buffered ones")
+
+    client.close()
+    server.shutdown()
+    services.stop()
+    shutil.rmtree(flow_dir, ignore_errors=True)
@@ -0,0 +1,168 @@
+"""
+In-process replay of a promptflow DAG for benchmarking.
+
+Python nodes are imported from the flow folder and called directly, `${...}`
+references are resolved like the promptflow executor does, nodes whose `activate`
+condition does not hold are bypassed with a None output, and LLM nodes render
+their jinja2 prompt and call the chat completions endpoint given by a
+connection (the mock services in benchmarks). Each node call is timed, and can
+be traced with tracemalloc for its peak memory.
+
+    replay = FlowReplay("promptflow/flow.dag.sample.yaml", {'conn_db': conn_db, 'conn': conn}, chat_conn)
+    outputs, timings = replay.run({"question": "...", "customer": "...", "chat_history": []})
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import asyncio
+import importlib
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+import jinja2
+import yaml
+from openai import AzureOpenAI
+
+import standin  # noqa: F401  puts promptflow/ on sys.path
+from http_transport import get_http_client
+
+_reference = re.compile(r"^\$\{([^}]+)\}$")
+_role = re.compile(r"^\s*#?\s*(system|user|assistant)\s*:\s*$", re.IGNORECASE | re.MULTILINE)
+# inputs of an llm node that are request settings rather than template variables
+LLM_SETTINGS = ("deployment_name", "temperature", "top_p", "stop", "max_tokens", "presence_penalty",
+                "frequency_penalty", "logit_bias")
+
+
+def parse_chat(prompt: str) -> list:
+    """Split a rendered promptflow chat template ("system:", "user:" ... lines) into messages."""
+    parts = _role.split(prompt)
+    return [{"role": role.lower(), "content": content.strip()}
+            for role, content in zip(parts[1::2], parts[2::2]) if content.strip()]
+
+
+def _tool_function(module):
+    for value in vars(module).values():
+        if callable(value) and hasattr(value, "__tool") and value.__module__ == module.__name__:
+            return value
+    raise ValueError(f"No @tool function in {module.__name__}")
+
+
+class FlowReplay:
+
+    def __init__(self, flow_path: str, connections: dict, chat_connection: dict = None,
+                 chat_deployment: str = "chat"):
+        """
+        `connections` maps python node input names (conn_db, conn) to the connection
+        dicts to pass; `chat_connection` has the api_base, api_key and api_version
+        of the chat completions endpoint used for LLM nodes.
+        """
+        self.flow_dir = os.path.dirname(os.path.abspath(flow_path))
+        with open(flow_path) as f:
+            self.flow = yaml.safe_load(f)
+        self.connections = connections
+        self.chat_deployment = chat_deployment
+        self._chat_client = None
+        if chat_connection is not None:
+            self._chat_client = AzureOpenAI(azure_endpoint=chat_connection['api_base'],
+                                            api_key=chat_connection['api_key'],
+                                            api_version=chat_connection['api_version'],
+                                            http_client=get_http_client(), max_retries=0)
+        if self.flow_dir not in sys.path:
+            sys.path.insert(0, self.flow_dir)
+        self.nodes = self._topological(self.flow['nodes'])
+        self._functions = {}
+        self._templates = {}
+        for node in self.flow['nodes']:
+            path = node['source']['path']
+            if node['type'] == 'python':
+                module = importlib.import_module(os.path.splitext(path)[0])
+                self._functions[node['name']] = _tool_function(module)
+            elif node['type'] == 'llm':
+                with open(os.path.join(self.flow_dir, path), encoding="utf-8") as f:
+                    self._templates[node['name']] = jinja2.Template(f.read(), trim_blocks=True, keep_trailing_newline=True)
+
+    @staticmethod
+    def _topological(nodes: list) -> dict:
+        """Nodes keyed by name in an order where every node comes after the nodes it references."""
+        by_name = {node['name']: node for node in nodes}
+        ordered = {}
+
+        def visit(name, path=()):
+            if name in ordered:
+                return
+            if name in path:
+                raise ValueError(f"Cycle in flow at node {name}")
+            references = list(by_name[name].get('inputs', {}).values())
+            references.append(by_name[name].get('activate', {}).get('when'))
+            for value in references:
+                match = _reference.match(value) if isinstance(value, str) else None
+                if match and match.group(1).split(".")[0] in by_name:
+                    visit(match.group(1).split(".")[0], path + (name,))
+            ordered[name] = by_name[name]
+        for node in nodes:
+            visit(node['name'])
+        return ordered
+
+    def _resolve(self, value, inputs: dict, results: dict):
+        match = _reference.match(value) if isinstance(value, str) else None
+        if match is None:
+            return value
+        head, *path = match.group(1).split(".")
+        if head == "inputs":
+            return inputs[path[0]]
+        value = results[head]
+        for key in path[1:]:  # path[0] is "output"
+            value = value[key]
+        return value
+
+    def _call_llm(self, name: str, node_inputs: dict) -> str:
+        if self._chat_client is None:
+            raise ValueError(f"LLM node {name} needs a chat connection")
+        prompt = self._templates[name].render(**{k: v for k, v in node_inputs.items() if k not in LLM_SETTINGS})
+        response = self._chat_client.chat.completions.create(
+            model=self.chat_deployment, messages=parse_chat(prompt),
+            temperature=node_inputs.get("temperature", 0), max_tokens=node_inputs.get("max_tokens") or None)
+        return response.choices[0].message.content
+
+    def run(self, inputs: dict, trace_memory: bool = False):
+        """
+        Run the flow on `inputs`; return (flow outputs, {node: seconds}) or, with
+        `trace_memory`, (flow outputs, {node: seconds}, {node: peak traced bytes}).
+        """
+        flow_inputs = {name: inputs.get(name, spec.get('default')) for name, spec in self.flow['inputs'].items()}
+        results, timings, peaks = {}, {}, {}
+        for name, node in self.nodes.items():
+            node_inputs = {}
+            for key, value in node.get('inputs', {}).items():
+                if key in self.connections and node['type'] == 'python':
+                    node_inputs[key] = self.connections[key]
+                else:
+                    node_inputs[key] = self._resolve(value, flow_inputs, results)
+            activate = node.get('activate')
+            if activate is not None and self._resolve(activate['when'], flow_inputs, results) != activate['is']:
+                # bypassed, as promptflow does the nodes referencing it get None
+                results[name], timings[name], peaks[name] = None, 0.0, 0
+                continue
+            if trace_memory:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            if node['type'] == 'llm':
+                result = self._call_llm(name, node_inputs)
+            else:
+                result = self._functions[name](**node_inputs)
+                if asyncio.iscoroutine(result):
+                    result = asyncio.run(result)
+            timings[name] = time.perf_counter() - start
+            if trace_memory:
+                peaks[name] = tracemalloc.get_traced_memory()[1] - base
+            results[name] = result
+        outputs = {name: self._resolve(spec['reference'], flow_inputs, results)
+                   for name, spec in self.flow['outputs'].items()}
+        if trace_memory:
+            return outputs, timings, peaks
+        return outputs, timings
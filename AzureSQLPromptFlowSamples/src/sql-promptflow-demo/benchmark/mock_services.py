@@ -0,0 +1,280 @@
+"""
+Local mock of the Azure AI Search (search, index definition, document uploads) and Azure OpenAI
+(embeddings, chat completions) endpoints used by the flow.
+
+    server = MockServices(latency=0.05).start()
+    conn = server.search_connection()   # stands in for the search/embedding CustomConnection
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+_embeddings_path = re.compile(r"^/openai/deployments/([^/]+)/embeddings")
+_search_path = re.compile(r"^/indexes/([^/]+)/docs/search")
+_chat_path = re.compile(r"^/openai/deployments/([^/]+)/chat/completions")
+_index_path = re.compile(r"^/indexes\('([^']+)'\)$")
+_upload_path = re.compile(r"^/indexes\('([^']+)'\)/docs/search.index")
+
+
+def fake_embedding(text: str, dim: int) -> list:
+    """Deterministic unit vector for `text`."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).normal(size=dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def word_embedding(text: str, dim: int) -> list:
+    """Unit vector summing the fake embeddings of the lowercased words of `text`, close for paraphrases."""
+    words = re.findall(r"[a-z0-9]+", text.lower()) or [""]
+    vector = np.sum([fake_embedding(word, dim) for word in words], axis=0)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes, Nagle plus delayed ACK would add ~40 ms on kept-alive connections
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_chat(self, model: str, tokens: list):
+        """Server-sent chat.completion.chunk events, one per token `token_latency` apart, then [DONE]."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(data: str):
+            event = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta: dict, finish_reason=None):
+            return json.dumps({"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                               "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]})
+        send(chunk({"role": "assistant", "content": ""}))
+        for token in tokens:
+            time.sleep(self.server.services.token_latency)
+            send(chunk({"content": token}))
+        send(chunk({}, "stop"))
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def setup(self):
+        super().setup()
+        self.server.services.record("connections")
+        # what a TLS handshake costs on a new connection
+        time.sleep(self.server.services.handshake)
+
+    def do_POST(self):
+        services = self.server.services
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            services.record("gzip")
+            body = gzip.decompress(body)
+        request = json.loads(body or b"{}")
+        path = self.path.split("?")[0]
+        services.record(path)
+        with services.track_inflight():
+            time.sleep(services.latency)
+            if services.throttle():
+                return self._reply(429, {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                                   {"Retry-After": f"{services.retry_after:g}"})
+
+        match = _embeddings_path.match(path)
+        if match:
+            inputs = request["input"] if isinstance(request["input"], list) else [request["input"]]
+            data = [{"object": "embedding", "index": i, "embedding": services.embed(text)}
+                    for i, text in enumerate(inputs)]
+            return self._reply(200, {"object": "list", "data": data, "model": match.group(1),
+                                     "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+
+        match = _chat_path.match(path)
+        if match:
+            services.last_messages = request['messages']
+            time.sleep(services.chat_latency)
+            tokens = services.answer_tokens(request['messages'][-1]['content'])
+            if request.get("stream"):
+                return self._stream_chat(match.group(1), tokens)
+            time.sleep(services.token_latency * len(tokens))
+            return self._reply(200, {
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": match.group(1),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}})
+
+        if _upload_path.match(path):
+            value = []
+            with services._lock:
+                for action in request["value"]:
+                    key = str(action["ProductId"])
+                    kind = action.pop("@search.action", "upload")
+                    if kind == "delete":
+                        services.indexed.pop(key, None)
+                    elif kind == "upload" or key not in services.indexed:
+                        services.indexed[key] = action
+                    else:
+                        services.indexed[key].update(action)
+                    value.append({"key": key, "status": True, "errorMessage": None, "statusCode": 201})
+            return self._reply(200, {"value": value})
+
+        if _search_path.match(path):
+            top = request.get("top", 5)
+            if services.semantic:
+                vectors = request.get("vectorQueries") or [{"vector": services.embed(request.get("search", ""))}]
+                scores = services.product_vectors() @ np.asarray(vectors[0]["vector"])
+                ids = (np.argsort(-scores, kind="stable")[:top] + 1).tolist()
+            else:
+                rng = random.Random(request.get("search", ""))
+                ids = rng.sample(range(1, services.n_products + 1), min(top, services.n_products))
+            value = [{"@search.score": 1.0 / (rank + 1), "ProductId": str(product_id)}
+                     for rank, product_id in enumerate(ids)]
+            return self._reply(200, {"value": value})
+
+        self._reply(404, {"error": {"code": "NotFound", "message": path}})
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        self.server.services.record(path)
+        match = _index_path.match(path)
+        if match:
+            return self._reply(200, {"name": match.group(1), "fields": [
+                {"name": "ProductId", "type": "Edm.String", "key": True}]})
+        self._reply(404, {"error": {"code": "NotFound", "message": path}})
+
+
+class MockServices:
+    """
+    Threaded HTTP server answering embeddings, search and chat completion requests
+    after `latency` seconds, chat completions after another `chat_latency`.
+
+    Chat answers are `completion_tokens` words long (the question echoed when 0),
+    generated one per `token_latency` seconds, and sent as server-sent events
+    as they are generated when the request asks for `stream`.
+    With `semantic`, embeddings are built from the words of a text, so paraphrases
+    get close vectors, and search ranks products by the similarity of their own
+    fake embeddings to the query vector; otherwise both are random per text.
+    A `throttle_rate` share of requests gets a 429 with Retry-After `retry_after`,
+    new connections wait `handshake` seconds before their first request is read.
+    `requests` counts requests per path plus the opened "connections" and "gzip"
+    bodies, `max_inflight` the most requests served at once. Uploaded documents
+    are kept in `indexed` by key, and the messages of the latest chat completions
+    request in `last_messages`.
+    """
+
+    def __init__(self, latency: float = 0.0, dim: int = 64, n_products: int = 300, port: int = 0,
+                 throttle_rate: float = 0.0, retry_after: float = 0.1, seed: int = 0, chat_latency: float = 0.0,
+                 handshake: float = 0.0, token_latency: float = 0.0, completion_tokens: int = 0,
+                 semantic: bool = False):
+        self.latency = latency
+        self.semantic = semantic
+        self._product_vectors = None
+        self.handshake = handshake
+        self.chat_latency = chat_latency
+        self.token_latency = token_latency
+        self.completion_tokens = completion_tokens
+        self.dim = dim
+        self.n_products = n_products
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.requests = {}
+        self.indexed = {}
+        self.last_messages = None
+        self.inflight = 0
+        self.max_inflight = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._server.daemon_threads = True
+        self._server.request_queue_size = 1024
+        self._server.services = self
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def record(self, path: str):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def embed(self, text: str) -> list:
+        return word_embedding(text, self.dim) if self.semantic else fake_embedding(text, self.dim)
+
+    def product_vectors(self):
+        """(n_products, dim) matrix of the fake embeddings of the products, row i is ProductId i + 1."""
+        if self._product_vectors is None:
+            self._product_vectors = np.array([fake_embedding(f"product {i}", self.dim)
+                                              for i in range(1, self.n_products + 1)])
+        return self._product_vectors
+
+    def answer_tokens(self, question: str) -> list:
+        """The tokens of the chat answer to `question`, each a word with its leading space."""
+        words = f"Here is what I found for: {question[:80]}".split()
+        if self.completion_tokens:
+            words = (words * (self.completion_tokens // len(words) + 1))[:self.completion_tokens]
+        return [words[0]] + [" " + word for word in words[1:]]
+
+    def throttle(self) -> bool:
+        with self._lock:
+            throttled = self._rng.random() < self.throttle_rate
+        if throttled:
+            self.record("throttled")
+        return throttled
+
+    @contextmanager
+    def track_inflight(self):
+        with self._lock:
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def search_connection(self) -> dict:
+        return {
+            'AZURE_SEARCH_ENDPOINT': self.url,
+            'AZURE_SEARCH_INDEX': 'products',
+            'ACS-SEARCH-KEY': 'key',
+            'AZURE_SEARCH_API_VERSION': '2023-11-01',
+            'AZURE_OPENAI_API_EMB_BASE': self.url,
+            'AZURE_OPENAI_API_EMB_KEY': 'key',
+            'AZURE_OPENAI_API_EMB_VERSION': '2024-02-01',
+            'AZURE_OPENAI_API_EMB_DEPLOYMENT': 'embedding',
+        }
+
+    def chat_connection(self) -> dict:
+        return {'api_base': self.url, 'api_key': 'key', 'api_version': '2024-02-01'}
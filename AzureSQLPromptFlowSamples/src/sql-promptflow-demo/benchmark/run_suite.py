@@ -0,0 +1,175 @@
+"""
+Offline benchmark suite: replays batch run questions through every node and the
+whole flow across database scale factors, without any Azure resource.
+
+For each scale factor a synthetic AdventureWorksLT database is generated with the
+customers of the data file added, the mock search, embedding and chat services
+answer the remote calls, and each flow file is replayed with `FlowReplay`:
+
+- `--turns` sequential turns give per node and whole turn p50/p95/p99 latency,
+- one traced pass over the questions gives the peak memory per node,
+- `--turns` turns on `--concurrency` threads give the throughput.
+
+Results can be written with `--output` and compared against an earlier run with
+`--baseline`; the script exits with status 1 when a p95 latency grew or the
+throughput dropped by more than `--max-regression`, so it can gate CI.
+
+    python benchmark/run_suite.py --scales 1 5 20 --output bench.json
+    python benchmark/run_suite.py --scales 1 5 20 --baseline bench.json
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import standin
+from flow_replay import FlowReplay
+from mock_services import MockServices
+import embedding_cache
+import query_cache
+import sql_executor
+
+DEMO_DIR = os.path.dirname(standin.FLOW_DIR)
+TURN = "turn"
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest rank percentile, `q` in [0, 100]."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def load_questions(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def database_for(scale: float, customers: list) -> str:
+    digest = hashlib.sha1("\n".join(customers).encode("utf-8")).hexdigest()[:8]
+    path = os.path.join(tempfile.gettempdir(), f"adventureworks_suite_{scale}_{digest}.db")
+    return standin.build_database(path, scale=scale, customers=customers)
+
+
+def replay_turn(replay: FlowReplay, question: dict) -> dict:
+    start = time.perf_counter()
+    _, timings = replay.run(question)
+    timings[TURN] = time.perf_counter() - start
+    return timings
+
+
+def bench_flow(replay: FlowReplay, questions: list, turns: int, concurrency: int) -> dict:
+    latencies = {}
+    for i in range(turns):
+        for node, seconds in replay_turn(replay, questions[i % len(questions)]).items():
+            latencies.setdefault(node, []).append(seconds)
+
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for question in questions:
+            _, _, node_peaks = replay.run(question, trace_memory=True)
+            for node, peak in node_peaks.items():
+                peaks[node] = max(peaks.get(node, 0), peak)
+    finally:
+        tracemalloc.stop()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda i: replay.run(questions[i % len(questions)]), range(turns)))
+        throughput = turns / (time.perf_counter() - start)
+
+    results = {node: {"p50_ms": percentile(values, 50) * 1000,
+                      "p95_ms": percentile(values, 95) * 1000,
+                      "p99_ms": percentile(values, 99) * 1000}
+               for node, values in latencies.items()}
+    for node, peak in peaks.items():
+        results[node]["peak_kib"] = peak / 1024
+    results[TURN]["turns_per_s"] = throughput
+    return results
+
+
+def compare(results: dict, baseline: dict, max_regression: float, min_delta_ms: float = 1.0) -> list:
+    """
+    Messages for every p95 latency or throughput that regressed by more than
+    `max_regression`; latencies must also have grown by `min_delta_ms`, so
+    sub-millisecond nodes do not trip on noise.
+    """
+    regressions = []
+    for key, metrics in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if "p95_ms" in base and metrics["p95_ms"] > max(base["p95_ms"] * (1 + max_regression),
+                                                        base["p95_ms"] + min_delta_ms):
+            regressions.append(f"{key}: p95 {base['p95_ms']:.1f} -> {metrics['p95_ms']:.1f} ms")
+        if "turns_per_s" in base and metrics.get("turns_per_s", 0) < base["turns_per_s"] / (1 + max_regression):
+            regressions.append(f"{key}: throughput {base['turns_per_s']:.1f} -> {metrics['turns_per_s']:.1f} turns/s")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0, 5.0, 20.0])
+    parser.add_argument("--flows", nargs="+", default=["promptflow/flow.dag.sample.yaml",
+                                                       "promptflow/flow.dag.combined.sample.yaml"])
+    parser.add_argument("--data", default="data/batch_run_data.jsonl")
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--http-ms", type=float, default=30.0, help="mock search/embedding latency")
+    parser.add_argument("--chat-ms", type=float, default=200.0, help="extra latency of mock chat completions")
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="simulated SQL round trip")
+    parser.add_argument("--connect-ms", type=float, default=20.0, help="simulated SQL connect")
+    parser.add_argument("--caches", action="store_true", help="keep the SQL result and embedding caches on")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    parser.add_argument("--min-delta-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if not args.caches:
+        query_cache.SQL_RESULT_CACHE = False
+        embedding_cache.get_cache().max_size = 0
+        embedding_cache.get_cache().store = None
+
+    questions = load_questions(os.path.join(DEMO_DIR, args.data))
+    customers = sorted({question["customer"] for question in questions})
+    services = MockServices(latency=args.http_ms / 1000, chat_latency=args.chat_ms / 1000).start()
+
+    results = {}
+    print(f"{'scale':>6} {'flow':<34} {'node':<26} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak KiB':>9} {'turns/s':>8}")
+    for scale in args.scales:
+        db_path = database_for(scale, customers)
+        conn_db = {'CONNECTION-STRING': f"sqlite:{db_path}"}
+        sql_executor.get_pool(conn_db['CONNECTION-STRING'],
+                              connect=standin.make_connect(db_path, args.connect_ms / 1000, args.rtt_ms / 1000))
+        services.n_products = max(10, int(300 * scale))
+        for flow in args.flows:
+            replay = FlowReplay(os.path.join(DEMO_DIR, flow), {'conn_db': conn_db, 'conn': services.search_connection()},
+                                services.chat_connection())
+            for node, metrics in bench_flow(replay, questions, args.turns, args.concurrency).items():
+                results[f"{scale:g}/{os.path.basename(flow)}/{node}"] = metrics
+                peak = f"{metrics['peak_kib']:9.1f}" if "peak_kib" in metrics else " " * 9
+                throughput = f"{metrics['turns_per_s']:8.1f}" if "turns_per_s" in metrics else ""
+                print(f"{scale:>6g} {os.path.basename(flow):<34} {node:<26} {metrics['p50_ms']:8.1f} "
+                      f"{metrics['p95_ms']:8.1f} {metrics['p99_ms']:8.1f} {peak} {throughput}")
+    services.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression, args.min_delta_ms)
+        for message in regressions:
+            print("REGRESSION", message)
+        sys.exit(1 if regressions else 0)
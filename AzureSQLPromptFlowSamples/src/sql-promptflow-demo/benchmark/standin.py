@@ -0,0 +1,291 @@
+"""
+Local SQLite stand-in for the AdventureWorksLT database used by the flow.
+
+The tables are attached under a `SalesLT` schema so the queries in
+`promptflow/sql_query_store.py` run with only OPENJSON id lists and name pairs
+rewritten to json_each; multi statement batches are split and serve their result sets
+through nextset(). `make_connect` returns a connection factory that adds a configurable
+connect latency (TLS handshake and login), round-trip latency per statement and
+compile latency per distinct query text, to model a remote Azure SQL.
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+FLOW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "promptflow")
+if FLOW_DIR not in sys.path:
+    sys.path.insert(0, FLOW_DIR)
+
+from sql_query_store import list_ids_param, name_pairs_param  # noqa: E402
+
+CATEGORIES = ["Mountain Bikes", "Road Bikes", "Touring Bikes", "Helmets", "Jerseys", "Gloves",
+              "Shorts", "Socks", "Caps", "Vests", "Bottles and Cages", "Tires and Tubes"]
+COLORS = ["Black", "Red", "Yellow", "Blue", "Silver", "White", "Multi", None]
+SIZES = ["S", "M", "L", "XL", "44", "48", "52", "58", None]
+FIRST_NAMES = ["Donald", "Jackie", "Janet", "Orlando", "Keith", "Catherine", "Kim", "Paul", "Linda", "Frances"]
+LAST_NAMES = ["Blanton", "Blackwell", "Gates", "Gee", "Harris", "Abel", "Abercrombie", "Alcorn", "Mitchell", "Adams"]
+WORDS = ["lightweight", "aluminum", "carbon", "frame", "comfortable", "durable", "classic", "race",
+         "fit", "breathable", "wicking", "padded", "reflective", "versatile", "all-weather", "trail"]
+
+SCHEMA = """
+CREATE TABLE SalesLT.Customer (
+    CustomerID INTEGER PRIMARY KEY, NameStyle INTEGER, Title TEXT, FirstName TEXT, MiddleName TEXT,
+    LastName TEXT, Suffix TEXT, CompanyName TEXT, SalesPerson TEXT, EmailAddress TEXT, Phone TEXT,
+    PasswordHash TEXT, PasswordSalt TEXT, rowguid TEXT, ModifiedDate TEXT);
+CREATE TABLE SalesLT.ProductCategory (
+    ProductCategoryID INTEGER PRIMARY KEY, ParentProductCategoryID INTEGER, Name TEXT);
+CREATE TABLE SalesLT.ProductModel (ProductModelID INTEGER PRIMARY KEY, Name TEXT);
+CREATE TABLE SalesLT.ProductDescription (ProductDescriptionID INTEGER PRIMARY KEY, Description TEXT);
+CREATE TABLE SalesLT.ProductModelProductDescription (
+    ProductModelID INTEGER, ProductDescriptionID INTEGER, Culture TEXT);
+CREATE TABLE SalesLT.Product (
+    ProductID INTEGER PRIMARY KEY, Name TEXT, ProductNumber TEXT, Color TEXT, StandardCost NUMERIC,
+    ListPrice NUMERIC, Size TEXT, Weight NUMERIC, ProductCategoryID INTEGER, ProductModelID INTEGER);
+CREATE TABLE SalesLT.SalesOrderHeader (SalesOrderID INTEGER PRIMARY KEY, CustomerID INTEGER, OrderDate TEXT);
+CREATE TABLE SalesLT.SalesOrderDetail (
+    SalesOrderDetailID INTEGER PRIMARY KEY, SalesOrderID INTEGER, ProductID INTEGER, OrderQty INTEGER,
+    UnitPrice NUMERIC);
+CREATE INDEX SalesLT.ix_soh_customer ON SalesOrderHeader (CustomerID);
+CREATE INDEX SalesLT.ix_sod_order ON SalesOrderDetail (SalesOrderID);
+CREATE INDEX SalesLT.ix_sod_product ON SalesOrderDetail (ProductID);
+CREATE INDEX SalesLT.ix_pmpd_model ON ProductModelProductDescription (ProductModelID);
+"""
+
+
+def _attach(conn: sqlite3.Connection, path: str) -> sqlite3.Connection:
+    conn.execute("ATTACH DATABASE ? AS SalesLT", (path,))
+    return conn
+
+
+def build_database(path: str, scale: float = 1.0, seed: int = 0, customers: list = ()) -> str:
+    """
+    Create a synthetic AdventureWorksLT-shaped database at `path`.
+
+    `scale` 1.0 roughly matches the sample database: ~850 customers, ~300
+    products, ~130 models and ~2.5k order lines. `customers` are full names added
+    on top of the generated ones, e.g. the customers of a batch run file, split
+    into first and last name the way get_customer does. Existing files are reused.
+    """
+    if os.path.exists(path):
+        return path
+    rng = random.Random(seed)
+    names = [(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)) for _ in range(max(10, int(850 * scale)))]
+    names += [(name.split()[0], name.split()[-1]) for name in customers]
+    n_customers = len(names)
+    n_models = max(5, int(130 * scale))
+    n_products = max(10, int(300 * scale))
+    n_orders = max(10, int(450 * scale))
+
+    conn = _attach(sqlite3.connect(path), path)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO SalesLT.ProductCategory VALUES (?, NULL, ?)",
+                     [(i + 1, name) for i, name in enumerate(CATEGORIES)])
+    conn.executemany("INSERT INTO SalesLT.ProductModel VALUES (?, ?)",
+                     [(i, f"Model-{i}") for i in range(1, n_models + 1)])
+
+    # every model has an English description first and a translated one second,
+    # mirroring what the ROW_NUMBER() dedup in query_prod_detail relies on
+    descriptions, links = [], []
+    for model_id in range(1, n_models + 1):
+        for culture in ("en", "fr"):
+            desc_id = len(descriptions) + 1
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(12, 40)))
+            descriptions.append((desc_id, f"[{culture}] {text}"))
+            links.append((model_id, desc_id, culture))
+    conn.executemany("INSERT INTO SalesLT.ProductDescription VALUES (?, ?)", descriptions)
+    conn.executemany("INSERT INTO SalesLT.ProductModelProductDescription VALUES (?, ?, ?)", links)
+
+    products = []
+    for product_id in range(1, n_products + 1):
+        category_id = rng.randint(1, len(CATEGORIES))
+        price = round(rng.uniform(5, 3500), 4)
+        products.append((product_id, f"{CATEGORIES[category_id - 1]} {product_id}", f"PN-{product_id:05d}",
+                         rng.choice(COLORS), round(price * 0.6, 4), price, rng.choice(SIZES),
+                         round(rng.uniform(100, 12000), 2) if rng.random() < 0.5 else None,
+                         category_id, rng.randint(1, n_models)))
+    conn.executemany("INSERT INTO SalesLT.Product VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", products)
+
+    rows = []
+    for customer_id, (first, last) in enumerate(names, start=1):
+        rows.append((customer_id, 0, rng.choice(["Mr.", "Ms.", None]), first, None, last, None,
+                     f"Company {customer_id}", "adventure-works\\pamela0",
+                     f"{first.lower()}{customer_id}@adventure-works.com", "555-0100",
+                     "hash", "salt", f"guid-{customer_id}", "2008-01-01 00:00:00"))
+    conn.executemany("INSERT INTO SalesLT.Customer VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     rows)
+
+    headers, details = [], []
+    for order_id in range(1, n_orders + 1):
+        headers.append((order_id, rng.randint(1, n_customers), "2008-06-01 00:00:00"))
+        for _ in range(rng.randint(1, 10)):
+            details.append((len(details) + 1, order_id, rng.randint(1, n_products), rng.randint(1, 5),
+                            round(rng.uniform(5, 3500), 4)))
+    conn.executemany("INSERT INTO SalesLT.SalesOrderHeader VALUES (?, ?, ?)", headers)
+    conn.executemany("INSERT INTO SalesLT.SalesOrderDetail VALUES (?, ?, ?, ?, ?)", details)
+    conn.commit()
+    conn.close()
+    return path
+
+
+# primary key columns of the tables change tracking is emulated for, see enable_change_tracking
+CHANGE_TRACKED = {
+    "Product": ("ProductID",),
+    "ProductCategory": ("ProductCategoryID",),
+    "ProductDescription": ("ProductDescriptionID",),
+    "ProductModelProductDescription": ("ProductModelID", "ProductDescriptionID", "Culture"),
+}
+_changetable = re.compile(r"CHANGETABLE\(CHANGES SalesLT\.(\w+), \?\)")
+_min_valid_version = re.compile(r"CHANGE_TRACKING_MIN_VALID_VERSION\(OBJECT_ID\('SalesLT\.\w+'\)\)")
+
+
+def enable_change_tracking(path: str):
+    """
+    Emulate SQL Server change tracking: triggers log every insert, update and delete
+    of the CHANGE_TRACKED tables with their key to `change_log`, whose row ids are
+    the versions CHANGETABLE and CHANGE_TRACKING_CURRENT_VERSION are rewritten to read.
+    """
+    conn = _attach(sqlite3.connect(path), path)
+    conn.execute("CREATE TABLE IF NOT EXISTS SalesLT.change_log ("
+                 "version INTEGER PRIMARY KEY AUTOINCREMENT, table_name TEXT, key1, key2, key3, operation TEXT)")
+    for table, keys in CHANGE_TRACKED.items():
+        for event, operation, row in (("INSERT", "I", "NEW"), ("UPDATE", "U", "NEW"), ("DELETE", "D", "OLD")):
+            values = ", ".join([f"{row}.{key}" for key in keys] + ["NULL"] * (3 - len(keys)))
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS SalesLT.ct_{table}_{operation} AFTER {event} ON {table} "
+                         f"BEGIN INSERT INTO change_log (table_name, key1, key2, key3, operation) "
+                         f"VALUES ('{table}', {values}, '{operation}'); END")
+    conn.commit()
+    conn.close()
+
+
+def _changes(match) -> str:
+    table = match.group(1)
+    columns = ", ".join(f"key{i} AS {key}" for i, key in enumerate(CHANGE_TRACKED[table], start=1))
+    return (f"(SELECT {columns}, operation AS SYS_CHANGE_OPERATION FROM SalesLT.change_log "
+            f"WHERE table_name = '{table}' AND version > ?)")
+
+
+def to_sqlite(sql: str) -> str:
+    """Rewrite the T-SQL constructs used by the query store into their SQLite equivalents."""
+    sql = (sql.replace(list_ids_param, "(SELECT value FROM json_each(?))")
+           .replace(name_pairs_param, "(SELECT json_extract(value, '$[0]') AS FirstName, json_extract(value, '$[1]') AS LastName "
+                                      "FROM json_each(?))"))
+    if "CHANGE" in sql:
+        sql = _changetable.sub(_changes, sql)
+        sql = sql.replace("CHANGE_TRACKING_CURRENT_VERSION()", "(SELECT COALESCE(MAX(version), 0) FROM SalesLT.change_log)")
+        sql = _min_valid_version.sub("0", sql)
+    return sql
+
+
+class PlanCache:
+    """
+    Models the server side plan cache: the first execution of a distinct query
+    text pays `compile_latency` and counts as a compile.
+    """
+
+    def __init__(self, compile_latency: float = 0.0):
+        self.compile_latency = compile_latency
+        self.compiles = 0
+        self.executions = 0
+        self._texts = set()
+        self._lock = threading.Lock()
+
+    def execute(self, sql: str):
+        with self._lock:
+            self.executions += 1
+            compile_needed = sql not in self._texts
+            if compile_needed:
+                self._texts.add(sql)
+                self.compiles += 1
+        if compile_needed:
+            time.sleep(self.compile_latency)
+
+
+class _LatencyCursor:
+    def __init__(self, cursor, rtt: float, plan_cache: PlanCache):
+        self._cursor = cursor
+        self._rtt = rtt
+        self._plan_cache = plan_cache
+        # remaining (description, rows) of a multi statement batch, see nextset
+        self._result_sets = None
+
+    def execute(self, sql, *params):
+        # pyodbc takes parameters positionally, sqlite3 as one sequence
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        time.sleep(self._rtt)
+        self._plan_cache.execute(sql)
+        self._result_sets = None
+        if ";\n" in sql:
+            self._execute_batch(to_sqlite(sql), list(params))
+        else:
+            self._cursor.execute(to_sqlite(sql), params)
+        return self
+
+    def _execute_batch(self, sql: str, params: list):
+        """Run the statements of a batch one by one, as one round trip, and keep their result sets."""
+        self._result_sets = []
+        for statement in sql.split(";\n"):
+            if statement.strip().upper().startswith("SET "):
+                continue
+            n_params = statement.count("?")
+            self._cursor.execute(statement, params[:n_params])
+            params = params[n_params:]
+            if self._cursor.description is not None:
+                self._result_sets.append((self._cursor.description, self._cursor.fetchall()))
+
+    @property
+    def description(self):
+        if self._result_sets is not None:
+            return self._result_sets[0][0] if self._result_sets else None
+        return self._cursor.description
+
+    def fetchmany(self, size: int):
+        if self._result_sets is None:
+            return self._cursor.fetchmany(size)
+        if not self._result_sets:
+            return []
+        rows = self._result_sets[0][1]
+        batch, self._result_sets[0] = rows[:size], (self._result_sets[0][0], rows[size:])
+        return batch
+
+    def nextset(self) -> bool:
+        if not self._result_sets:
+            return False
+        self._result_sets.pop(0)
+        return bool(self._result_sets)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _LatencyConnection:
+    def __init__(self, conn, rtt: float, plan_cache: PlanCache):
+        self._conn = conn
+        self._rtt = rtt
+        self._plan_cache = plan_cache
+
+    def cursor(self):
+        return _LatencyCursor(self._conn.cursor(), self._rtt, self._plan_cache)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def make_connect(path: str, connect_latency: float = 0.0, rtt: float = 0.0, plan_cache: PlanCache = None):
+    """Return a `connect(conn_string)` factory for `ConnectionPool` backed by the database at `path`."""
+    plan_cache = plan_cache or PlanCache()
+
+    def connect(conn_string: str):
+        time.sleep(connect_latency)
+        conn = _attach(sqlite3.connect(path, check_same_thread=False, isolation_level=None), path)
+        return _LatencyConnection(conn, rtt, plan_cache)
+    connect.plan_cache = plan_cache
+    return connect
@@ -17,25 +17,10 @@ from azure.ai.ml.entities import (
     BuildContext
 )
 from azure.identity import DefaultAzureCredential
-import hashlib
 from dotenv import dotenv_values
-import os
-
-def hash_folder(folder_path):
-    """
-    Generate hash for entire folder.
-
-    Returns:
-        hash as string
-    """
-    sha256 = hashlib.sha256()
-    for root, _, files in os.walk(folder_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            with open(file_path, 'rb') as f:
-                file_content = f.read()
-                sha256.update(file_content)
-    return sha256.hexdigest()
+from flow_manifest import build_manifest, print_changes
+
+
 # %%
 if __name__ == "__main__":
 
@@ -56,8 +41,10 @@ if __name__ == "__main__":
     # Register PromptFlow as Model
     model_name = config['MODEL_NAME']
 
-    model_hash = hash_folder(f"{flow_to_execute}")
+    manifest = build_manifest(f"{flow_to_execute}")
+    model_hash = manifest["hash"]
     print("Hash of the folder:", model_hash)
+    print_changes(manifest)
 
     model = Model(
         name=model_name,
@@ -67,6 +54,8 @@ if __name__ == "__main__":
             f"prompt flow deployment"
             ),
         properties={"azureml.promptflow.source_flow_id": flow_to_execute},
+        # compared with the hash of the folder on the next run
+        tags={"model_hash": model_hash},
     )
 
     try:
@@ -77,11 +66,11 @@ if __name__ == "__main__":
         m_hash = dict(model_info.tags).get("model_hash")
         if m_hash is not None:
             if m_hash != model_hash:
-                ml_client.models.create_or_update(model)
+                model_info = ml_client.models.create_or_update(model)
         else:
-            ml_client.models.create_or_update(model)
+            model_info = ml_client.models.create_or_update(model)
     except Exception:
-        ml_client.models.create_or_update(model)
+        model_info = ml_client.models.create_or_update(model)
 
     # Create the endpoint
     endpoint = ManagedOnlineEndpoint(
@@ -100,7 +89,7 @@ if __name__ == "__main__":
     #                                name="promptflow-sql",
     #                                 inference_config={
     #                                     "liveness_route": {"path": "/health", "port": "8080"},
-    #                                     "readiness_route": {"path": "/health", "port": "8080"},
+    #                                     "readiness_route": {"path": "/ready", "port": "8080"},
     #                                     "scoring_route": {"path": "/score", "port": "8080"},
     #                                 })
 
@@ -109,10 +98,12 @@ if __name__ == "__main__":
     #                                name="promptflow-sql",
     #                                 inference_config={
     #                                     "liveness_route": {"path": "/health", "port": "8080"},
-    #                                     "readiness_route": {"path": "/health", "port": "8080"},
+    #                                     "readiness_route": {"path": "/ready", "port": "8080"},
     #                                     "scoring_route": {"path": "/score", "port": "8080"},
     #                                 }))
                                 
+    # the readiness route of the environment's inference_config is /ready on the scoring port, which
+    # each gunicorn worker answers once its warm-up of promptflow/warmup.py finished, see promptflow/serving.py
     env_docker_conda=ml_client.environments.get("promptflow-sql", version="10")
 
     #ml_client.environments.create_or_update(env_docker_conda)
@@ -141,7 +132,7 @@ if __name__ == "__main__":
     #                         name="promptflow-sql",
     #                         inference_config={
     #                                 "liveness_route": {"path": "/health", "port": "8080"},
-    #                                 "readiness_route": {"path": "/health", "port": "8080"},
+    #                                 "readiness_route": {"path": "/ready", "port": "8080"},
     #                                 "scoring_route": {"path": "/score", "port": "8080"},
     #                         })
 
@@ -156,9 +147,12 @@ if __name__ == "__main__":
         instance_count=1,
         environment_variables={
             "PROMPTFLOW_RUN_MODE" : "serving",
-            "PROMPTFLOW_CONNECTION_PROVIDER": f"azureml://subscriptions/{config['SUBSCRIPTION_ID']}/resourceGroups/{config['AZUREML_RESOURCE_GROUP']}/providers/Microsoft.MachineLearningServices/workspaces/{config['AZUREML_WORKSPACE']}"
+            "PROMPTFLOW_CONNECTION_PROVIDER": f"azureml://subscriptions/{config['SUBSCRIPTION_ID']}/resourceGroups/{config['AZUREML_RESOURCE_GROUP']}/providers/Microsoft.MachineLearningServices/workspaces/{config['AZUREML_WORKSPACE']}",
+            "FLOW_WARMUP": "1",
         },
         app_insights_enabled=True,
+        # also bounds a streamed answer (Accept: text/event-stream, see score_client.py), which only
+        # shows its first tokens sooner
         request_settings=OnlineRequestSettings(
             request_timeout_ms=90000
         ),
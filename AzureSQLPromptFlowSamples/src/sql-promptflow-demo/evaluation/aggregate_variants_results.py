@@ -1,31 +1,57 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
+from itertools import chain
 from typing import List
 from promptflow.core import tool, log_metric
 import numpy as np
+from streaming_metrics import PERCENTILES, StreamingMetric, as_floats
 
 
+def _log(aggregate_results: dict, name: str, value: float, unit: str = ""):
+    aggregate_results[name] = round(value, 2)
+    log_metric(name + unit, aggregate_results[name])
+
+
+def _log_metric(aggregate_results: dict, name: str, metric: StreamingMetric, suffix: str = ""):
+    summary = metric.summary()
+    if 'pass_rate' in name:
+        # rates are logged in percent, with their confidence interval
+        _log(aggregate_results, f"{name}{suffix}", summary['mean'] * 100.0, "(%)")
+        _log(aggregate_results, f"{name}{suffix}_ci95_low", summary['ci95_low'] * 100.0, "(%)")
+        _log(aggregate_results, f"{name}{suffix}_ci95_high", summary['ci95_high'] * 100.0, "(%)")
+        return
+    _log(aggregate_results, f"{name}{suffix}", summary['mean'])
+    for stat in [f'p{q}' for q in PERCENTILES] + ['ci95_low', 'ci95_high', 'std']:
+        _log(aggregate_results, f"{name}{suffix}_{stat}", summary[stat])
+
+
+# `variants` optionally labels each line, e.g. with the prompt variant that produced the answer;
+# with more than one label every metric is also logged per label as <metric>.<label>
 @tool
-def aggregate_variants_results(results: List[dict]):
+def aggregate_variants_results(results: List[dict], cache_hits: List[bool] = None, variants: List[str] = None):
+    metrics = {}
+    per_variant = {}
+    labels = np.asarray(variants, dtype=object) if variants is not None and len(set(variants)) > 1 else None
+    # each metric is converted and folded in as one column, a line without it counts as missing
+    for name in dict.fromkeys(chain.from_iterable(results)):
+        values = as_floats([result.get(name) for result in results])
+        metrics[name] = StreamingMetric()
+        metrics[name].update(values)
+        if labels is not None:
+            for label in dict.fromkeys(labels):
+                per_variant[(name, label)] = StreamingMetric()
+                per_variant[(name, label)].update(values[labels == label])
+
     aggregate_results = {}
-    for result in results:
-        for name, value in result.items():
-            if name not in aggregate_results.keys():
-                aggregate_results[name] = []
-            try:
-                float_val = float(value)
-            except Exception:
-                float_val = np.nan
-            aggregate_results[name].append(float_val)
-
-    for name, value in aggregate_results.items():
-        metric_name = name
-        aggregate_results[name] = np.nanmean(value)
-        if 'pass_rate' in metric_name:
-            metric_name = metric_name + "(%)"
-            aggregate_results[name] = aggregate_results[name] * 100.0
-        aggregate_results[name] = round(aggregate_results[name], 2)
-        log_metric(metric_name, aggregate_results[name])
+    for name, metric in metrics.items():
+        _log_metric(aggregate_results, name, metric)
+    for (name, variant), metric in sorted(per_variant.items()):
+        _log_metric(aggregate_results, name, metric, suffix=f".{variant}")
+
+    # share of groundedness judgments served from the judgment cache in this run
+    if cache_hits:
+        aggregate_results['judgment_cache_hit_rate'] = round(sum(map(bool, cache_hits)) / len(cache_hits) * 100.0, 2)
+        log_metric('judgment_cache_hit_rate(%)', aggregate_results['judgment_cache_hit_rate'])
 
     return aggregate_results
@@ -5,6 +5,8 @@ from promptflow.core import tool
 import numpy as np
 import re
 
+_digit_re = re.compile(r'\d')
+
 
 @tool
 def concat_results(groundesness_score: str):
@@ -15,7 +17,7 @@ def concat_results(groundesness_score: str):
     for item in load_list:
         try:
             score = item["score"]
-            match = re.search(r'\d', score)
+            match = _digit_re.search(score)
             if match:
                 score = match.group()
             score = float(score)
@@ -0,0 +1,64 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import os
+import re
+import threading
+
+import jinja2
+from openai import AzureOpenAI
+from promptflow.core import tool
+from promptflow.connections import AzureOpenAIConnection
+from judgment_cache import JUDGMENT_CACHE, get_cache, judgment_key, sha256
+
+TEMPLATE = "groundedness_score.jinja2"
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), TEMPLATE), encoding="utf-8") as f:
+    _template_source = f.read()
+# rendered the way promptflow renders the prompt of an llm node
+_template = jinja2.Template(_template_source, trim_blocks=True, keep_trailing_newline=True)
+_template_sha = sha256(_template_source)
+_role = re.compile(r"^\s*#?\s*(system|user|assistant)\s*:\s*$", re.IGNORECASE | re.MULTILINE)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def parse_chat(prompt: str) -> list:
+    """Split a rendered chat template ("System:", "User:" ... lines) into messages."""
+    parts = _role.split(prompt)
+    return [{"role": role.lower(), "content": content.strip()}
+            for role, content in zip(parts[1::2], parts[2::2]) if content.strip()]
+
+
+def _client(connection: AzureOpenAIConnection) -> AzureOpenAI:
+    key = (connection.api_base, connection.api_key, connection.api_version)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = AzureOpenAI(azure_endpoint=connection.api_base, api_key=connection.api_key,
+                                                 api_version=connection.api_version)
+    return client
+
+
+# Replaces the groundedness_score llm node: the rendered prompt is looked up in the judgment
+# cache first, see judgment_cache.py. `output` is what the llm node returned, `cache_hit`
+# feeds the hit rate metric of aggregate_variants_results.
+@tool
+def groundedness_score(question: str, context: str, answer: str, connection: AzureOpenAIConnection,
+                       deployment_name: str, model: str = "", temperature: float = 0.0, max_tokens: int = 256) -> dict:
+    prompt = _template.render(question=question, context=context, answer=answer)
+    # every request parameter that changes the completion is part of the key
+    params = {"temperature": float(temperature), "max_tokens": int(max_tokens)}
+    key = judgment_key(prompt, deployment_name, model, params)
+    cache = get_cache() if JUDGMENT_CACHE else None
+    output = cache.get(key) if cache is not None else None
+    if output is not None:
+        return {'output': output, 'cache_hit': True}
+
+    response = _client(connection).chat.completions.create(model=deployment_name, messages=parse_chat(prompt),
+                                                           **params)
+    output = response.choices[0].message.content
+    if cache is not None and output is not None:
+        cache.put(key, output, TEMPLATE, _template_sha, deployment_name, model)
+    return {'output': output, 'cache_hit': False}
@@ -0,0 +1,153 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Persistent cache of LLM judgments for the evaluation flow.
+
+A judgment is keyed on the SHA-256 of the rendered prompt, the deployment, the
+model and the request parameters that change the completion (temperature,
+max_tokens...), so a rerun over unchanged (question, context, answer) triples reuses
+the earlier output instead of calling the model again. Entries live in a SQLite
+file under JUDGMENT_CACHE_DIR, safe to share between the worker processes of a
+batch run; JUDGMENT_CACHE=0 turns the cache off. It defaults to the user cache
+directory, outside the flow folder, so the cache is not uploaded with the flow.
+
+Each entry also records the hash of the prompt template it was rendered from,
+so entries of an older template can be purged after the template changes:
+
+    python judgment_cache.py stats
+    python judgment_cache.py purge --stale groundedness_score.jinja2
+    python judgment_cache.py purge --deployment gpt-4-32k
+    python judgment_cache.py purge --all
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+JUDGMENT_CACHE = os.environ.get("JUDGMENT_CACHE", "1") == "1"
+JUDGMENT_CACHE_DIR = os.environ.get("JUDGMENT_CACHE_DIR", os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "sql-promptflow-demo", "judgment_cache"))
+
+_schema = """CREATE TABLE IF NOT EXISTS judgments (
+                key TEXT PRIMARY KEY,
+                template TEXT NOT NULL,
+                template_sha TEXT NOT NULL,
+                deployment TEXT NOT NULL,
+                model TEXT NOT NULL,
+                output TEXT NOT NULL,
+                created_at REAL NOT NULL)"""
+
+
+def sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def judgment_key(prompt: str, deployment: str, model: str, params: dict = None) -> str:
+    """Key of the judgment of `prompt`; `params` are the other arguments of the completion request."""
+    return sha256("\x1f".join((deployment, model or "", json.dumps(params or {}, sort_keys=True), prompt)))
+
+
+class JudgmentCache:
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(_schema)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # several batch run workers may write at once, wait for the lock instead of failing
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+        return conn
+
+    def get(self, key: str):
+        row = self._connect().execute("SELECT output FROM judgments WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, output: str, template: str, template_sha: str, deployment: str, model: str):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO judgments VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (key, template, template_sha, deployment, model or "", output, time.time()))
+
+    def stats(self) -> list:
+        """(template, template_sha, deployment, model, entries) per group of entries."""
+        return self._connect().execute(
+            "SELECT template, template_sha, deployment, model, count(*) FROM judgments "
+            "GROUP BY template, template_sha, deployment, model ORDER BY template, deployment, model").fetchall()
+
+    def purge(self, template: str = None, keep_template_sha: str = None, deployment: str = None,
+              model: str = None) -> int:
+        """
+        Delete the entries matching every given filter, all entries when none is
+        given; `keep_template_sha` keeps the entries of `template` rendered from
+        that template version. Returns the number of entries deleted.
+        """
+        clauses, params = [], []
+        if template is not None:
+            clauses.append("template = ?")
+            params.append(template)
+        if keep_template_sha is not None:
+            clauses.append("template_sha != ?")
+            params.append(keep_template_sha)
+        if deployment is not None:
+            clauses.append("deployment = ?")
+            params.append(deployment)
+        if model is not None:
+            clauses.append("model = ?")
+            params.append(model)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM judgments" + where, params).rowcount
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(path: str = None) -> JudgmentCache:
+    path = path or os.path.join(JUDGMENT_CACHE_DIR, "judgments.sqlite")
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = JudgmentCache(path)
+    return cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or purge the judgment cache of the evaluation flow.")
+    parser.add_argument("--path", help="cache file, defaults to judgments.sqlite in JUDGMENT_CACHE_DIR")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="entries per template version, deployment and model")
+    purge = commands.add_parser("purge", help="delete entries after a model or prompt change")
+    purge.add_argument("--stale", metavar="TEMPLATE",
+                       help="delete the entries of this template rendered from an older version of it")
+    purge.add_argument("--deployment")
+    purge.add_argument("--model")
+    purge.add_argument("--all", action="store_true", help="delete every entry")
+    args = parser.parse_args()
+
+    cache = get_cache(args.path)
+    if args.command == "stats":
+        for template, template_sha, deployment, model, entries in cache.stats():
+            print(f"{template} {template_sha[:12]} {deployment} {model or '-'} {entries}")
+    else:
+        filters = {}
+        if args.stale:
+            with open(args.stale, encoding="utf-8") as f:
+                filters = {'template': os.path.basename(args.stale), 'keep_template_sha': sha256(f.read())}
+        if args.deployment:
+            filters['deployment'] = args.deployment
+        if args.model:
+            filters['model'] = args.model
+        if not filters and not args.all:
+            parser.error("purge needs --stale, --deployment, --model or --all")
+        print(f"purged {cache.purge(**filters)} entries")
@@ -0,0 +1,147 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Streaming aggregation of per-line evaluation metrics in constant memory.
+
+`StreamingMetric.update` folds in a whole column of values, converted to one
+NumPy array at once; `StreamingMetric.add` buffers single values in chunks and
+folds each full chunk in the same way. Count, mean and variance are merged with
+Chan's parallel form of Welford's algorithm, and a uniform reservoir (algorithm R) of at most
+METRIC_RESERVOIR_SIZE values keeps the sample that percentiles and bootstrap
+confidence intervals are computed from. Both are exact as long as the values fit in the
+reservoir. Values that are not numbers are counted as missing, the way
+np.nanmean skipped them.
+"""
+
+import math
+import os
+
+import numpy as np
+
+METRIC_RESERVOIR_SIZE = int(os.environ.get("METRIC_RESERVOIR_SIZE", "100000"))
+METRIC_BOOTSTRAP_SAMPLES = int(os.environ.get("METRIC_BOOTSTRAP_SAMPLES", "1000"))
+PERCENTILES = (50, 90, 95)
+CONFIDENCE = 0.95
+# values buffered by `add` per vectorized update
+_CHUNK = 4096
+
+
+def _float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def as_floats(values) -> np.ndarray:
+    """`values` as a float64 array, NaN where a value is not a number, converted in one go when possible."""
+    try:
+        array = np.asarray(values, dtype=np.float64)
+        if array.ndim == 1:
+            return array
+    except (TypeError, ValueError):
+        pass
+    # strings that are not numbers, or objects NumPy does not convert
+    import pandas as pd
+    try:
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array([_float(value) for value in values], dtype=np.float64)
+
+
+class StreamingMetric:
+    __slots__ = ('count', 'missing', 'mean', '_m2', '_buffer', '_size', '_reservoir', '_rng')
+
+    def __init__(self, reservoir_size: int = METRIC_RESERVOIR_SIZE, seed: int = 0):
+        self.count = 0
+        self.missing = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._buffer = []
+        self._size = reservoir_size
+        # grown on demand up to reservoir_size, small runs stay small
+        self._reservoir = np.empty(0, dtype=np.float64)
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, value):
+        self._buffer.append(_float(value))
+        if len(self._buffer) == _CHUNK:
+            self._flush()
+
+    def update(self, values):
+        """Fold in a column of values at once."""
+        self._flush()
+        self._fold(as_floats(values))
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        chunk = np.array(self._buffer, dtype=np.float64)
+        self._buffer.clear()
+        self._fold(chunk)
+
+    def _fold(self, chunk: np.ndarray):
+        values = chunk[~np.isnan(chunk)]
+        self.missing += len(chunk) - len(values)
+        n = len(values)
+        if n == 0:
+            return
+        mean = values.mean()
+        total = self.count + n
+        delta = mean - self.mean
+        self._m2 += ((values - mean) ** 2).sum() + delta * delta * self.count * n / total
+        self.mean += delta * n / total
+
+        size = self._size
+        fill = max(0, min(n, size - self.count))
+        if self.count + fill > len(self._reservoir):
+            reservoir = np.empty(min(size, max(2 * len(self._reservoir), self.count + fill)), dtype=np.float64)
+            reservoir[:self.count] = self._reservoir[:self.count]
+            self._reservoir = reservoir
+        self._reservoir[self.count:self.count + fill] = values[:fill]
+        if fill < n:
+            # algorithm R: the t-th value replaces a random slot with probability size / t
+            seen = np.arange(self.count + fill + 1, total + 1)
+            slots = (self._rng.random(len(seen)) * seen).astype(np.int64)
+            keep = slots < size
+            self._reservoir[slots[keep]] = values[fill:][keep]
+        self.count = total
+
+    def sample(self) -> np.ndarray:
+        self._flush()
+        return self._reservoir[:min(self.count, self._size)]
+
+    @property
+    def std(self) -> float:
+        self._flush()
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    def percentile(self, q: float) -> float:
+        sample = self.sample()
+        return float(np.percentile(sample, q)) if len(sample) else math.nan
+
+    def bootstrap_ci(self, confidence: float = CONFIDENCE, samples: int = METRIC_BOOTSTRAP_SAMPLES,
+                     seed: int = 0) -> tuple:
+        """
+        Bootstrap confidence interval of the mean. Resamples are drawn as counts of
+        the distinct values, so the cost does not grow with the number of values.
+        """
+        sample = self.sample()
+        if len(sample) == 0:
+            return math.nan, math.nan
+        values, counts = np.unique(sample, return_counts=True)
+        draws = np.random.default_rng(seed).multinomial(self.count, counts / counts.sum(), size=samples)
+        means = draws @ values / self.count
+        tail = (1 - confidence) / 2 * 100
+        low, high = np.percentile(means, [tail, 100 - tail])
+        return float(low), float(high)
+
+    def summary(self) -> dict:
+        self._flush()
+        mean = float(self.mean) if self.count else math.nan
+        summary = {'mean': mean, 'count': self.count, 'missing': self.missing, 'std': self.std}
+        for q in PERCENTILES:
+            summary[f'p{q}'] = self.percentile(q)
+        summary['ci95_low'], summary['ci95_high'] = self.bootstrap_ci()
+        return summary
@@ -0,0 +1,174 @@
+"""
+Content hash of a flow folder, used by deploy_sdk.py to skip registering and
+deploying a model that did not change.
+
+The hash covers the sorted relative paths of the files with the sha256 of their
+content, so it does not depend on the order the file system lists them in, and
+moving or renaming a file changes it. Files matching the ignore rules (byte code,
+promptflow run logs, the patterns of the folder's .amlignore) are left out.
+Files are read in FLOW_MANIFEST_CHUNK sized blocks on a thread pool, hashlib
+releases the GIL while hashing. The size, mtime and sha256 of every file are
+kept in FLOW_MANIFEST_DIR, an unchanged file is not read again and the files
+added, removed or modified since the last run are reported.
+
+    python flow_manifest.py promptflow
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+FLOW_MANIFEST_DIR = os.environ.get("FLOW_MANIFEST_DIR",
+                                   os.path.join(os.path.dirname(os.path.abspath(__file__)), ".flow_manifest"))
+FLOW_MANIFEST_CHUNK = int(os.environ.get("FLOW_MANIFEST_CHUNK", str(1 << 20)))
+FLOW_MANIFEST_WORKERS = int(os.environ.get("FLOW_MANIFEST_WORKERS", str(min(32, (os.cpu_count() or 1) * 2))))
+
+# patterns with a slash match paths relative to the folder, the others file and directory names
+DEFAULT_IGNORE = ("__pycache__", "*.pyc", "*.pyo", ".git", ".ipynb_checkpoints", ".DS_Store", ".runs",
+                  ".promptflow/flow.log", ".promptflow/flow.detail.json", ".promptflow/lkg_sources", ".amlignore")
+
+# mtimes closer than this to the time the cache was saved are not trusted, the file
+# may have been written again within the resolution of the file system clock
+_RACY_NS = 2 * 10**9
+
+
+def ignore_patterns(folder: str) -> list:
+    """DEFAULT_IGNORE and the patterns of `folder`/.amlignore, the file Azure ML skips uploads by."""
+    patterns = list(DEFAULT_IGNORE)
+    try:
+        with open(os.path.join(folder, ".amlignore"), encoding="utf-8") as f:
+            patterns += [line.strip().strip("/") for line in f if line.strip() and not line.startswith("#")]
+    except FileNotFoundError:
+        pass
+    return patterns
+
+
+def _matcher(patterns: list):
+    """
+    Predicate on (relative path, name). Patterns with a slash match the relative
+    path, the others the name; the directories above were checked on the way down.
+    """
+    def regex(pats):
+        return re.compile("|".join(fnmatch.translate(p) for p in pats)) if pats else None
+    by_path = regex([p for p in patterns if "/" in p])
+    by_name = regex([p for p in patterns if "/" not in p])
+    return lambda relpath, name: bool((by_name and by_name.match(name)) or (by_path and by_path.match(relpath)))
+
+
+def list_files(folder: str, patterns: list = None) -> list:
+    """Sorted relative paths, with forward slashes, of the files of `folder` not ignored."""
+    ignored = _matcher(ignore_patterns(folder) if patterns is None else patterns)
+    files = []
+    for root, dirs, names in os.walk(folder):
+        rel_root = os.path.relpath(root, folder).replace(os.sep, "/")
+        rel_root = "" if rel_root == "." else rel_root + "/"
+        dirs[:] = [d for d in dirs if not ignored(rel_root + d, d)]
+        files += [rel_root + name for name in names if not ignored(rel_root + name, name)]
+    return sorted(files)
+
+
+def hash_file(path: str, chunk: int = FLOW_MANIFEST_CHUNK) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _cache_path(folder: str, cache_dir: str) -> str:
+    name = hashlib.sha256(os.path.abspath(folder).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{os.path.basename(os.path.abspath(folder))}-{name}.json")
+
+
+def build_manifest(folder: str, cache_dir: str = FLOW_MANIFEST_DIR, patterns: list = None,
+                   workers: int = FLOW_MANIFEST_WORKERS) -> dict:
+    """
+    Hash the files of `folder`. Returns the folder `hash`, the sha256 of each file in
+    `files`, the `added`, `removed` and `modified` paths since the last run with the
+    same `cache_dir`, and how many files were `hashed` or taken from the cache.
+    `cache_dir=None` reads every file and keeps nothing.
+    """
+    start = time.perf_counter()
+    cache_file = _cache_path(folder, cache_dir) if cache_dir else None
+    cache = {"saved_ns": 0, "files": {}}
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file, encoding="utf-8") as f:
+                cache = json.load(f)
+        except ValueError:
+            # a torn write, start over
+            pass
+
+    saved_ns = time.time_ns()
+    entries, to_hash = {}, []
+    for relpath in list_files(folder, patterns):
+        st = os.stat(os.path.join(folder, relpath))
+        cached = cache["files"].get(relpath)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns \
+                and st.st_mtime_ns < cache["saved_ns"] - _RACY_NS:
+            entries[relpath] = cached
+        else:
+            entries[relpath] = [st.st_size, st.st_mtime_ns, None]
+            to_hash.append(relpath)
+    if to_hash:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(to_hash)))) as pool:
+            for relpath, digest in zip(to_hash, pool.map(lambda p: hash_file(os.path.join(folder, p)), to_hash)):
+                entries[relpath][2] = digest
+
+    sha256 = hashlib.sha256()
+    for relpath, entry in entries.items():
+        sha256.update(f"{relpath}\0{entry[2]}\n".encode("utf-8"))
+    previous = {relpath: entry[2] for relpath, entry in cache["files"].items()}
+    manifest = {
+        "hash": sha256.hexdigest(),
+        "files": {relpath: entry[2] for relpath, entry in entries.items()},
+        "added": sorted(set(entries) - set(previous)),
+        "removed": sorted(set(previous) - set(entries)),
+        "modified": sorted(p for p in to_hash if p in previous and previous[p] != entries[p][2]),
+        "hashed": len(to_hash),
+        "cached": len(entries) - len(to_hash),
+    }
+    if cache_file:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"saved_ns": saved_ns, "hash": manifest["hash"], "files": entries}, f)
+        os.replace(tmp, cache_file)
+    manifest["seconds"] = time.perf_counter() - start
+    return manifest
+
+
+def print_changes(manifest: dict):
+    for label in ("added", "removed", "modified"):
+        for relpath in manifest[label]:
+            print(f"  {label}: {relpath}")
+
+
+def hash_folder(folder_path, cache_dir: str = FLOW_MANIFEST_DIR):
+    """
+    Generate hash for entire folder.
+
+    Returns:
+        hash as string
+    """
+    return build_manifest(folder_path, cache_dir)["hash"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hash a flow folder and list the files changed since the last run.")
+    parser.add_argument("folder", nargs="?", default="promptflow")
+    parser.add_argument("--no-cache", action="store_true", help="read every file, do not save the manifest")
+    args = parser.parse_args()
+
+    manifest = build_manifest(args.folder, None if args.no_cache else FLOW_MANIFEST_DIR)
+    print_changes(manifest)
+    print(f"{manifest['hash']}  {len(manifest['files'])} files, {manifest['hashed']} hashed, "
+          f"{manifest['cached']} from the cache, {manifest['seconds'] * 1000:.1f} ms")
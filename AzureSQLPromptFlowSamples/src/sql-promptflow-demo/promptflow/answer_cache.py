@@ -0,0 +1,171 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Answer cache in front of the chat node, used by flow.dag.cached.sample.yaml.
+
+An answer is only reused for the same customer records and the same data: the
+entries of a bucket share the fingerprint of the customer records from
+get_customer and the fingerprint of the retrieved documents and chat history.
+Within the bucket, a question matches the cached question with the highest
+cosine similarity of their embeddings, if it is at least
+ANSWER_CACHE_THRESHOLD. A change in the retrieved rows, another customer or
+another chat history is therefore always a miss, only paraphrases of a question
+asked over the same data hit.
+
+Entries expire after ANSWER_CACHE_TTL_S and the least recently used are evicted
+beyond ANSWER_CACHE_SIZE. ANSWER_CACHE=0 bypasses the cache, the flow then
+calls the chat node for every question. Hits, misses and evictions are exported
+with the flow's metrics, see `instrumentation`.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from instrumentation import register_collector
+
+ANSWER_CACHE = os.environ.get("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL_S = float(os.environ.get("ANSWER_CACHE_TTL_S", "3600"))
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+
+def fingerprint(*values) -> str:
+    """sha256 of the canonical JSON of `values`; dict key order does not matter."""
+    data = json.dumps(values, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("bucket", "question", "vector", "answer", "expires_at")
+
+    def __init__(self, bucket, question, vector, answer, expires_at):
+        self.bucket = bucket
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+        self.expires_at = expires_at
+
+
+class AnswerCache:
+    """
+    Answers keyed by (bucket, question). `bucket` is an exact key, the customer and
+    data fingerprints, and `question` is matched by the cosine similarity of its
+    embedding to the questions cached in the bucket.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL_S,
+                 threshold: float = ANSWER_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        # (bucket, question) -> _Entry, least recently used first
+        self._entries = OrderedDict()
+        # bucket -> {question: _Entry}
+        self._buckets = {}
+        self._stats = {"hits": 0, "misses": 0, "near_misses": 0, "stores": 0, "evictions": 0, "expirations": 0}
+
+    @staticmethod
+    def _unit(vector):
+        import numpy as np
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, entry: _Entry):
+        del self._entries[(entry.bucket, entry.question)]
+        questions = self._buckets[entry.bucket]
+        del questions[entry.question]
+        if not questions:
+            del self._buckets[entry.bucket]
+
+    def lookup(self, bucket: tuple, question: str, vector) -> tuple:
+        """(cached answer or None, similarity of the closest cached question or None)."""
+        import numpy as np
+        vector = self._unit(vector)
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._buckets.get(bucket, {}).values())
+            for entry in entries:
+                if entry.expires_at <= now:
+                    self._remove(entry)
+                    self._stats["expirations"] += 1
+            entries = [entry for entry in entries if entry.expires_at > now]
+            if not entries:
+                self._stats["misses"] += 1
+                return None, None
+            similarities = np.stack([entry.vector for entry in entries]) @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self._stats["misses"] += 1
+                self._stats["near_misses"] += 1
+                return None, similarity
+            entry = entries[best]
+            self._entries.move_to_end((bucket, entry.question))
+            self._stats["hits"] += 1
+            return entry.answer, similarity
+
+    def store(self, bucket: tuple, question: str, vector, answer: str):
+        entry = _Entry(bucket, question, self._unit(vector), answer, time.monotonic() + self.ttl)
+        with self._lock:
+            old = self._entries.get((bucket, question))
+            if old is not None:
+                self._remove(old)
+            self._entries[(bucket, question)] = entry
+            self._buckets.setdefault(bucket, {})[question] = entry
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries.values())))
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["buckets"] = len(self._buckets)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_cache = AnswerCache()
+
+
+def get_cache() -> AnswerCache:
+    return _cache
+
+
+def metrics_text() -> str:
+    """Lookups by outcome, stores, evictions and entries of the answer cache in the Prometheus text format."""
+    stats = _cache.stats()
+    lines = ["# HELP answer_cache_lookups_total Answer cache lookups by outcome; near_miss is a miss "
+             "with cached questions over the same data below the similarity threshold.",
+             "# TYPE answer_cache_lookups_total counter",
+             f'answer_cache_lookups_total{{outcome="hit"}} {stats["hits"]}',
+             f'answer_cache_lookups_total{{outcome="miss"}} {stats["misses"] - stats["near_misses"]}',
+             f'answer_cache_lookups_total{{outcome="near_miss"}} {stats["near_misses"]}',
+             "# HELP answer_cache_removals_total Entries evicted beyond ANSWER_CACHE_SIZE or expired.",
+             "# TYPE answer_cache_removals_total counter",
+             f'answer_cache_removals_total{{reason="evicted"}} {stats["evictions"]}',
+             f'answer_cache_removals_total{{reason="expired"}} {stats["expirations"]}',
+             "# HELP answer_cache_stores_total Answers stored.",
+             "# TYPE answer_cache_stores_total counter",
+             f'answer_cache_stores_total {stats["stores"]}',
+             "# HELP answer_cache_entries Answers cached.",
+             "# TYPE answer_cache_entries gauge",
+             f'answer_cache_entries {stats["entries"]}']
+    return "\n".join(lines) + "\n"
+
+
+register_collector(metrics_text)
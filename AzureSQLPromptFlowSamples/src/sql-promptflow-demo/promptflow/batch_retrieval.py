@@ -0,0 +1,139 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Bulk retrieval for batch runs: resolves the retrieval part of many input lines
+at once instead of running the retrieval nodes line by line.
+
+For a group of lines the customers come from the customer index, with one query
+for the names it does not know, all questions are embedded with multi-input
+embeddings requests, the searches run concurrently on the shared HTTP client,
+and orders, products and sales stats are fetched with one query each over the
+ids of the whole group. Rows are then scattered back to their lines, giving
+each line the customer, orders, products and sales_stat the per-line nodes
+would have returned.
+
+`retrieve_file` writes them next to the input columns of a batch run file, for
+flow.dag.batch.sample.yaml, which only runs get_retrieved_documents and chat.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from promptflow.connections import CustomConnection
+import customer_index
+from embedding_cache import generate_embeddings_batch
+from get_product import search_products
+from http_transport import HTTP_MAX_CONCURRENCY
+from sql_executor import execute_sql
+from sql_query_store import query_customer_bulk, query_order_bulk, query_prod_byID, query_sales_stat_bulk
+
+# input lines retrieved together
+BATCH_RETRIEVAL_SIZE = int(os.environ.get("BATCH_RETRIEVAL_SIZE", "500"))
+
+# columns retrieve_file adds to each line
+OUTPUT_COLUMNS = {
+    'customer': 'retrieved_customers',
+    'orders': 'retrieved_orders',
+    'products': 'retrieved_products',
+    'sales_stat': 'retrieved_sales_stat',
+}
+
+
+def _name_key(first_name: str, last_name: str) -> tuple:
+    # Azure SQL compares names case insensitively
+    return first_name.casefold(), last_name.casefold()
+
+
+def _customers(names: list, conn_db: CustomConnection) -> list:
+    found = {}
+    if customer_index.CUSTOMER_INDEX:
+        index = customer_index.get_index(conn_db)
+        for name in set(names):
+            customers = index.lookup(name)
+            if customers:
+                found[name] = customers
+    missing = {name: customer_index.split_name(name) for name in set(names) if name not in found}
+    if missing:
+        pairs = sorted(set(missing.values()))
+        by_pair = {}
+        for record in execute_sql(sql_query=query_customer_bulk, conn_db=conn_db, params=(json.dumps(pairs),)):
+            by_pair.setdefault(_name_key(record['FirstName'], record['LastName']), []).append(record)
+        for name, pair in missing.items():
+            found[name] = by_pair.get(_name_key(*pair), [])
+            if customer_index.CUSTOMER_INDEX:
+                for record in found[name]:
+                    index.add(record)
+                # a close match only for names the database does not know either
+                if not found[name]:
+                    found[name] = index.close_match(name)
+    return [found[name] for name in names]
+
+
+def _search(questions: list, conn: CustomConnection, top_k: int) -> list:
+    # embed every question up front, the searches then hit the embedding cache
+    generate_embeddings_batch(questions, conn)
+    with ThreadPoolExecutor(max_workers=HTTP_MAX_CONCURRENCY) as pool:
+        return list(pool.map(lambda question: search_products(search_text=question, conn=conn, top_k=top_k),
+                             questions))
+
+
+def _execute_or_none(sql_query: str, conn_db: CustomConnection, ids: set):
+    # the per-line nodes return {} when their query fails
+    try:
+        return execute_sql(sql_query=sql_query, conn_db=conn_db, params=(json.dumps(sorted(ids)),))
+    except Exception:
+        return None
+
+
+def retrieve_batch(lines: list, conn: CustomConnection, conn_db: CustomConnection, top_k: int = 5) -> list:
+    """
+    Retrieval results of `lines`, dicts with a customer and a question, in order;
+    each result has the customer, orders, products and sales_stat the nodes of
+    flow.dag.sample.yaml return for that line.
+    """
+    customers = _customers([line['customer'] for line in lines], conn_db)
+    searches = _search([line['question'] for line in lines], conn, top_k)
+    product_ids = [[result['ProductId'] for result in results] for results in searches]
+
+    customer_ids = {c['CustomerID'] for line_customers in customers for c in line_customers}
+    orders = _execute_or_none(query_order_bulk, conn_db, customer_ids)
+    products = _execute_or_none(query_prod_byID, conn_db, {int(i) for ids in product_ids for i in ids})
+    products_by_id = {str(record['ProductID']): record for record in products or ()}
+
+    line_products = []
+    for ids in product_ids:
+        line_products.append([products_by_id[str(i)] for i in ids if str(i) in products_by_id]
+                             if products is not None else {})
+    category_ids = {r['ProductCategoryID'] for records in line_products for r in records}
+    sales_stat = _execute_or_none(query_sales_stat_bulk, conn_db, category_ids)
+
+    results = []
+    for line_customers, records in zip(customers, line_products):
+        ids = {c['CustomerID'] for c in line_customers}
+        categories = {r['ProductCategoryID'] for r in records}
+        results.append({
+            'customer': line_customers,
+            'orders': [{k: v for k, v in row.items() if k != 'CustomerID'}
+                       for row in orders if row['CustomerID'] in ids] if orders is not None else {},
+            'products': records,
+            'sales_stat': [{k: v for k, v in row.items() if k != 'ProductCategoryID'}
+                           for row in sales_stat if row['ProductCategoryID'] in categories]
+                          if sales_stat is not None else {},
+        })
+    return results
+
+
+def retrieve_file(data_path: str, output_path: str, conn: CustomConnection, conn_db: CustomConnection,
+                  batch_size: int = BATCH_RETRIEVAL_SIZE, top_k: int = 5) -> int:
+    """Add the retrieval results of every line of the jsonl `data_path` as OUTPUT_COLUMNS; returns the line count."""
+    with open(data_path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    with open(output_path, "w", encoding="utf-8") as f:
+        for start in range(0, len(lines), batch_size):
+            group = lines[start:start + batch_size]
+            for line, retrieved in zip(group, retrieve_batch(group, conn, conn_db, top_k)):
+                line.update({column: retrieved[key] for key, column in OUTPUT_COLUMNS.items()})
+                f.write(json.dumps(line, default=str) + "\n")
+    return len(lines)
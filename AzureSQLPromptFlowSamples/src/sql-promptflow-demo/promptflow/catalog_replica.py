@@ -0,0 +1,218 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+In-memory columnar replica of the product catalog, used by `get_product` and
+`get_sales_stat` instead of a query per turn.
+
+Two snapshots are loaded on first use and reloaded in the background every
+CATALOG_REPLICA_REFRESH_S seconds, the stale replica serving lookups while a
+reload runs. Lookups also poll CHANGE_TRACKING_CURRENT_VERSION() through
+query_cache, at most every SQL_CHANGE_TRACKING_POLL_S seconds: when the version
+moves the replica is dropped and the next lookup loads it again, so a change to
+the change tracked product tables is seen as soon as by the result cache. Sales
+are not change tracked, new sales show up with the timed reloads.
+
+- every row of `prod_detail` with the columns of `query_prod_byID`, sorted by
+  ProductID, looked up with a binary search over an int64 array;
+- the top 5 sold products of every category, ranked by SQL with
+  `query_catalog_sales_stat`, sorted by (category, rank) with the offset of each
+  category, so the rows of a category are a slice.
+
+Each column is a NumPy array. The rows picked by a lookup are converted with
+`rows_to_records`, like the rows of the per-turn queries, so the results are the
+same records in the same order as `query_prod_byID` and `query_sales_stat`
+return. Only those two queries are served from the replica, a flow passing other
+queries in `sql_query_prep` still runs them. CATALOG_REPLICA=0 sends every lookup
+to the database.
+"""
+
+import os
+import threading
+import time
+
+from promptflow.connections import CustomConnection
+import query_cache
+from instrumentation import span
+from sql_executor import execute_sql_rows, rows_to_records, run_blocking
+from sql_query_store import query_catalog_products, query_catalog_sales_stat, query_prod_byID, query_sales_stat
+
+CATALOG_REPLICA = os.environ.get("CATALOG_REPLICA", "1") == "1"
+CATALOG_REPLICA_REFRESH_S = float(os.environ.get("CATALOG_REPLICA_REFRESH_S", "300"))
+
+
+def _columns(rows: list, width: int) -> list:
+    """One NumPy object array per column of `rows`."""
+    import numpy as np
+    columns = []
+    for i in range(width):
+        column = np.empty(len(rows), dtype=object)
+        column[:] = [row[i] for row in rows]
+        columns.append(column)
+    return columns
+
+
+def _ids(values) -> list:
+    """Distinct ids of `values` in ascending order; None is skipped like a NULL in an IN list."""
+    return sorted({int(value) for value in values if value is not None})
+
+
+class CatalogReplica:
+
+    def __init__(self, product_columns: list, product_rows: list, sales_columns: list, sales_rows: list):
+        import numpy as np
+        id_at = product_columns.index('ProductID')
+        product_rows = sorted(product_rows, key=lambda row: row[id_at])
+        self.product_columns = list(product_columns)
+        self._product_ids = np.array([row[id_at] for row in product_rows], dtype=np.int64)
+        self._products = _columns(product_rows, len(product_columns))
+
+        # the last column is ProductCategoryID, the rows come ordered by category and rank
+        self.sales_columns = list(sales_columns[:-1])
+        self._sales_categories = np.array([row[-1] for row in sales_rows], dtype=np.int64)
+        self._sales = _columns(sales_rows, len(self.sales_columns))
+        self.categories, self._sales_starts = np.unique(self._sales_categories, return_index=True)
+        self._sales_ends = np.append(self._sales_starts[1:], len(sales_rows))
+
+    @property
+    def size(self) -> int:
+        return len(self._product_ids)
+
+    def _records(self, names: list, columns: list, at) -> list:
+        rows = list(zip(*(column[at].tolist() for column in columns))) if len(at) else []
+        return rows_to_records(names, rows)
+
+    def products_by_id(self, product_ids: list) -> list:
+        """The rows of `query_prod_byID` for `product_ids`, by ascending ProductID."""
+        import numpy as np
+        ids = np.array(_ids(product_ids), dtype=np.int64)
+        at = np.searchsorted(self._product_ids, ids)
+        found = at < len(self._product_ids)
+        found[found] = self._product_ids[at[found]] == ids[found]
+        return self._records(self.product_columns, self._products, at[found])
+
+    def sales_stat(self, category_ids: list) -> list:
+        """The rows of `query_sales_stat` for `category_ids`: the top 5 of each category, by category and rank."""
+        import numpy as np
+        ids = np.array(_ids(category_ids), dtype=np.int64)
+        at = np.searchsorted(self.categories, ids)
+        found = at < len(self.categories)
+        found[found] = self.categories[at[found]] == ids[found]
+        at = at[found]
+        rows = [np.arange(start, end) for start, end in zip(self._sales_starts[at], self._sales_ends[at])]
+        return self._records(self.sales_columns, self._sales,
+                             np.concatenate(rows) if rows else np.array([], dtype=np.int64))
+
+
+# seconds before a failed background reload is retried
+_RETRY_S = 30.0
+
+
+class _ReplicaHolder:
+    __slots__ = ('replica', 'lock', 'refreshing', 'refresh_at', 'generation')
+
+    def __init__(self):
+        self.replica = None
+        self.lock = threading.Lock()
+        self.refreshing = False
+        self.refresh_at = 0.0
+        # bumped when the replica is dropped, a reload started before is discarded
+        self.generation = 0
+
+
+_holders = {}
+_holders_lock = threading.Lock()
+
+
+def _load(conn_db: CustomConnection) -> CatalogReplica:
+    with span("catalog_replica_load") as load_span:
+        product_columns, product_rows = execute_sql_rows(query_catalog_products, conn_db)
+        sales_columns, sales_rows = execute_sql_rows(query_catalog_sales_stat, conn_db)
+        load_span.rows = len(product_rows) + len(sales_rows)
+    return CatalogReplica(product_columns, product_rows, sales_columns, sales_rows)
+
+
+def _refresh(holder: _ReplicaHolder, conn_db: CustomConnection):
+    generation = holder.generation
+    try:
+        replica = _load(conn_db)
+        with holder.lock:
+            if holder.generation == generation and holder.replica is not None:
+                holder.replica = replica
+        holder.refresh_at = time.monotonic() + CATALOG_REPLICA_REFRESH_S
+    except Exception:
+        # keep serving the stale replica
+        holder.refresh_at = time.monotonic() + min(_RETRY_S, CATALOG_REPLICA_REFRESH_S)
+    finally:
+        holder.refreshing = False
+
+
+def get_replica(conn_db: CustomConnection) -> CatalogReplica:
+    """
+    Replica of the catalog of `conn_db`, loaded on first use; a stale replica is
+    returned as is while a background thread reloads it.
+    """
+    conn_string = conn_db['CONNECTION-STRING']
+    holder = _holders.get(conn_string)
+    if holder is None:
+        with _holders_lock:
+            holder = _holders.setdefault(conn_string, _ReplicaHolder())
+    replica = holder.replica
+    if replica is None:
+        with holder.lock:
+            if holder.replica is None:
+                holder.replica = _load(conn_db)
+                holder.refresh_at = time.monotonic() + CATALOG_REPLICA_REFRESH_S
+            return holder.replica
+    if time.monotonic() >= holder.refresh_at:
+        with holder.lock:
+            start = not holder.refreshing
+            holder.refreshing = True
+        if start:
+            threading.Thread(target=_refresh, args=(holder, conn_db), daemon=True).start()
+    return replica
+
+
+def clear():
+    with _holders_lock:
+        _holders.clear()
+
+
+def invalidate(conn_string: str):
+    """Drop the replica of the database of `conn_string`, the next lookup loads it again."""
+    holder = _holders.get(conn_string)
+    if holder is not None:
+        with holder.lock:
+            holder.generation += 1
+            holder.replica = None
+
+
+# the product tables are change tracked, follow the watermark of the result cache
+query_cache.register_version_listener(invalidate)
+
+
+def serves(sql_query: str) -> bool:
+    """Whether the replica answers `sql_query`, one of the queries it is a snapshot of."""
+    return CATALOG_REPLICA and sql_query in (query_prod_byID, query_sales_stat)
+
+
+def lookup(sql_query: str, ids: list, conn_db: CustomConnection) -> list:
+    """The rows of `sql_query`, `query_prod_byID` or `query_sales_stat`, for `ids` from the replica."""
+    # drops the replica first when the change tracking version moved
+    query_cache.get_cache().current_version(conn_db)
+    replica = get_replica(conn_db)
+    with span("catalog_lookup") as lookup_span:
+        if sql_query == query_prod_byID:
+            records = replica.products_by_id(ids)
+        else:
+            records = replica.sales_stat(ids)
+        lookup_span.rows = len(records)
+    return records
+
+
+async def lookup_async(sql_query: str, ids: list, conn_db: CustomConnection) -> list:
+    holder = _holders.get(conn_db['CONNECTION-STRING'])
+    if holder is not None and holder.replica is not None and not query_cache.get_cache().poll_due(conn_db):
+        # replica lookups take microseconds, only loads and version polls go to the SQL threads
+        return lookup(sql_query, ids, conn_db)
+    return await run_blocking(lookup, sql_query, ids, conn_db)
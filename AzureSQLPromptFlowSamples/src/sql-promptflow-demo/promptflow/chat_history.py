@@ -0,0 +1,219 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Chat history compaction and per conversation memoization, used by the
+`compact_history` node of the flows.
+
+The client sends the whole `chat_history` with every turn. The last
+CHAT_HISTORY_TURNS turns go to the chat prompt verbatim, older ones are folded
+into a rolling summary, one line per turn with the gist of the question and of
+the answer (first sentence, highlighted terms). The summary is kept per
+conversation and only the turns that left the verbatim window since the last
+turn are folded, so a turn costs the same whatever the length of the
+conversation. When the summary exceeds CHAT_HISTORY_SUMMARY_TOKENS its oldest
+lines are dropped. A history that does not continue the folded one, edited or
+branched by the client, is folded again from the start.
+
+A conversation is identified by the customer and its first question. The
+customer records do not change within a conversation, so with
+CHAT_SESSION_MEMO=1 get_customer fetches them on the first turn and reuses them
+for the following ones. Past orders are not memoized: conversations starting
+the same way share a key, and an order placed meanwhile must show up, the
+result cache keeps them for the TTL of `query_order` only. Conversations idle for
+CHAT_SESSION_TTL_S are forgotten, and the least recently used beyond
+CHAT_SESSIONS.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from context_builder import count_tokens
+from instrumentation import register_collector
+
+CHAT_HISTORY_COMPACTION = os.environ.get("CHAT_HISTORY_COMPACTION", "1") == "1"
+CHAT_HISTORY_TURNS = int(os.environ.get("CHAT_HISTORY_TURNS", "4"))
+CHAT_HISTORY_SUMMARY_TOKENS = int(os.environ.get("CHAT_HISTORY_SUMMARY_TOKENS", "600"))
+CHAT_HISTORY_GIST_WORDS = int(os.environ.get("CHAT_HISTORY_GIST_WORDS", "30"))
+CHAT_SESSION_MEMO = os.environ.get("CHAT_SESSION_MEMO", "1") == "1"
+CHAT_SESSIONS = int(os.environ.get("CHAT_SESSIONS", "1024"))
+CHAT_SESSION_TTL_S = float(os.environ.get("CHAT_SESSION_TTL_S", "1800"))
+
+_bold_re = re.compile(r"\*\*(.+?)\*\*")
+_emphasis_re = re.compile(r"[*`]+")
+_markdown_re = re.compile(r"[#>|]+")
+# sentence ends, not after a title like "Mr."
+_sentence_re = re.compile(r"(?<!\bMr\.)(?<!\bMs\.)(?<!\bDr\.)(?<!\bMrs\.)(?<=[.!?])\s")
+# the greeting the chat prompt asks every answer to start with
+_greeting_re = re.compile(r"^(hello|hi|hey|dear|greetings|good (morning|afternoon|evening))\b", re.IGNORECASE)
+
+
+def _digest(*values) -> str:
+    data = json.dumps(values, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def session_key(customer: str, chat_history: list, question: str) -> str:
+    """Key of the conversation: the customer and the first question, the current one on the first turn."""
+    first = chat_history[0]['inputs']['question'] if chat_history else question
+    return _digest(customer, first)
+
+
+def gist(text: str, words: int = CHAT_HISTORY_GIST_WORDS) -> str:
+    """The first sentence of `text` that is not a greeting, without markdown, cut at `words` words."""
+    text = " ".join(_markdown_re.sub(" ", _emphasis_re.sub("", text or "")).split())
+    sentences = _sentence_re.split(text)
+    sentence = next((s for s in sentences if not _greeting_re.match(s)), sentences[0]).split()
+    return " ".join(sentence[:words]) + (" ..." if len(sentence) > words else "")
+
+
+def summary_line(number: int, turn: dict) -> str:
+    """One line of the summary for the `number`th turn of the conversation."""
+    answer = str(turn.get('outputs', {}).get('answer', ''))
+    line = f"Turn {number}: the user asked \"{gist(turn.get('inputs', {}).get('question', ''))}\", " \
+           f"the answer was \"{gist(answer)}\""
+    terms = list(dict.fromkeys(term.strip() for term in _bold_re.findall(answer)))[:5]
+    if terms:
+        line += f", mentioning {', '.join(terms)}"
+    return line + "."
+
+
+class _Session:
+    __slots__ = ("expires_at", "memo", "folded", "last_turn", "lines", "tokens", "omitted")
+
+    def __init__(self):
+        self.expires_at = 0.0
+        self.memo = {}
+        self.reset()
+
+    def reset(self):
+        # turns folded, digest of the last one, summary lines with their tokens
+        self.folded = 0
+        self.last_turn = None
+        self.lines = []
+        self.tokens = 0
+        self.omitted = 0
+
+
+class ChatSessions:
+    """Rolling summaries and memoized retrieval results by conversation."""
+
+    def __init__(self, max_sessions: int = CHAT_SESSIONS, ttl: float = CHAT_SESSION_TTL_S):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> _Session, least recently used first
+        self._sessions = OrderedDict()
+        self._stats = {"turns_folded": 0, "refolds": 0, "memo_hits": 0, "memo_misses": 0, "evictions": 0}
+
+    def _session(self, key: str) -> _Session:
+        now = time.monotonic()
+        session = self._sessions.get(key)
+        if session is None or session.expires_at <= now:
+            session = self._sessions[key] = _Session()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._stats["evictions"] += 1
+        self._sessions.move_to_end(key)
+        session.expires_at = now + self.ttl
+        return session
+
+    def compact(self, key: str, chat_history: list, keep_turns: int = CHAT_HISTORY_TURNS,
+                summary_tokens: int = CHAT_HISTORY_SUMMARY_TOKENS) -> tuple:
+        """(summary of the turns before the last `keep_turns`, the last `keep_turns` turns)."""
+        fold_to = max(0, len(chat_history) - keep_turns)
+        with self._lock:
+            session = self._session(key)
+            if session.folded > fold_to or (
+                    session.folded and session.last_turn != _digest(chat_history[session.folded - 1])):
+                session.reset()
+                self._stats["refolds"] += 1
+            for number in range(session.folded + 1, fold_to + 1):
+                line = summary_line(number, chat_history[number - 1])
+                session.lines.append((line, count_tokens(line) + 1))
+                session.tokens += session.lines[-1][1]
+            self._stats["turns_folded"] += fold_to - session.folded
+            while session.tokens > summary_tokens and session.lines:
+                session.tokens -= session.lines.pop(0)[1]
+                session.omitted += 1
+            if fold_to > session.folded:
+                session.folded = fold_to
+                session.last_turn = _digest(chat_history[fold_to - 1])
+            lines = [line for line, _ in session.lines]
+            if session.omitted:
+                lines.insert(0, f"({session.omitted} earlier turns left out)")
+        return "\n".join(lines), chat_history[fold_to:]
+
+    def recall(self, key: str, name: str) -> tuple:
+        """(True, value) when `name` was remembered for the conversation `key`, otherwise (False, None)."""
+        with self._lock:
+            memo = self._session(key).memo
+            found = name in memo
+            self._stats["memo_hits" if found else "memo_misses"] += 1
+            return found, memo.get(name)
+
+    def remember(self, key: str, name: str, value):
+        with self._lock:
+            self._session(key).memo[name] = value
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["sessions"] = len(self._sessions)
+        return stats
+
+
+_sessions = ChatSessions()
+
+
+def get_sessions() -> ChatSessions:
+    return _sessions
+
+
+def memoized(session: str, name: str, fn, *args, **kwargs):
+    """`fn(*args, **kwargs)`, computed once per conversation `session`; exceptions are not remembered."""
+    found, value = _sessions.recall(session, name)
+    if not found:
+        value = fn(*args, **kwargs)
+        _sessions.remember(session, name, value)
+    return value
+
+
+async def memoized_async(session: str, name: str, fn, *args, **kwargs):
+    found, value = _sessions.recall(session, name)
+    if not found:
+        value = await fn(*args, **kwargs)
+        _sessions.remember(session, name, value)
+    return value
+
+
+def metrics_text() -> str:
+    """Turns folded into summaries, memo lookups and conversations in the Prometheus text format."""
+    stats = _sessions.stats()
+    lines = ["# HELP chat_history_turns_folded_total Chat history turns folded into a rolling summary.",
+             "# TYPE chat_history_turns_folded_total counter",
+             f'chat_history_turns_folded_total {stats["turns_folded"]}',
+             "# HELP chat_history_refolds_total Summaries folded again from the start for a history that "
+             "did not continue the folded one.",
+             "# TYPE chat_history_refolds_total counter",
+             f'chat_history_refolds_total {stats["refolds"]}',
+             "# HELP chat_session_memo_lookups_total Lookups of memoized customer retrieval by outcome.",
+             "# TYPE chat_session_memo_lookups_total counter",
+             f'chat_session_memo_lookups_total{{outcome="hit"}} {stats["memo_hits"]}',
+             f'chat_session_memo_lookups_total{{outcome="miss"}} {stats["memo_misses"]}',
+             "# HELP chat_sessions Conversations kept.",
+             "# TYPE chat_sessions gauge",
+             f'chat_sessions {stats["sessions"]}']
+    return "\n".join(lines) + "\n"
+
+
+register_collector(metrics_text)
@@ -0,0 +1,20 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from promptflow.core import tool
+from instrumentation import instrument
+import chat_history as history
+
+
+# Splits chat_history into a rolling summary of the older turns and the last turns kept verbatim,
+# see chat_history.py. `session` keys the customer and past orders memoized for the conversation,
+# empty when CHAT_SESSION_MEMO=0.
+@tool
+@instrument
+def compact_history(customer: str, question: str, chat_history: list) -> dict:
+    session = history.session_key(customer, chat_history, question)
+    if history.CHAT_HISTORY_COMPACTION:
+        summary, recent = history.get_sessions().compact(session, chat_history)
+    else:
+        summary, recent = "", chat_history
+    return {"session": session if history.CHAT_SESSION_MEMO else "", "summary": summary, "chat_history": recent}
@@ -0,0 +1,245 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Builds the retrieved context the chat prompt renders from the past orders,
+retrieved products and sales stats.
+
+Products are listed first in search rank order, then orders most recent first,
+then sales stats by category, the top sellers of each category first. Repeated
+orders of a product are collapsed, and columns the prompt does not use and NULLs
+are dropped. The entries are then fitted to a token budget: the top entry of
+each source goes in first, then products, orders and sales stats in that order,
+each source cut at the first entry that no longer fits.
+
+Products are identified by Name (unique in SalesLT.Product). While the entries
+are admitted, a product's Description is only kept on its first admitted entry,
+and a description shared by several products of a model is given once, the
+others saying "same as <product>". Entries only point to and leave out
+descriptions of entries that are in the context.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from instrumentation import register_collector, span
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_DROP_COLUMNS = tuple(c for c in os.environ.get("CONTEXT_DROP_COLUMNS", "ProductID,ProductCategoryID").split(",") if c)
+# tiktoken encoding used to count tokens, an estimate is used when it cannot be loaded
+CONTEXT_TOKENIZER = os.environ.get("CONTEXT_TOKENIZER", "cl100k_base")
+
+SECTIONS = ("products", "orders", "sales_stat")
+
+_encoder = None
+_encoder_loaded = False
+_encoder_lock = threading.Lock()
+_estimate_re = re.compile(r"\d{1,3}|[^\W\d_]+|[^\w\s]")
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        with _encoder_lock:
+            if not _encoder_loaded:
+                try:
+                    import tiktoken
+                    _encoder = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+                except Exception:
+                    # not installed, or the encoding cannot be downloaded
+                    _encoder = None
+                _encoder_loaded = True
+    return _encoder
+
+
+def estimate_tokens(text: str) -> int:
+    """BPE-like estimate: numbers split in groups of 3 digits, words in pieces of up to 4 characters."""
+    return sum(1 + (len(piece) - 1) // 4 for piece in _estimate_re.findall(text))
+
+
+def count_tokens(text: str) -> int:
+    encoder = _get_encoder()
+    if encoder is None:
+        return estimate_tokens(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def _item_tokens(item) -> int:
+    # the template renders each item as {{item}} on its own line
+    return count_tokens(str(item)) + 1
+
+
+@dataclass
+class ContextStats:
+    tokens_before: int = 0
+    tokens_after: int = 0
+    items_before: int = 0
+    items_after: int = 0
+    duplicates: int = 0
+    truncated: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+_totals = {'turns': 0, 'tokens_before': 0, 'tokens_after': 0, 'truncated': 0}
+_totals_lock = threading.Lock()
+
+
+def _as_list(records) -> list:
+    # get_product returns {} when the product lookup fails
+    return records if isinstance(records, list) else []
+
+
+def _compact(record: dict, drop_columns: tuple) -> dict:
+    return {k: v for k, v in record.items() if v is not None and k not in drop_columns}
+
+
+def _collapse_orders(orders: list) -> list:
+    """Merge order lines of the same product, color and size, most recent first, counting them."""
+    merged = OrderedDict()
+    for order in orders:
+        key = (order.get('Name'), order.get('Color'), order.get('Size'))
+        if key in merged:
+            merged[key]['times_ordered'] = merged[key].get('times_ordered', 1) + 1
+        else:
+            merged[key] = dict(order)
+    return list(merged.values())
+
+
+def _sort_sales_stat(sales_stat: list) -> list:
+    """Sales stats by sales count within each category, the categories in the order they come in."""
+    categories = {}
+    for record in sales_stat:
+        categories.setdefault(record.get('Category'), len(categories))
+    return sorted(sales_stat, key=lambda r: (categories[r.get('Category')], -(r.get('sales_count') or 0)))
+
+
+class _Descriptions:
+    """Products and descriptions of the entries admitted to the context so far."""
+
+    def __init__(self):
+        # products whose description was given
+        self.names = set()
+        # description -> first admitted product with it
+        self.first = {}
+
+    def dedupe(self, record: dict) -> dict:
+        """`record` as it goes in after the admitted entries; `record` itself when nothing is left out."""
+        product = record.get('Name')
+        description = record.get('Description')
+        if description is None:
+            return record
+        if product in self.names:
+            return {k: v for k, v in record.items() if k != 'Description'}
+        first = self.first.get(description, product)
+        if first != product:
+            return {**record, 'Description': f"same as {first}"}
+        return record
+
+    def admit(self, record: dict):
+        # orders carry no description, only an entry that gives it counts
+        product = record.get('Name')
+        if product is None or product in self.names or record.get('Description') is None:
+            return
+        self.names.add(product)
+        self.first.setdefault(record['Description'], product)
+
+
+def _fit(sections: dict, token_budget: int, stats: ContextStats) -> dict:
+    """
+    Admit entries by priority until `token_budget` is spent, 0 for no limit, each
+    deduplicated against the entries admitted before it; a source stops at its
+    first entry that does not fit.
+    """
+    kept = {name: [] for name in SECTIONS}
+    closed = set()
+    descriptions = _Descriptions()
+    used = 0
+
+    def admit(name):
+        nonlocal used
+        i = len(kept[name])
+        if name in closed or i >= len(sections[name]):
+            return
+        record = descriptions.dedupe(sections[name][i])
+        cost = _item_tokens(record)
+        if token_budget and used + cost > token_budget:
+            closed.add(name)
+            return
+        descriptions.admit(sections[name][i])
+        stats.duplicates += record is not sections[name][i]
+        used += cost
+        kept[name].append(record)
+
+    for name in SECTIONS:
+        admit(name)
+    for name in SECTIONS:
+        while name not in closed and len(kept[name]) < len(sections[name]):
+            admit(name)
+    stats.truncated = sum(len(items) - len(kept[name]) for name, items in sections.items())
+    stats.tokens_after = used
+    return kept
+
+
+def build_context(orders: list, products: list, sales_stat: list, token_budget: int = None,
+                  drop_columns: tuple = CONTEXT_DROP_COLUMNS):
+    """
+    Return ({'products': [...], 'orders': [...], 'sales_stat': [...]}, ContextStats).
+
+    `products` are expected in search rank order and `orders` most recent first;
+    `token_budget` defaults to CONTEXT_TOKEN_BUDGET, 0 means unlimited.
+    """
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    raw = {'products': _as_list(products), 'orders': _as_list(orders), 'sales_stat': _as_list(sales_stat)}
+    with span("context") as context_span:
+        stats = ContextStats()
+        stats.items_before = sum(len(items) for items in raw.values())
+        stats.tokens_before = sum(_item_tokens(item) for items in raw.values() for item in items)
+
+        sections = {
+            'products': [_compact(r, drop_columns) for r in raw['products']],
+            'orders': [_compact(r, drop_columns) for r in _collapse_orders(raw['orders'])],
+            'sales_stat': [_compact(r, drop_columns) for r in _sort_sales_stat(raw['sales_stat'])],
+        }
+        sections = _fit(sections, token_budget, stats)
+        stats.items_after = sum(len(items) for items in sections.values())
+        for key in ('tokens_before', 'tokens_after', 'duplicates', 'truncated'):
+            context_span.set(key, getattr(stats, key))
+        context_span.set('tokens_saved', stats.tokens_saved)
+    with _totals_lock:
+        _totals['turns'] += 1
+        _totals['tokens_before'] += stats.tokens_before
+        _totals['tokens_after'] += stats.tokens_after
+        _totals['truncated'] += stats.truncated
+    return sections, stats
+
+
+def context_totals() -> dict:
+    with _totals_lock:
+        totals = dict(_totals)
+    totals['tokens_saved'] = totals['tokens_before'] - totals['tokens_after']
+    return totals
+
+
+def metrics_text() -> str:
+    totals = context_totals()
+    return "\n".join([
+        "# HELP flow_context_turns_total Contexts built by get_retrieved_documents.",
+        "# TYPE flow_context_turns_total counter",
+        f"flow_context_turns_total {totals['turns']}",
+        "# HELP flow_context_tokens_total Context tokens before and after dedup and budgeting.",
+        "# TYPE flow_context_tokens_total counter",
+        f'flow_context_tokens_total{{stage="retrieved"}} {totals["tokens_before"]}',
+        f'flow_context_tokens_total{{stage="prompt"}} {totals["tokens_after"]}',
+        "# HELP flow_context_truncated_items_total Entries left out to fit the token budget.",
+        "# TYPE flow_context_truncated_items_total counter",
+        f"flow_context_truncated_items_total {totals['truncated']}",
+    ]) + "\n"
+
+
+register_collector(metrics_text)
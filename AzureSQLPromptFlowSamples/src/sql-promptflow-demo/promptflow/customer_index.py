@@ -0,0 +1,247 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+In-memory customer name index used by `get_customer` instead of a query per turn.
+
+The CustomerID, Title and name columns of SalesLT.Customer are loaded on first
+use and reloaded in the background every CUSTOMER_INDEX_REFRESH_S seconds; the
+stale index keeps serving lookups while a reload runs. Names are normalized
+(case, accents, punctuation) and looked up by the full name, with or without
+the middle name, or by the first and last word, like the original query did.
+All customers sharing the name are returned, as the query did.
+
+A name the index does not know is looked up in the database with
+`query_customer`, which also picks up customers added since the last reload.
+Only when the database does not know it either does the index guess a close
+match, and only when a single customer matches:
+
+- an initial and last name, e.g. "A. Leonetti",
+- Jaccard similarity of the name trigrams of at least CUSTOMER_MATCH_THRESHOLD,
+  for misspellings, with no other name that close.
+
+A customer whose name is close to another one is never given the other's records.
+"""
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+from promptflow.connections import CustomConnection
+from instrumentation import span
+from sql_executor import execute_sql, run_blocking
+from sql_query_store import query_customer, query_customer_index
+
+CUSTOMER_INDEX = os.environ.get("CUSTOMER_INDEX", "1") == "1"
+CUSTOMER_INDEX_REFRESH_S = float(os.environ.get("CUSTOMER_INDEX_REFRESH_S", "300"))
+CUSTOMER_MATCH_THRESHOLD = float(os.environ.get("CUSTOMER_MATCH_THRESHOLD", "0.6"))
+
+_non_word_re = re.compile(r"[\W_]+")
+
+
+def normalize(name: str) -> str:
+    """Lower case, accents and punctuation removed, single spaces: "  José  O'Brien" -> "jose o brien"."""
+    if not name:
+        return ""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return _non_word_re.sub(" ", name.lower()).strip()
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def split_name(customer: str) -> tuple:
+    """(first, last) the way get_customer always split its input: first and last word."""
+    return customer.split()[0], customer.split()[-1]
+
+
+class CustomerIndex:
+
+    def __init__(self, records: list):
+        self.size = len(records)
+        # normalized name -> customers, names are "first last" and "first middle last"
+        self._by_name = {}
+        # normalized last name -> customers, for initials
+        self._by_last = {}
+        self._names = []
+        self._name_grams = []
+        # trigram -> ids of the names containing it
+        self._postings = {}
+        self._customer_ids = set()
+        self._lock = threading.Lock()
+        for record in records:
+            self.add(record)
+
+    def add(self, record: dict):
+        first = normalize(record.get('FirstName'))
+        middle = normalize(record.get('MiddleName'))
+        last = normalize(record.get('LastName'))
+        keys = {f"{first} {last}".strip()}
+        if middle:
+            keys.add(f"{first} {middle} {last}")
+        with self._lock:
+            self._add(record, keys, last)
+
+    def _add(self, record: dict, keys: set, last: str):
+        if record['CustomerID'] in self._customer_ids:
+            return
+        self._customer_ids.add(record['CustomerID'])
+        for key in keys:
+            customers = self._by_name.get(key)
+            if customers is None:
+                customers = self._by_name[key] = []
+                name_id = len(self._names)
+                self._names.append(key)
+                grams = trigrams(key)
+                self._name_grams.append(len(grams))
+                for gram in grams:
+                    self._postings.setdefault(gram, []).append(name_id)
+            customers.append(record)
+        self._by_last.setdefault(last, []).append(record)
+
+    def _by_initial(self, initial: str, last: str) -> list:
+        return [record for record in self._by_last.get(last, ())
+                if normalize(record.get('FirstName')).startswith(initial)]
+
+    def _fuzzy(self, name: str, threshold: float) -> list:
+        grams = trigrams(name)
+        shared = Counter(name_id for gram in grams for name_id in self._postings.get(gram, ()))
+        close = [name_id for name_id, n_shared in shared.items()
+                 if n_shared / (len(grams) + self._name_grams[name_id] - n_shared) >= threshold]
+        # "first last" and "first middle last" of the same customers count once
+        customers = {record['CustomerID']: record for name_id in close for record in self._by_name[self._names[name_id]]}
+        return list(customers.values())
+
+    def lookup(self, customer: str) -> list:
+        """Customers named `customer`, by full name or first and last word; empty when the index has no such name."""
+        name = normalize(customer)
+        if not name:
+            return []
+        words = name.split()
+        return self._by_name.get(name) or self._by_name.get(f"{words[0]} {words[-1]}") or []
+
+    def close_match(self, customer: str, threshold: float = CUSTOMER_MATCH_THRESHOLD) -> list:
+        """
+        The customer an initial and last name or a misspelled `customer` points to,
+        as a list of one; empty when no customer or more than one is that close.
+        """
+        name = normalize(customer)
+        if not name:
+            return []
+        words = name.split()
+        if len(words) > 1 and len(words[0]) == 1:
+            customers = self._by_initial(words[0], words[-1])
+        else:
+            customers = self._fuzzy(name, threshold)
+        return customers if len(customers) == 1 else []
+
+
+# seconds before a failed background reload is retried
+_RETRY_S = 30.0
+
+
+class _IndexHolder:
+    __slots__ = ('index', 'lock', 'refreshing', 'refresh_at')
+
+    def __init__(self):
+        self.index = None
+        self.lock = threading.Lock()
+        self.refreshing = False
+        self.refresh_at = 0.0
+
+
+_holders = {}
+_holders_lock = threading.Lock()
+
+
+def _load(conn_db: CustomConnection) -> CustomerIndex:
+    with span("customer_index_load") as load_span:
+        records = execute_sql(sql_query=query_customer_index, conn_db=conn_db)
+        load_span.rows = len(records)
+    return CustomerIndex(records)
+
+
+def _refresh(holder: _IndexHolder, conn_db: CustomConnection):
+    try:
+        holder.index = _load(conn_db)
+        holder.refresh_at = time.monotonic() + CUSTOMER_INDEX_REFRESH_S
+    except Exception:
+        # keep serving the stale index
+        holder.refresh_at = time.monotonic() + min(_RETRY_S, CUSTOMER_INDEX_REFRESH_S)
+    finally:
+        holder.refreshing = False
+
+
+def get_index(conn_db: CustomConnection) -> CustomerIndex:
+    """
+    Index of the database of `conn_db`, loaded on first use; a stale index is
+    returned as is while a background thread reloads it.
+    """
+    conn_string = conn_db['CONNECTION-STRING']
+    holder = _holders.get(conn_string)
+    if holder is None:
+        with _holders_lock:
+            holder = _holders.setdefault(conn_string, _IndexHolder())
+    if holder.index is None:
+        with holder.lock:
+            if holder.index is None:
+                holder.index = _load(conn_db)
+                holder.refresh_at = time.monotonic() + CUSTOMER_INDEX_REFRESH_S
+        return holder.index
+    if time.monotonic() >= holder.refresh_at:
+        with holder.lock:
+            start = not holder.refreshing
+            holder.refreshing = True
+        if start:
+            threading.Thread(target=_refresh, args=(holder, conn_db), daemon=True).start()
+    return holder.index
+
+
+def clear():
+    with _holders_lock:
+        _holders.clear()
+
+
+def _lookup(index: CustomerIndex, customer: str, close: bool = False) -> list:
+    with span("customer_lookup", match="close" if close else "exact") as lookup_span:
+        customers = index.close_match(customer) if close else index.lookup(customer)
+        lookup_span.set("outcome", "hit" if customers else "miss")
+        lookup_span.rows = len(customers)
+    return customers
+
+
+def find_customer(customer: str, conn_db: CustomConnection) -> list:
+    """
+    Customers named `customer`, from the index when enabled, otherwise or on a
+    miss from the database; a close match of the index only when the database
+    has no such name either.
+    """
+    if CUSTOMER_INDEX:
+        index = get_index(conn_db)
+        customers = _lookup(index, customer)
+        if customers:
+            return customers
+    first_name, last_name = split_name(customer)
+    customers = execute_sql(sql_query=query_customer, conn_db=conn_db, params=(first_name, last_name))
+    if CUSTOMER_INDEX:
+        for record in customers:
+            index.add(record)
+        if not customers:
+            customers = _lookup(index, customer, close=True)
+    return customers
+
+
+async def find_customer_async(customer: str, conn_db: CustomConnection) -> list:
+    holder = _holders.get(conn_db['CONNECTION-STRING'])
+    if CUSTOMER_INDEX and holder is not None and holder.index is not None:
+        # index lookups take microseconds, only the first load and misses go to the SQL threads
+        customers = _lookup(get_index(conn_db), customer)
+        if customers:
+            return customers
+    return await run_blocking(find_customer, customer, conn_db)
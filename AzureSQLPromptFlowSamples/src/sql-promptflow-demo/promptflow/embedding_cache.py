@@ -0,0 +1,306 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Shared Azure OpenAI embeddings client with a two tier embedding cache.
+
+Embeddings are keyed by (deployment, normalized text). The first tier is an in
+process LRU; the optional second tier persists vectors on disk as a memory
+mapped float32 matrix plus a key log, so warm restarts and batch reruns skip
+the API. It is enabled by setting EMBEDDING_CACHE_DIR.
+
+numpy and openai are imported on first use, so importing the flow nodes stays
+cheap for processes that never open the store or call the API.
+"""
+
+import json
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from promptflow.connections import CustomConnection
+from http_transport import LoopLocal, get_http_client, get_async_http_client
+from instrumentation import span
+
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR")
+EMBEDDING_STORE_SIZE = int(os.environ.get("EMBEDDING_STORE_SIZE", "100000"))
+# inputs per embeddings request in generate_embeddings_batch, Azure OpenAI accepts up to 2048
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "256"))
+
+
+def normalize_text(text: str) -> str:
+    """Unicode NFC with whitespace collapsed; case is kept since it can change the embedding."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class PersistentEmbeddingStore:
+    """
+    Fixed capacity on-disk embedding store.
+
+    Vectors live in `vectors.f32`, a (capacity, dim) float32 memmap, and slots are
+    reused oldest first once the store is full. `keys.log` records "slot<TAB>key"
+    lines and is replayed on open, then compacted when it grows past twice the capacity.
+    """
+
+    def __init__(self, path: str, capacity: int = EMBEDDING_STORE_SIZE):
+        self.path = path
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._dim = None
+        self._vectors = None
+        self._slots = {}
+        self._keys = [None] * capacity
+        self._next = 0
+        self._log = None
+        self._log_lines = 0
+        os.makedirs(path, exist_ok=True)
+        self._open()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _open(self):
+        meta = {}
+        if os.path.exists(self._file("meta.json")):
+            with open(self._file("meta.json")) as f:
+                meta = json.load(f)
+        if meta.get("capacity") != self.capacity or not os.path.exists(self._file("vectors.f32")):
+            # layout changed or nothing stored yet, start empty
+            for name in ("vectors.f32", "keys.log"):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            with open(self._file("meta.json"), "w") as f:
+                json.dump({"capacity": self.capacity, "dim": None}, f)
+            return
+
+        import numpy as np
+        self._dim = meta["dim"]
+        self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+",
+                                  shape=(self.capacity, self._dim))
+        if os.path.exists(self._file("keys.log")):
+            with open(self._file("keys.log"), encoding="utf-8") as f:
+                for line in f:
+                    slot, _, key = line.rstrip("\n").partition("\t")
+                    self._assign(int(slot), key)
+                    self._log_lines += 1
+        self._log = open(self._file("keys.log"), "a", encoding="utf-8")
+
+    def _create(self, dim: int):
+        import numpy as np
+        self._dim = dim
+        self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="w+",
+                                  shape=(self.capacity, dim))
+        with open(self._file("meta.json"), "w") as f:
+            json.dump({"capacity": self.capacity, "dim": dim}, f)
+        self._log = open(self._file("keys.log"), "a", encoding="utf-8")
+
+    def _assign(self, slot: int, key: str):
+        old = self._keys[slot]
+        if old is not None and self._slots.get(old) == slot:
+            del self._slots[old]
+        self._keys[slot] = key
+        self._slots[key] = slot
+        self._next = (slot + 1) % self.capacity
+
+    def _compact(self):
+        self._log.close()
+        tmp = self._file("keys.log.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            # oldest first, so replaying the log leaves the next slot where it is now
+            for i in range(self.capacity):
+                slot = (self._next + i) % self.capacity
+                key = self._keys[slot]
+                if key is not None and self._slots.get(key) == slot:
+                    f.write(f"{slot}\t{key}\n")
+        os.replace(tmp, self._file("keys.log"))
+        self._log_lines = len(self._slots)
+        self._log = open(self._file("keys.log"), "a", encoding="utf-8")
+
+    def get(self, key: str):
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                return None
+            return self._vectors[slot].tolist()
+
+    def put(self, key: str, vector):
+        with self._lock:
+            if self._vectors is None:
+                self._create(len(vector))
+            elif len(vector) != self._dim:
+                raise ValueError(f"Embedding has dimension {len(vector)}, store holds {self._dim}")
+            slot = self._slots.get(key)
+            if slot is not None:
+                self._vectors[slot] = vector
+                self._vectors.flush()
+                return
+            slot = self._next
+            self._vectors[slot] = vector
+            self._vectors.flush()
+            self._assign(slot, key)
+            self._log.write(f"{slot}\t{key}\n")
+            self._log.flush()
+            self._log_lines += 1
+            if self._log_lines > 2 * self.capacity:
+                self._compact()
+
+    def __len__(self):
+        return len(self._slots)
+
+
+class EmbeddingCache:
+    """In-process LRU of embeddings in front of an optional `PersistentEmbeddingStore`."""
+
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE, store: PersistentEmbeddingStore = None):
+        self.max_size = max_size
+        self.store = store
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "store_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def key(deployment: str, text: str) -> str:
+        return f"{deployment}\x1f{normalize_text(text)}"
+
+    def get(self, key: str):
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self._stats["hits"] += 1
+                return vector
+        vector = self.store.get(key) if self.store is not None else None
+        with self._lock:
+            if vector is None:
+                self._stats["misses"] += 1
+            else:
+                self._stats["store_hits"] += 1
+                self._insert(key, vector)
+        return vector
+
+    def put(self, key: str, vector):
+        with self._lock:
+            self._insert(key, vector)
+        if self.store is not None:
+            self.store.put(key, vector)
+
+    def _insert(self, key, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._lru)
+        stats["store_size"] = len(self.store) if self.store is not None else 0
+        lookups = stats["hits"] + stats["store_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["store_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+_cache = EmbeddingCache(store=PersistentEmbeddingStore(EMBEDDING_CACHE_DIR) if EMBEDDING_CACHE_DIR else None)
+_clients = {}
+_clients_lock = threading.Lock()
+_async_clients = LoopLocal(dict)
+
+
+def get_cache() -> EmbeddingCache:
+    return _cache
+
+
+def get_client(conn: CustomConnection):
+    """
+    Return the process-wide AzureOpenAI client for the embeddings endpoint of `conn`.
+
+    Requests go through the shared transport of `http_transport`, which owns
+    retries, so the client's own are turned off.
+    """
+    key = (conn['AZURE_OPENAI_API_EMB_BASE'], conn['AZURE_OPENAI_API_EMB_KEY'], conn['AZURE_OPENAI_API_EMB_VERSION'])
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                from openai import AzureOpenAI
+                client = AzureOpenAI(
+                    azure_endpoint = conn['AZURE_OPENAI_API_EMB_BASE'],
+                    api_key = conn['AZURE_OPENAI_API_EMB_KEY'],
+                    api_version = conn['AZURE_OPENAI_API_EMB_VERSION'],
+                    http_client = get_http_client(),
+                    max_retries = 0,
+                )
+                _clients[key] = client
+    return client
+
+
+def get_async_client(conn: CustomConnection):
+    """Return the AsyncAzureOpenAI client for the embeddings endpoint of `conn` on the running event loop."""
+    key = (conn['AZURE_OPENAI_API_EMB_BASE'], conn['AZURE_OPENAI_API_EMB_KEY'], conn['AZURE_OPENAI_API_EMB_VERSION'])
+    clients = _async_clients.get()
+    client = clients.get(key)
+    if client is None:
+        from openai import AsyncAzureOpenAI
+        client = clients[key] = AsyncAzureOpenAI(
+            azure_endpoint = conn['AZURE_OPENAI_API_EMB_BASE'],
+            api_key = conn['AZURE_OPENAI_API_EMB_KEY'],
+            api_version = conn['AZURE_OPENAI_API_EMB_VERSION'],
+            http_client = get_async_http_client(),
+            max_retries = 0,
+        )
+    return client
+
+
+def generate_embeddings(text, conn: CustomConnection):
+    deployment = conn['AZURE_OPENAI_API_EMB_DEPLOYMENT']
+    key = EmbeddingCache.key(deployment, text)
+    with span("embedding") as embedding_span:
+        embeddings = _cache.get(key)
+        embedding_span.set("cache_hit", embeddings is not None)
+        if embeddings is None:
+            response = get_client(conn).embeddings.create(input=text, model=deployment)
+            embeddings = response.data[0].embedding
+            _cache.put(key, embeddings)
+    return embeddings
+
+
+def generate_embeddings_batch(texts: list, conn: CustomConnection, batch_size: int = EMBEDDING_BATCH_SIZE) -> list:
+    """
+    Embeddings of `texts`, in order. Cached texts are served from the cache and the
+    distinct others are embedded `batch_size` inputs per request, then cached, so
+    later `generate_embeddings` calls for the same texts are hits.
+    """
+    deployment = conn['AZURE_OPENAI_API_EMB_DEPLOYMENT']
+    keys = [EmbeddingCache.key(deployment, text) for text in texts]
+    with span("embedding_batch") as embedding_span:
+        # first text of each key, the one a generate_embeddings call would have sent
+        first_texts = dict(zip(reversed(keys), reversed(texts)))
+        vectors = {key: _cache.get(key) for key in first_texts}
+        missing = [key for key, vector in vectors.items() if vector is None]
+        inputs = [first_texts[key] for key in missing]
+        for start in range(0, len(missing), batch_size):
+            response = get_client(conn).embeddings.create(input=inputs[start:start + batch_size], model=deployment)
+            for item in response.data:
+                key = missing[start + item.index]
+                vectors[key] = item.embedding
+                _cache.put(key, item.embedding)
+        embedding_span.set("cache_misses", len(missing))
+        embedding_span.rows = len(texts)
+    return [vectors[key] for key in keys]
+
+
+async def generate_embeddings_async(text, conn: CustomConnection):
+    deployment = conn['AZURE_OPENAI_API_EMB_DEPLOYMENT']
+    key = EmbeddingCache.key(deployment, text)
+    with span("embedding") as embedding_span:
+        embeddings = _cache.get(key)
+        embedding_span.set("cache_hit", embeddings is not None)
+        if embeddings is None:
+            response = await get_async_client(conn).embeddings.create(input=text, model=deployment)
+            embeddings = response.data[0].embedding
+            _cache.put(key, embeddings)
+    return embeddings
@@ -2,35 +2,19 @@
 # Licensed under the MIT license.
 
 from promptflow.core import tool
+from instrumentation import instrument
 from promptflow.connections import CustomConnection
-
-import pyodbc
-import pandas as pd
-import json
-
-def execute_sql(sql_query: str, conn_db: CustomConnection):
-
-    conn_string = conn_db['CONNECTION-STRING']
-    with pyodbc.connect(conn_string,autocommit=True) as conn:
-        with conn.cursor() as cursor:
-            cursor.execute(sql_query)
-            query_out = cursor.fetchall()
-
-    toReturn = pd.DataFrame((tuple(t) for t in query_out)) 
-    toReturn.columns = [column[0] for column in cursor.description]
-
-    return toReturn
-
+from customer_index import find_customer
+from chat_history import memoized
 
 @tool
-def get_customer(customer: str, conn_db: CustomConnection):
-    first_name = customer.split()[0]
-    last_name = customer.split()[-1]
-    customer_query = f"""select * from [SalesLT].[Customer] 
-                         WHERE FirstName='{first_name}' AND LastName='{last_name}'"""
-
-    out_df = execute_sql(sql_query=customer_query, conn_db=conn_db)
-    out_json = out_df.to_json(orient="records")
-    out_dict = json.loads(out_json)
+@instrument
+def get_customer(customer: str, conn_db: CustomConnection, session: str = ""):
+
+    if session:
+        # the same records for every turn of the conversation, see chat_history.py
+        out_dict = memoized(session, 'customer', find_customer, customer=customer, conn_db=conn_db)
+    else:
+        out_dict = find_customer(customer=customer, conn_db=conn_db)
 
     return out_dict
\ No newline at end of file
@@ -0,0 +1,20 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from promptflow.core import tool
+from instrumentation import instrument
+from promptflow.connections import CustomConnection
+from customer_index import find_customer_async
+from chat_history import memoized_async
+
+# Async variant of get_customer.py for the serving endpoint, see flow.dag.async.sample.yaml
+@tool
+@instrument
+async def get_customer(customer: str, conn_db: CustomConnection, session: str = ""):
+
+    if session:
+        out_dict = await memoized_async(session, 'customer', find_customer_async, customer=customer, conn_db=conn_db)
+    else:
+        out_dict = await find_customer_async(customer=customer, conn_db=conn_db)
+
+    return out_dict
@@ -0,0 +1,24 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from promptflow.core import tool
+from instrumentation import instrument
+from promptflow.connections import CustomConnection
+from query_cache import execute_sql_cached_async
+import json
+
+
+# Async variant of get_pastorders.py for the serving endpoint, see flow.dag.async.sample.yaml
+@tool
+@instrument
+async def get_orders(customer: list, sql_query_prep: dict, conn_db:CustomConnection):
+
+    list_cust_id = list(map(lambda x: x['CustomerID'], customer))
+
+    try:
+        out_dict = await execute_sql_cached_async(sql_query=sql_query_prep['query_order'], conn_db=conn_db,
+                                                  params=(json.dumps(list_cust_id),), policy='query_order')
+    except:
+        out_dict = {}
+
+    return out_dict
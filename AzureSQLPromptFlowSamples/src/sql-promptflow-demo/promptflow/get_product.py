@@ -3,40 +3,32 @@
 
 from promptflow.core import tool
 from promptflow.connections import CustomConnection
-import requests
+from query_cache import execute_sql_cached
+from embedding_cache import generate_embeddings, generate_embeddings_async
+from http_transport import get_http_client, get_async_http_client
+import catalog_replica
+from instrumentation import instrument, span
 import json
-from openai import AzureOpenAI
-import pyodbc
-import pandas as pd
+import os
 
 
-def generate_embeddings(text, conn: CustomConnection):
-    # initiate client
-    client = AzureOpenAI(
-        azure_endpoint = conn['AZURE_OPENAI_API_EMB_BASE'],
-        api_key = conn['AZURE_OPENAI_API_EMB_KEY'],
-        api_version = conn['AZURE_OPENAI_API_EMB_VERSION'],
-    )
-
-    response = client.embeddings.create(input=text, model=conn['AZURE_OPENAI_API_EMB_DEPLOYMENT'])
-    embeddings = response.data[0].embedding
-    return embeddings
-
-def execute_sql(sql_query: str, conn_db: CustomConnection):
-
-    conn_string = conn_db['CONNECTION-STRING']
-    with pyodbc.connect(conn_string,autocommit=True) as conn:
-        with conn.cursor() as cursor:
-            cursor.execute(sql_query)
-            query_out = cursor.fetchall()
-
-    toReturn = pd.DataFrame((tuple(t) for t in query_out)) 
-    toReturn.columns = [column[0] for column in cursor.description]
+def _conn_get(conn: CustomConnection, key: str, default=None):
+    try:
+        return conn[key]
+    except KeyError:
+        return default
 
-    return toReturn
+def _local_index(conn: CustomConnection):
+    """The in-process index when SEARCH_ENGINE=local, otherwise None."""
+    if _conn_get(conn, 'SEARCH_ENGINE', 'remote') != 'local':
+        return None
+    # numpy comes with it, only loaded when the local engine is used
+    import local_search
+    index_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              _conn_get(conn, 'LOCAL_SEARCH_INDEX_PATH', 'local_index'))
+    return local_search.get_index(index_path)
 
-@tool
-def get_product(search_text: str, sql_query_prep: dict, conn: CustomConnection, conn_db: CustomConnection, top_k:int) -> str:
+def _search_request(search_text: str, vector: list, conn: CustomConnection, top_k: int):
     search_service = conn['AZURE_SEARCH_ENDPOINT']#"sqldricopilot"
     index_name =  conn['AZURE_SEARCH_INDEX']#"promptflow-demo-product-description"
     search_key = conn['ACS-SEARCH-KEY']
@@ -53,7 +45,7 @@ def get_product(search_text: str, sql_query_prep: dict, conn: CustomConnection,
         "vectorQueries": [
             {
             "kind": "vector",
-            "vector": generate_embeddings(text = search_text, conn = conn),
+            "vector": vector,
             "fields": "ProductCategoryNameVector, DescriptionVector",
             "k": top_k
             },
@@ -62,18 +54,56 @@ def get_product(search_text: str, sql_query_prep: dict, conn: CustomConnection,
         "select": "ProductId, ProductCategoryName, Name, ProductNumber, Color, ListPrice, Size, ProductCategoryID, ProductModelID, ProductDescriptionID, Description",
         "top": top_k,
     }
-    response = requests.post(
-        f"{search_service}/indexes/{index_name}/docs/search", headers=headers, params=params, json=body)
-    response_json = response.json()['value']
+    return f"{search_service}/indexes/{index_name}/docs/search", headers, params, body
+
+def search_products(search_text: str, conn: CustomConnection, top_k: int) -> list:
+    vector = generate_embeddings(text = search_text, conn = conn)
+    # SEARCH_ENGINE=local serves the query from the exported index in LOCAL_SEARCH_INDEX_PATH
+    index = _local_index(conn)
+    with span("search", engine="remote" if index is None else "local") as search_span:
+        if index is not None:
+            results = index.search(search_text, vector, top_k)
+        else:
+            url, headers, params, body = _search_request(search_text, vector, conn, top_k)
+            response = get_http_client().post(url, headers=headers, params=params, json=body)
+            response.raise_for_status()
+            results = response.json()['value']
+        search_span.rows = len(results)
+    return results
+
+async def search_products_async(search_text: str, conn: CustomConnection, top_k: int) -> list:
+    vector = await generate_embeddings_async(text = search_text, conn = conn)
+    index = _local_index(conn)
+    with span("search", engine="remote" if index is None else "local") as search_span:
+        if index is not None:
+            results = index.search(search_text, vector, top_k)
+        else:
+            url, headers, params, body = _search_request(search_text, vector, conn, top_k)
+            response = await get_async_http_client().post(url, headers=headers, params=params, json=body)
+            response.raise_for_status()
+            results = response.json()['value']
+        search_span.rows = len(results)
+    return results
+
+def order_by_rank(records: list, product_ids: list) -> list:
+    """Sort product rows by the rank of their ProductID in the search results."""
+    rank = {str(product_id): i for i, product_id in enumerate(product_ids)}
+    return sorted(records, key=lambda r: rank.get(str(r.get('ProductID')), len(rank)))
+
+@tool
+@instrument
+def get_product(search_text: str, sql_query_prep: dict, conn: CustomConnection, conn_db: CustomConnection, top_k:int) -> str:
+    response_json = search_products(search_text=search_text, conn=conn, top_k=top_k)
 
     list_prod_id = list(map(lambda x: x['ProductId'], response_json))
-    list_prod_id = str(tuple(list_prod_id)).replace(",)", ")")
-    query_product = sql_query_prep['query_prod_byID'].replace("{list_product}", list_prod_id)
 
     try:
-        out_df = execute_sql(sql_query=query_product, conn_db=conn_db)
-        out_json = out_df.to_json(orient="records")
-        out_dict = json.loads(out_json)
+        if catalog_replica.serves(sql_query_prep['query_prod_byID']):
+            out_dict = catalog_replica.lookup(sql_query_prep['query_prod_byID'], list_prod_id, conn_db)
+        else:
+            out_dict = execute_sql_cached(sql_query=sql_query_prep['query_prod_byID'], conn_db=conn_db,
+                                          params=(json.dumps(list_prod_id),), policy='query_prod_byID')
+        out_dict = order_by_rank(out_dict, list_prod_id)
     except:
         out_dict = {}
 
@@ -0,0 +1,31 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from promptflow.core import tool
+import catalog_replica
+from instrumentation import instrument
+from promptflow.connections import CustomConnection
+from query_cache import execute_sql_cached_async
+from get_product import order_by_rank, search_products_async
+import json
+
+
+# Async variant of get_product.py for the serving endpoint, see flow.dag.async.sample.yaml
+@tool
+@instrument
+async def get_product(search_text: str, sql_query_prep: dict, conn: CustomConnection, conn_db: CustomConnection, top_k:int) -> str:
+    response_json = await search_products_async(search_text=search_text, conn=conn, top_k=top_k)
+
+    list_prod_id = list(map(lambda x: x['ProductId'], response_json))
+
+    try:
+        if catalog_replica.serves(sql_query_prep['query_prod_byID']):
+            out_dict = await catalog_replica.lookup_async(sql_query_prep['query_prod_byID'], list_prod_id, conn_db)
+        else:
+            out_dict = await execute_sql_cached_async(sql_query=sql_query_prep['query_prod_byID'], conn_db=conn_db,
+                                                      params=(json.dumps(list_prod_id),), policy='query_prod_byID')
+        out_dict = order_by_rank(out_dict, list_prod_id)
+    except:
+        out_dict = {}
+
+    return out_dict
@@ -2,35 +2,24 @@
 # Licensed under the MIT license.
 
 from promptflow.core import tool
+import catalog_replica
+from instrumentation import instrument
 from promptflow.connections import CustomConnection
+from query_cache import execute_sql_cached
 import json
-import pyodbc
-import pandas as pd
-
-def execute_sql(sql_query: str, conn_db: CustomConnection):
-
-    conn_string = conn_db['CONNECTION-STRING']
-    with pyodbc.connect(conn_string,autocommit=True) as conn:
-        with conn.cursor() as cursor:
-            cursor.execute(sql_query)
-            query_out = cursor.fetchall()
-
-    toReturn = pd.DataFrame((tuple(t) for t in query_out)) 
-    toReturn.columns = [column[0] for column in cursor.description]
-
-    return toReturn
 
 @tool
+@instrument
 def get_sales_stat(products: list, sql_query_prep: dict, conn_db: CustomConnection):
 
   list_cate_id = list(map(lambda x: x['ProductCategoryID'], products))
-  list_cate_id = str(tuple(list_cate_id)).replace(",)", ")")
-  query_sales_stat = sql_query_prep['query_sales_stat'].replace("{list_cate}", list_cate_id)
 
   try:
-      out_df = execute_sql(sql_query=query_sales_stat, conn_db=conn_db)
-      out_json = out_df.to_json(orient="records")
-      out_dict = json.loads(out_json)
+      if catalog_replica.serves(sql_query_prep['query_sales_stat']):
+          out_dict = catalog_replica.lookup(sql_query_prep['query_sales_stat'], list_cate_id, conn_db)
+      else:
+          out_dict = execute_sql_cached(sql_query=sql_query_prep['query_sales_stat'], conn_db=conn_db,
+                                        params=(json.dumps(list_cate_id),), policy='query_sales_stat')
   except:
       out_dict = {}
 
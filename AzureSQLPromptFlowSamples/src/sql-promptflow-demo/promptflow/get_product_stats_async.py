@@ -0,0 +1,27 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from promptflow.core import tool
+import catalog_replica
+from instrumentation import instrument
+from promptflow.connections import CustomConnection
+from query_cache import execute_sql_cached_async
+import json
+
+# Async variant of get_product_stats.py for the serving endpoint, see flow.dag.async.sample.yaml
+@tool
+@instrument
+async def get_sales_stat(products: list, sql_query_prep: dict, conn_db: CustomConnection):
+
+  list_cate_id = list(map(lambda x: x['ProductCategoryID'], products))
+
+  try:
+      if catalog_replica.serves(sql_query_prep['query_sales_stat']):
+          out_dict = await catalog_replica.lookup_async(sql_query_prep['query_sales_stat'], list_cate_id, conn_db)
+      else:
+          out_dict = await execute_sql_cached_async(sql_query=sql_query_prep['query_sales_stat'], conn_db=conn_db,
+                                                    params=(json.dumps(list_cate_id),), policy='query_sales_stat')
+  except:
+      out_dict = {}
+
+  return out_dict
@@ -0,0 +1,35 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from promptflow.core import tool
+from instrumentation import instrument
+from promptflow.connections import CustomConnection
+from sql_executor import execute_sql_multi
+from customer_index import find_customer
+from get_product import order_by_rank, search_products
+import json
+
+RESULT_SETS = ('orders', 'products', 'sales_stat')
+
+
+# Combined retrieval node, replaces get_customer, get_past_orders, get_product and get_sales_stat:
+# the customer comes from the in-memory customer index and the rest from a single SQL round-trip.
+# Each key of the output feeds the input the separate node used to.
+@tool
+@instrument
+def get_retrieval_batch(customer: str, search_text: str, sql_query_prep: dict, conn: CustomConnection,
+                        conn_db: CustomConnection, top_k: int) -> dict:
+    customers = find_customer(customer=customer, conn_db=conn_db)
+    list_cust_id = json.dumps(list(map(lambda x: x['CustomerID'], customers)))
+
+    response_json = search_products(search_text=search_text, conn=conn, top_k=top_k)
+    product_ids = list(map(lambda x: x['ProductId'], response_json))
+    list_prod_id = json.dumps(product_ids)
+
+    result_sets = execute_sql_multi(sql_batch=sql_query_prep['query_retrieval_batch'], conn_db=conn_db,
+                                    params=(list_cust_id, list_prod_id, list_prod_id))
+
+    out_dict = dict(zip(RESULT_SETS, result_sets))
+    out_dict['customer'] = customers
+    out_dict['products'] = order_by_rank(out_dict['products'], product_ids)
+    return out_dict
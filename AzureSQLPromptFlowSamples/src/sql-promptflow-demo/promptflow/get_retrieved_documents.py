@@ -2,15 +2,21 @@
 # Licensed under the MIT license.
 
 from promptflow.core import tool
+from instrumentation import instrument
+from context_builder import build_context
 
 # The inputs section will change based on the arguments of the tool function, after you save the code
 # Adding type to arguments and return value will help the system show the types properly
 # Please update the function name/signature per need
+# input1: past orders, input2: retrieved products, input3: sales stats. The lists are
+# deduplicated and fitted to token_budget (0 uses CONTEXT_TOKEN_BUDGET), see context_builder.py
 @tool
-def my_python_tool(input1: list, input2: list, input3: list) -> str:
+@instrument
+def my_python_tool(input1: list, input2: list, input3: list, token_budget: int = 0) -> str:
+  context, _ = build_context(orders=input1, products=input2, sales_stat=input3, token_budget=token_budget or None)
   retrieved_documents = {
-                          "User past orders": input1,
-                          "Retrieved relevant products": input2,
-                          "Retrieved product sales stats": input3,
+                          "User past orders": context['orders'],
+                          "Retrieved relevant products": context['products'],
+                          "Retrieved product sales stats": context['sales_stat'],
                         }
   return retrieved_documents
\ No newline at end of file
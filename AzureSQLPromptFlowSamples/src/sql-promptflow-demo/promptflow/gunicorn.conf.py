@@ -0,0 +1,15 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# gunicorn reads this file from the directory it is started in, the flow folder in
+# promptflow's serving image, so these hooks run in every worker of the endpoint.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def post_worker_init(worker):
+    import serving
+    serving.init_worker(worker.wsgi)
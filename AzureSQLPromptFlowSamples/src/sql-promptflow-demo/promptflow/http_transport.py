@@ -0,0 +1,340 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Shared HTTP transport for the Azure AI Search and Azure OpenAI embeddings calls.
+
+`get_http_client` returns a process-wide httpx client and `get_async_http_client`
+one per event loop. Both keep connections alive in a pool and route requests
+through a transport that caps concurrent requests per endpoint, retries 429 and
+5xx responses and connection errors with jittered exponential backoff that
+honors Retry-After, optionally gzips request bodies and records per-endpoint
+latency histograms, exposed in the Prometheus text format by `metrics_text`
+alongside the flow's own metrics (see `instrumentation`).
+"""
+
+import asyncio
+import email.utils
+import gzip
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+import httpx
+from instrumentation import register_collector, span
+
+HTTP_TIMEOUT_S = float(os.environ.get("HTTP_TIMEOUT_S", "30"))
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+# concurrent requests per endpoint (scheme, host and port), extra callers wait
+HTTP_MAX_CONCURRENCY = int(os.environ.get("HTTP_MAX_CONCURRENCY", "16"))
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "4"))
+HTTP_BACKOFF_S = float(os.environ.get("HTTP_BACKOFF_S", "0.5"))
+HTTP_MAX_BACKOFF_S = float(os.environ.get("HTTP_MAX_BACKOFF_S", "30"))
+# gzip request bodies of at least this many bytes, 0 disables; the endpoint must accept Content-Encoding: gzip
+HTTP_COMPRESS_MIN_BYTES = int(os.environ.get("HTTP_COMPRESS_MIN_BYTES", "0"))
+
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+RETRY_ERRORS = (httpx.TransportError,)
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram of one endpoint, in the shape of a Prometheus histogram."""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.statuses = defaultdict(int)
+        self.retries = 0
+
+    def observe(self, seconds: float, status):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.statuses[status] += 1
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the `q` quantile, inf when it falls past the last bucket."""
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if n and seen >= rank:
+                return bound
+        return 0.0
+
+
+_metrics = defaultdict(LatencyHistogram)
+_metrics_lock = threading.Lock()
+
+
+def _record(endpoint: str, seconds: float, status, retried: bool):
+    with _metrics_lock:
+        histogram = _metrics[endpoint]
+        histogram.observe(seconds, status)
+        if retried:
+            histogram.retries += 1
+
+
+def latency_histograms() -> dict:
+    """Snapshot of the per-endpoint histograms, endpoint -> LatencyHistogram."""
+    with _metrics_lock:
+        snapshot = {}
+        for endpoint, histogram in _metrics.items():
+            copy = snapshot[endpoint] = LatencyHistogram(histogram.buckets)
+            copy.counts = list(histogram.counts)
+            copy.sum = histogram.sum
+            copy.statuses = defaultdict(int, histogram.statuses)
+            copy.retries = histogram.retries
+        return snapshot
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def metrics_text() -> str:
+    """The per-endpoint latency histograms, response and retry counters in the Prometheus text format."""
+    lines = [
+        "# HELP http_client_request_duration_seconds Time to response headers per attempt.",
+        "# TYPE http_client_request_duration_seconds histogram",
+    ]
+    histograms = latency_histograms()
+    for endpoint, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, n in zip(histogram.buckets + ("+Inf",), histogram.counts):
+            cumulative += n
+            lines.append(f'http_client_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+        lines.append(f'http_client_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram.sum:.6f}')
+        lines.append(f'http_client_request_duration_seconds_count{{endpoint="{endpoint}"}} {cumulative}')
+    lines += ["# HELP http_client_responses_total Responses per status, 'error' for transport errors.",
+              "# TYPE http_client_responses_total counter"]
+    for endpoint, histogram in sorted(histograms.items()):
+        for status, n in sorted(histogram.statuses.items(), key=lambda item: str(item[0])):
+            lines.append(f'http_client_responses_total{{endpoint="{endpoint}",status="{status}"}} {n}')
+    lines += ["# HELP http_client_retries_total Attempts that were retried.",
+              "# TYPE http_client_retries_total counter"]
+    for endpoint, histogram in sorted(histograms.items()):
+        lines.append(f'http_client_retries_total{{endpoint="{endpoint}"}} {histogram.retries}')
+    return "\n".join(lines) + "\n"
+
+
+def _endpoint(request: httpx.Request) -> str:
+    url = request.url
+    return f"{url.scheme}://{url.host}" + (f":{url.port}" if url.port else "")
+
+
+def _content_length(message) -> int:
+    try:
+        return int(message.headers.get("content-length", 0))
+    except ValueError:
+        return 0
+
+
+def retry_delay(attempt: int, response: httpx.Response = None, backoff: float = HTTP_BACKOFF_S,
+                max_backoff: float = HTTP_MAX_BACKOFF_S) -> float:
+    """
+    Seconds to wait before retry number `attempt` (0 based).
+
+    Retry-After (seconds or an HTTP date) and Azure's retry-after-ms win over the
+    computed backoff, with a little jitter so throttled callers do not return in
+    lockstep; otherwise full jitter over an exponentially growing window.
+    """
+    if response is not None:
+        retry_after = None
+        if "retry-after-ms" in response.headers:
+            try:
+                retry_after = float(response.headers["retry-after-ms"]) / 1000
+            except ValueError:
+                pass
+        if retry_after is None and "retry-after" in response.headers:
+            value = response.headers["retry-after"]
+            try:
+                retry_after = float(value)
+            except ValueError:
+                try:
+                    retry_after = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    pass
+        if retry_after is not None:
+            return min(max(retry_after, 0.0), max_backoff) + random.uniform(0, backoff)
+    return random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+
+
+def _compress(request: httpx.Request, min_bytes: int) -> httpx.Request:
+    if not min_bytes or "content-encoding" in request.headers:
+        return request
+    content = request.read()
+    if len(content) < min_bytes:
+        return request
+    headers = httpx.Headers(request.headers)
+    headers["Content-Encoding"] = "gzip"
+    body = gzip.compress(content, compresslevel=5)
+    headers["Content-Length"] = str(len(body))
+    return httpx.Request(request.method, request.url, headers=headers, content=body,
+                         extensions=request.extensions)
+
+
+class _RetryPolicy:
+
+    def __init__(self, max_retries: int, backoff: float, max_backoff: float, compress_min_bytes: int):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.compress_min_bytes = compress_min_bytes
+
+    def should_retry(self, attempt: int, response: httpx.Response = None) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return response is None or response.status_code in RETRY_STATUS
+
+    def delay(self, attempt: int, response: httpx.Response = None) -> float:
+        return retry_delay(attempt, response, self.backoff, self.max_backoff)
+
+
+class RetryTransport(httpx.BaseTransport, _RetryPolicy):
+    """Pooled httpx transport with per-endpoint concurrency caps, retries and latency metrics."""
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, max_concurrency: int = HTTP_MAX_CONCURRENCY,
+                 max_retries: int = HTTP_MAX_RETRIES, backoff: float = HTTP_BACKOFF_S,
+                 max_backoff: float = HTTP_MAX_BACKOFF_S, compress_min_bytes: int = HTTP_COMPRESS_MIN_BYTES,
+                 transport: httpx.BaseTransport = None):
+        _RetryPolicy.__init__(self, max_retries, backoff, max_backoff, compress_min_bytes)
+        self.max_concurrency = max_concurrency
+        self._transport = transport or httpx.HTTPTransport(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+        self._semaphores = defaultdict(lambda: threading.BoundedSemaphore(max_concurrency))
+        self._lock = threading.Lock()
+
+    def _semaphore(self, endpoint: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            return self._semaphores[endpoint]
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = _endpoint(request)
+        request = _compress(request, self.compress_min_bytes)
+        attempt = 0
+        while True:
+            response = None
+            start = time.perf_counter()
+            with self._semaphore(endpoint), span("http", endpoint=endpoint, attempt=attempt) as http_span:
+                try:
+                    response = self._transport.handle_request(request)
+                except RETRY_ERRORS:
+                    retry = self.should_retry(attempt)
+                    _record(endpoint, time.perf_counter() - start, "error", retry)
+                    if not retry:
+                        raise
+                else:
+                    retry = self.should_retry(attempt, response)
+                    _record(endpoint, time.perf_counter() - start, response.status_code, retry)
+                    http_span.set("status", response.status_code)
+                    http_span.bytes = _content_length(request) + _content_length(response)
+                    if not retry:
+                        return response
+                    response.read()
+                    response.close()
+            time.sleep(self.delay(attempt, response))
+            attempt += 1
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport, _RetryPolicy):
+    """Async counterpart of `RetryTransport`, bound to the event loop it is used on."""
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, max_concurrency: int = HTTP_MAX_CONCURRENCY,
+                 max_retries: int = HTTP_MAX_RETRIES, backoff: float = HTTP_BACKOFF_S,
+                 max_backoff: float = HTTP_MAX_BACKOFF_S, compress_min_bytes: int = HTTP_COMPRESS_MIN_BYTES,
+                 transport: httpx.AsyncBaseTransport = None):
+        _RetryPolicy.__init__(self, max_retries, backoff, max_backoff, compress_min_bytes)
+        self.max_concurrency = max_concurrency
+        self._transport = transport or httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+        self._semaphores = defaultdict(lambda: asyncio.Semaphore(max_concurrency))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = _endpoint(request)
+        request = _compress(request, self.compress_min_bytes)
+        attempt = 0
+        while True:
+            response = None
+            start = time.perf_counter()
+            async with self._semaphores[endpoint]:
+                with span("http", endpoint=endpoint, attempt=attempt) as http_span:
+                    try:
+                        response = await self._transport.handle_async_request(request)
+                    except RETRY_ERRORS:
+                        retry = self.should_retry(attempt)
+                        _record(endpoint, time.perf_counter() - start, "error", retry)
+                        if not retry:
+                            raise
+                    else:
+                        retry = self.should_retry(attempt, response)
+                        _record(endpoint, time.perf_counter() - start, response.status_code, retry)
+                        http_span.set("status", response.status_code)
+                        http_span.bytes = _content_length(request) + _content_length(response)
+                        if not retry:
+                            return response
+                        await response.aread()
+                        await response.aclose()
+            await asyncio.sleep(self.delay(attempt, response))
+            attempt += 1
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class LoopLocal:
+    """
+    One object per running event loop, built by `factory` on first use.
+
+    Async clients and their semaphores are bound to the loop they were created
+    on; entries of closed loops are dropped when a new loop registers.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._values = {}
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        value = self._values.get(loop)
+        if value is None:
+            for closed in [other for other in self._values if other.is_closed()]:
+                del self._values[closed]
+            value = self._values[loop] = self._factory()
+        return value
+
+
+_client = None
+_client_lock = threading.Lock()
+_async_clients = LoopLocal(lambda: httpx.AsyncClient(transport=AsyncRetryTransport(), timeout=HTTP_TIMEOUT_S))
+
+
+def get_http_client() -> httpx.Client:
+    """Return the process-wide client used for search and embedding requests."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(transport=RetryTransport(), timeout=HTTP_TIMEOUT_S)
+    return _client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Return the async client of the running event loop."""
+    return _async_clients.get()
+
+
+register_collector(metrics_text)
@@ -0,0 +1,313 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Per-node timing of the flow's hot paths.
+
+`instrument` wraps a tool function; inside it `span` times sub-steps such as
+connect, execute, fetch, serialize, embedding, search and http, with row counts
+and payload bytes. A sampled node records its spans as OpenTelemetry spans,
+children of the node span promptflow itself traces, and into per (node, span)
+histograms exposed in the Prometheus text format by `metrics_text`. The served
+flow answers /metrics and the readiness probe /ready, 503 until the checks
+added with `register_readiness` (the warm-up of warmup.py) pass, on its scoring
+port, see serving.py; `start_metrics_server` serves both on a port of their own.
+
+Whether a node is sampled is decided once when it starts, with probability
+FLOW_TRACE_SAMPLE_RATE; spans of unsampled nodes cost a context variable lookup.
+FLOW_INSTRUMENTATION=0 turns it all off.
+"""
+
+import contextvars
+import errno
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+FLOW_INSTRUMENTATION = os.environ.get("FLOW_INSTRUMENTATION", "1") == "1"
+FLOW_TRACE_SAMPLE_RATE = float(os.environ.get("FLOW_TRACE_SAMPLE_RATE", "1.0"))
+FLOW_METRICS_PORT = os.environ.get("FLOW_METRICS_PORT")
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the duration histogram buckets
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_tracer = trace.get_tracer("sql-promptflow-demo") if trace is not None else None
+# span of the sampled node being run in this context, None when not sampled
+_current = contextvars.ContextVar("flow_span", default=None)
+
+
+class Span:
+    __slots__ = ('node', 'name', 'attributes', 'rows', 'bytes', '_otel', '_start')
+
+    def __init__(self, node: str, name: str, attributes: dict, parent=None):
+        self.node = node
+        self.name = name
+        self.attributes = attributes
+        self.rows = None
+        self.bytes = None
+        self._otel = None
+        if _tracer is not None:
+            context = trace.set_span_in_context(parent._otel) if parent is not None and parent._otel else None
+            self._otel = _tracer.start_span(name, context=context, attributes=attributes)
+        self._start = time.perf_counter()
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self, error: BaseException = None):
+        duration = time.perf_counter() - self._start
+        _record(self.node, self.name, duration, self.rows, self.bytes)
+        if self._otel is not None:
+            if self.rows is not None:
+                self.attributes['rows'] = self.rows
+            if self.bytes is not None:
+                self.attributes['payload_bytes'] = self.bytes
+            self._otel.set_attributes(self.attributes)
+            if error is not None:
+                self._otel.record_exception(error)
+                self._otel.set_status(trace.Status(trace.StatusCode.ERROR, str(error)))
+            self._otel.end()
+
+
+class _NoopSpan:
+    """Stands in for a span when the node is not sampled; attribute writes are dropped."""
+    __slots__ = ()
+    rows = None
+    bytes = None
+
+    def __setattr__(self, name, value):
+        pass
+
+    def set(self, key: str, value):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _SpanMetrics:
+    __slots__ = ('counts', 'sum', 'rows', 'bytes')
+
+    def __init__(self):
+        self.counts = [0] * (len(DURATION_BUCKETS) + 1)
+        self.sum = 0.0
+        self.rows = 0
+        self.bytes = 0
+
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+_collectors = []
+_readiness_checks = []
+
+
+def _record(node: str, name: str, duration: float, rows, payload_bytes):
+    with _metrics_lock:
+        metrics = _metrics.get((node, name))
+        if metrics is None:
+            metrics = _metrics[(node, name)] = _SpanMetrics()
+        metrics.counts[bisect_left(DURATION_BUCKETS, duration)] += 1
+        metrics.sum += duration
+        metrics.rows += rows or 0
+        metrics.bytes += payload_bytes or 0
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a sub-step of the running node. Yields the span, set `rows` and `bytes`
+    on it to record row counts and payload sizes.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield _NOOP
+        return
+    child = Span(parent.node, name, attributes, parent)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.end(e)
+        raise
+    else:
+        child.end()
+    finally:
+        _current.reset(token)
+
+
+def _payload_size(result) -> int:
+    try:
+        return len(json.dumps(result, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _start_node(node: str):
+    if not FLOW_INSTRUMENTATION or random.random() >= FLOW_TRACE_SAMPLE_RATE:
+        # clear a span inherited from a calling node so nested work is not attributed to it
+        return None, _current.set(None)
+    root = Span(node, "node", {"node": node})
+    return root, _current.set(root)
+
+
+def _end_node(root: Span, token, result=None, error: BaseException = None):
+    _current.reset(token)
+    if root is None:
+        return
+    if error is None:
+        if isinstance(result, (list, dict)):
+            root.rows = len(result)
+        root.bytes = _payload_size(result)
+    root.end(error)
+
+
+def instrument(fn):
+    """Decorator for the tool functions of the flow, sync or async; the node is labelled with the module name."""
+    node = fn.__module__
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            root, token = _start_node(node)
+            try:
+                result = await fn(*args, **kwargs)
+            except BaseException as e:
+                _end_node(root, token, error=e)
+                raise
+            _end_node(root, token, result)
+            return result
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        root, token = _start_node(node)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            _end_node(root, token, error=e)
+            raise
+        _end_node(root, token, result)
+        return result
+    return wrapper
+
+
+def register_collector(collector):
+    """Add a callable returning Prometheus text to what `metrics_text` serves."""
+    _collectors.append(collector)
+
+
+def register_readiness(check):
+    """Add a callable returning (ready, details dict) that /ready answers with."""
+    _readiness_checks.append(check)
+
+
+def readiness_response() -> tuple:
+    """(JSON body, HTTP status, headers) of the /ready probe."""
+    ready, details = readiness()
+    return json.dumps({"ready": ready, **details}), 200 if ready else 503, {"Content-Type": "application/json"}
+
+
+def readiness() -> tuple:
+    """(all checks ready, their details merged)."""
+    ready, details = True, {}
+    for check in _readiness_checks:
+        ok, info = check()
+        ready = ready and ok
+        details.update(info)
+    return ready, details
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def span_metrics() -> dict:
+    """Snapshot of (node, span) -> dict with count, sum_s, rows and bytes."""
+    with _metrics_lock:
+        return {key: {'count': sum(m.counts), 'sum_s': m.sum, 'rows': m.rows, 'bytes': m.bytes}
+                for key, m in _metrics.items()}
+
+
+def metrics_text() -> str:
+    """Span histograms and counters in the Prometheus text format, followed by the registered collectors."""
+    with _metrics_lock:
+        items = sorted((key, list(m.counts), m.sum, m.rows, m.bytes) for key, m in _metrics.items())
+    lines = ["# HELP flow_span_duration_seconds Duration of node and sub-step spans.",
+             "# TYPE flow_span_duration_seconds histogram"]
+    for (node, name), counts, total, _, _ in items:
+        labels = f'node="{node}",span="{name}"'
+        cumulative = 0
+        for bound, n in zip(DURATION_BUCKETS + ("+Inf",), counts):
+            cumulative += n
+            lines.append(f'flow_span_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'flow_span_duration_seconds_sum{{{labels}}} {total:.6f}')
+        lines.append(f'flow_span_duration_seconds_count{{{labels}}} {cumulative}')
+    lines += ["# HELP flow_span_rows_total Rows produced by spans.", "# TYPE flow_span_rows_total counter"]
+    lines += [f'flow_span_rows_total{{node="{node}",span="{name}"}} {rows}'
+              for (node, name), _, _, rows, _ in items]
+    lines += ["# HELP flow_span_payload_bytes_total Payload bytes handled by spans.",
+              "# TYPE flow_span_payload_bytes_total counter"]
+    lines += [f'flow_span_payload_bytes_total{{node="{node}",span="{name}"}} {payload_bytes}'
+              for (node, name), _, _, _, payload_bytes in items]
+    return "\n".join(lines) + "\n" + "".join(collector() for collector in _collectors)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/ready":
+            body, status, _ = readiness_response()
+            body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Serve `metrics_text` at http://host:port/metrics and the readiness probe at
+    /ready from a daemon thread. Returns None when another process, e.g. another
+    worker of the same instance, already serves the port.
+    """
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        if e.errno != errno.EADDRINUSE:
+            raise
+        logger.info("metrics port %s is in use, this process serves its metrics on the scoring port only", port)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,191 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+In-process hybrid search over the product documents, a drop-in for the Azure AI
+Search call in `get_product` when the catalog is small.
+
+`export_index` writes the documents and vectors built by
+`acs/azure_ai_search_prepare.ipynb` to a folder; `LocalSearchIndex` memory maps
+them and scores a query with cosine similarity over ProductCategoryNameVector
+and DescriptionVector plus BM25 over Name and Description, fused with
+reciprocal rank fusion like the hybrid query of the remote service. Catalogs of
+`ann_min_docs` documents or more get an IVF index so only the closest clusters
+are scanned.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+
+VECTOR_FIELDS = ("ProductCategoryNameVector", "DescriptionVector")
+KEYWORD_FIELDS = ("Name", "Description")
+RRF_K = 60
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_token_re = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    return _token_re.findall(text.lower()) if text else []
+
+
+def export_index(documents: list, path: str):
+    """
+    Write documents with their vector fields to `path`.
+
+    Vectors are L2 normalized and stored as float32 matrices, one file per field,
+    so cosine similarity becomes a dot product at query time.
+    """
+    os.makedirs(path, exist_ok=True)
+    meta = {"count": len(documents), "fields": {}}
+    for field in VECTOR_FIELDS:
+        matrix = np.asarray([doc[field] for doc in documents], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+        matrix.tofile(os.path.join(path, f"{field}.f32"))
+        meta["fields"][field] = matrix.shape[1]
+
+    docs = []
+    for doc in documents:
+        doc = {k: v for k, v in doc.items() if k not in VECTOR_FIELDS}
+        # the key field of the remote index is a string
+        doc["ProductId"] = str(doc["ProductId"])
+        docs.append(doc)
+    with open(os.path.join(path, "documents.json"), "w", encoding="utf-8") as f:
+        json.dump(docs, f)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+class _BM25:
+
+    def __init__(self, documents: list):
+        self.n_docs = len(documents)
+        postings = defaultdict(lambda: ([], []))
+        lengths = np.zeros(self.n_docs, dtype=np.float32)
+        for i, doc in enumerate(documents):
+            tokens = [t for field in KEYWORD_FIELDS for t in tokenize(doc.get(field))]
+            lengths[i] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings[term][0].append(i)
+                postings[term][1].append(tf)
+        avg_length = lengths.mean() if self.n_docs else 1.0
+        self.norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(avg_length, 1e-9))
+        self.postings = {term: (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+                         for term, (ids, tfs) in postings.items()}
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs = posting
+            idf = math.log(1 + (self.n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * tfs * (BM25_K1 + 1) / (tfs + self.norm[ids])
+        return scores
+
+
+class _IVFIndex:
+    """Inverted file index: k-means centroids, each query scans the `n_probe` closest clusters."""
+
+    def __init__(self, matrix: np.ndarray, n_lists: int, n_probe: int, iterations: int = 10, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        n_lists = min(n_lists, len(matrix))
+        centroids = matrix[rng.choice(len(matrix), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(matrix @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = matrix[assignment == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-9)
+        self.centroids = centroids
+        self.n_probe = min(n_probe, n_lists)
+        assignment = np.argmax(matrix @ centroids.T, axis=1)
+        self.lists = [np.flatnonzero(assignment == c) for c in range(n_lists)]
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        closest = np.argpartition(-(self.centroids @ query), self.n_probe - 1)[:self.n_probe]
+        return np.concatenate([self.lists[c] for c in closest])
+
+
+def _top(scores: np.ndarray, k: int, ids: np.ndarray = None) -> np.ndarray:
+    """Indices of the `k` best scores, best first, mapped through `ids` when given."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind="stable")]
+    return best if ids is None else ids[best]
+
+
+class LocalSearchIndex:
+
+    def __init__(self, path: str, ann_min_docs: int = 20000, n_lists: int = None, n_probe: int = 8):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        with open(os.path.join(path, "documents.json"), encoding="utf-8") as f:
+            self.documents = json.load(f)
+        self.vectors = {
+            field: np.memmap(os.path.join(path, f"{field}.f32"), dtype=np.float32, mode="r",
+                             shape=(meta["count"], dim))
+            for field, dim in meta["fields"].items()
+        }
+        self.bm25 = _BM25(self.documents)
+        self.ann = {}
+        if len(self.documents) >= ann_min_docs:
+            n_lists = n_lists or int(math.sqrt(len(self.documents)))
+            self.ann = {field: _IVFIndex(np.asarray(matrix), n_lists, n_probe)
+                        for field, matrix in self.vectors.items()}
+
+    def _vector_ranking(self, field: str, query: np.ndarray, k: int) -> np.ndarray:
+        matrix = self.vectors[field]
+        ann = self.ann.get(field)
+        if ann is None:
+            return _top(matrix @ query, k)
+        ids = ann.candidates(query)
+        return _top(matrix[ids] @ query, k, ids)
+
+    def search(self, search_text: str, vector, top_k: int, fields=VECTOR_FIELDS) -> list:
+        """
+        Hybrid search returning up to `top_k` documents with an `@search.score`,
+        shaped like the `value` list of the Azure AI Search REST response.
+        """
+        query = np.array(vector, dtype=np.float32)
+        query /= max(np.linalg.norm(query), 1e-9)
+
+        rankings = [self._vector_ranking(field, query, top_k) for field in fields]
+        if search_text:
+            keyword_scores = self.bm25.scores(search_text)
+            ranking = _top(keyword_scores, top_k)
+            rankings.append(ranking[keyword_scores[ranking] > 0])
+
+        fused = defaultdict(float)
+        for ranking in rankings:
+            for rank, doc_id in enumerate(ranking.tolist()):
+                fused[doc_id] += 1.0 / (RRF_K + rank + 1)
+        best = sorted(fused.items(), key=lambda item: -item[1])[:top_k]
+        return [dict(self.documents[doc_id], **{"@search.score": score}) for doc_id, score in best]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path: str) -> LocalSearchIndex:
+    """Return the process-wide index loaded from `path`, loading it on first use."""
+    index = _indexes.get(path)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(path)
+            if index is None:
+                index = _indexes[path] = LocalSearchIndex(path)
+    return index
@@ -0,0 +1,31 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from promptflow.core import tool
+from promptflow.connections import CustomConnection
+from answer_cache import ANSWER_CACHE, fingerprint, get_cache
+from embedding_cache import generate_embeddings, normalize_text
+from instrumentation import instrument, span
+
+# Looks the question up in the answer cache before the chat node, which only runs
+# when `hit` is false. The question embedding is the one get_product already
+# requested, served by the embedding cache. See answer_cache.py.
+@tool
+@instrument
+def lookup_answer(question: str, retrieved_customers: list, retrieved_documents: dict, chat_history: list,
+                  conn: CustomConnection) -> dict:
+    lookup = {
+        "hit": False,
+        "answer": None,
+        "similarity": None,
+        "customer": fingerprint(retrieved_customers),
+        "data": fingerprint(retrieved_documents, chat_history),
+    }
+    if not ANSWER_CACHE:
+        return lookup
+    with span("answer_cache") as cache_span:
+        vector = generate_embeddings(text=question, conn=conn)
+        answer, similarity = get_cache().lookup((lookup["customer"], lookup["data"]), normalize_text(question), vector)
+        cache_span.set("outcome", "miss" if answer is None else "hit")
+    lookup.update(hit=answer is not None, answer=answer, similarity=similarity)
+    return lookup
@@ -0,0 +1,249 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Result cache in front of the SQL executor for the queries of `sql_query_store`.
+
+Entries are keyed on the connection string, query text and bound parameters. An
+entry expires after the TTL of its query policy. While the database has change
+tracking enabled it is also dropped as soon as CHANGE_TRACKING_CURRENT_VERSION()
+moves, polled at most every SQL_CHANGE_TRACKING_POLL_S seconds. The version only
+moves with the tracked tables, the product tables, so the TTL still bounds how
+stale the results over the others, like the orders, get. Identical concurrent
+misses are coalesced into one execution.
+
+Other caches of the same tables follow the same watermark with
+`register_version_listener`: the listeners are called with the connection string
+whenever a poll sees the version of its database move.
+Cached records are shared between callers and must be treated as read-only.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from promptflow.connections import CustomConnection
+from instrumentation import span
+from sql_executor import execute_sql, run_blocking
+
+SQL_RESULT_CACHE = os.environ.get("SQL_RESULT_CACHE", "1") == "1"
+SQL_RESULT_CACHE_MB = float(os.environ.get("SQL_RESULT_CACHE_MB", "64"))
+SQL_CHANGE_TRACKING_POLL_S = float(os.environ.get("SQL_CHANGE_TRACKING_POLL_S", "5"))
+
+query_version = "SELECT CHANGE_TRACKING_CURRENT_VERSION() AS version"
+
+
+@dataclass(frozen=True)
+class QueryPolicy:
+    # seconds an entry lives at most
+    ttl: float = 300.0
+    # also drop entries when CHANGE_TRACKING_CURRENT_VERSION() moves, when the database has it enabled
+    use_change_tracking: bool = True
+    enabled: bool = True
+
+
+# keyed by the names used in sql_query_store.sql_query_prep
+POLICIES = {
+    'default': QueryPolicy(),
+    'query_order': QueryPolicy(ttl=60.0),
+    'query_prod_byID': QueryPolicy(ttl=600.0),
+    'query_sales_stat': QueryPolicy(ttl=600.0),
+}
+
+
+def _estimate_size(records: list) -> int:
+    size = sys.getsizeof(records)
+    for record in records:
+        size += sys.getsizeof(record)
+        for value in record.values():
+            size += sys.getsizeof(value)
+    return size
+
+
+class _Entry:
+    __slots__ = ('records', 'size', 'version', 'expires_at')
+
+    def __init__(self, records, size, version, expires_at):
+        self.records = records
+        self.size = size
+        self.version = version
+        self.expires_at = expires_at
+
+
+class _Inflight:
+    __slots__ = ('done', 'records', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.records = None
+        self.error = None
+
+
+class QueryResultCache:
+
+    def __init__(self, max_bytes: int = int(SQL_RESULT_CACHE_MB * 2**20),
+                 poll_interval: float = SQL_CHANGE_TRACKING_POLL_S, policies: dict = None, executor=execute_sql):
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self.policies = dict(POLICIES if policies is None else policies)
+        self._execute = executor
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._inflight = {}
+        # connection string -> (change tracking version or None, checked at)
+        self._versions = {}
+        self._version_lock = threading.Lock()
+        self._version_listeners = []
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0, 'invalidations': 0}
+
+    def set_policy(self, name: str, policy: QueryPolicy):
+        self.policies[name] = policy
+
+    def add_version_listener(self, listener):
+        self._version_listeners.append(listener)
+
+    def poll_due(self, conn_db: CustomConnection) -> bool:
+        """Whether the next `current_version` of `conn_db` queries the database."""
+        checked_at = self._versions.get(conn_db['CONNECTION-STRING'], (None, None))[1]
+        return checked_at is None or time.monotonic() - checked_at >= self.poll_interval
+
+    def current_version(self, conn_db: CustomConnection):
+        """Change tracking version of the database, or None when change tracking is off."""
+        conn_string = conn_db['CONNECTION-STRING']
+        version, checked_at = self._versions.get(conn_string, (None, None))
+        now = time.monotonic()
+        if checked_at is not None and now - checked_at < self.poll_interval:
+            return version
+        with self._version_lock:
+            previous, checked_at = self._versions.get(conn_string, (None, None))
+            if checked_at is not None and now - checked_at < self.poll_interval:
+                return previous
+            try:
+                rows = self._execute(sql_query=query_version, conn_db=conn_db)
+                version = rows[0]['version'] if rows else None
+            except Exception:
+                version = None
+            self._versions[conn_string] = (version, time.monotonic())
+        # a failed poll says nothing about the data
+        if checked_at is not None and version is not None and version != previous:
+            for listener in self._version_listeners:
+                listener(conn_string)
+        return version
+
+    def _lookup(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        # the version only moves with the change tracked tables, the TTL applies to every entry
+        if entry.version != version or time.monotonic() >= entry.expires_at:
+            self._remove(key)
+            self._stats['invalidations'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _store(self, key, records, version, policy):
+        size = _estimate_size(records)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _Entry(records, size, version, time.monotonic() + policy.ttl)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self._stats['evictions'] += 1
+
+    def execute(self, sql_query: str, conn_db: CustomConnection, params: tuple = (), policy: str = 'default') -> list:
+        with span("sql_cache", policy=policy) as cache_span:
+            return self._execute_cached(sql_query, conn_db, params, policy, cache_span)
+
+    def _execute_cached(self, sql_query, conn_db, params, policy, cache_span) -> list:
+        query_policy = self.policies.get(policy, self.policies['default'])
+        if not query_policy.enabled:
+            return self._execute(sql_query=sql_query, conn_db=conn_db, params=params)
+
+        version = self.current_version(conn_db) if query_policy.use_change_tracking else None
+        key = (conn_db['CONNECTION-STRING'], sql_query, tuple(params))
+        with self._lock:
+            entry = self._lookup(key, version)
+            if entry is not None:
+                self._stats['hits'] += 1
+                cache_span.set("outcome", "hit")
+                return entry.records
+            inflight = self._inflight.get(key)
+            leader = inflight is None
+            if leader:
+                inflight = self._inflight[key] = _Inflight()
+                self._stats['misses'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        cache_span.set("outcome", "miss" if leader else "coalesced")
+        if not leader:
+            inflight.done.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return inflight.records
+
+        try:
+            inflight.records = self._execute(sql_query=sql_query, conn_db=conn_db, params=params)
+        except BaseException as e:
+            inflight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if inflight.error is None:
+                    self._store(key, inflight.records, version, query_policy)
+            inflight.done.set()
+        return inflight.records
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        with self._version_lock:
+            self._versions.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_rate'] = (stats['hits'] + stats['coalesced']) / lookups if lookups else 0.0
+        return stats
+
+
+_cache = QueryResultCache()
+
+
+def get_cache() -> QueryResultCache:
+    return _cache
+
+
+def register_version_listener(listener):
+    """Call `listener(connection_string)` whenever the change tracking version of that database moves."""
+    _cache.add_version_listener(listener)
+
+
+def execute_sql_cached(sql_query: str, conn_db: CustomConnection, params: tuple = (), policy: str = 'default') -> list:
+    """`execute_sql` behind the process-wide result cache, `policy` names an entry of `POLICIES`."""
+    if not SQL_RESULT_CACHE:
+        return execute_sql(sql_query=sql_query, conn_db=conn_db, params=params)
+    return _cache.execute(sql_query=sql_query, conn_db=conn_db, params=params, policy=policy)
+
+
+async def execute_sql_cached_async(sql_query: str, conn_db: CustomConnection, params: tuple = (),
+                                   policy: str = 'default') -> list:
+    # cache hits are served on the SQL threads as well, coalesced misses block while they wait
+    return await run_blocking(execute_sql_cached, sql_query=sql_query, conn_db=conn_db, params=params, policy=policy)
@@ -0,0 +1,49 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Per worker setup of the served flow, called by the `post_worker_init` hook of
+gunicorn.conf.py once a gunicorn worker loaded promptflow's scoring app.
+
+`init_worker` adds two routes to the scoring app, on the scoring port:
+
+- /ready, the readiness probe, 503 until the checks registered with
+  `instrumentation.register_readiness` pass in this worker,
+- /metrics, the span histograms and collectors of this worker in the
+  Prometheus text format.
+
+With FLOW_WARMUP=1 it then starts the warm-up of warmup.py in the worker.
+
+Each worker has its own connection pools, indexes and caches, so each one
+reports its own state. With FLOW_METRICS_PORT set, the first worker also
+serves both on that port; the other workers find it in use and only answer on
+the scoring port.
+"""
+
+import warmup
+from instrumentation import FLOW_METRICS_PORT, metrics_text, readiness_response, start_metrics_server
+
+
+def _metrics_response() -> tuple:
+    return metrics_text(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+def init_worker(app):
+    """Add /ready and /metrics to `app`, promptflow's flask or fastapi scoring app, and start the warm-up."""
+    if hasattr(app, "add_url_rule"):
+        app.add_url_rule("/ready", "flow_ready", readiness_response, methods=["GET"])
+        app.add_url_rule("/metrics", "flow_metrics", _metrics_response, methods=["GET"])
+    else:
+        from starlette.responses import Response
+
+        def route(respond):
+            def handler():
+                body, status, headers = respond()
+                return Response(body, status_code=status, headers=headers)
+            return handler
+        app.add_api_route("/ready", route(readiness_response), methods=["GET"])
+        app.add_api_route("/metrics", route(_metrics_response), methods=["GET"])
+    if FLOW_METRICS_PORT:
+        start_metrics_server(int(FLOW_METRICS_PORT))
+    if warmup.FLOW_WARMUP:
+        warmup.start()
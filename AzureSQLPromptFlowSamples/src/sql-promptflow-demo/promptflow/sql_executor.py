@@ -0,0 +1,418 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Shared SQL executor used by all python nodes of the flow.
+
+Connections are kept in a process-wide pool keyed by the connection string, so
+the nodes of a chat turn reuse warm connections instead of each paying for a
+TLS handshake and login to Azure SQL.
+"""
+
+import asyncio
+import contextvars
+import datetime
+import decimal
+import functools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from promptflow.connections import CustomConnection
+from instrumentation import span
+
+# connections per connection string, also the number of threads serving async callers
+SQL_POOL_MAX_SIZE = int(os.environ.get("SQL_POOL_MAX_SIZE", "10"))
+# rows pulled per fetchmany call when materializing results
+FETCH_BATCH_SIZE = 1000
+# digits kept for floats, same as DataFrame.to_json's default double_precision
+FLOAT_PRECISION = 10
+
+
+def _pyodbc_connect(conn_string: str):
+    import pyodbc
+    return pyodbc.connect(conn_string, autocommit=True)
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of DB-API connections for a single connection string.
+
+    Idle connections are retired after `idle_timeout` seconds, connections idle
+    for longer than `health_check_interval` are pinged before being handed out,
+    and at most `max_size` connections are open at any time.
+    """
+
+    def __init__(self, conn_string: str, max_size: int = SQL_POOL_MAX_SIZE, idle_timeout: float = 300.0,
+                 health_check_interval: float = 30.0, acquire_timeout: float = 30.0,
+                 connect=None):
+        self.conn_string = conn_string
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self._connect = connect or _pyodbc_connect
+
+        self._cond = threading.Condition()
+        # (connection, last released time), most recently used last
+        self._idle = deque()
+        self._size = 0
+        self._stats = {
+            'acquired': 0,
+            'created': 0,
+            'retired': 0,
+            'health_check_failures': 0,
+            'wait_total_s': 0.0,
+            'wait_max_s': 0.0,
+            'waited': 0,
+        }
+
+    def _retire_idle(self, now: float):
+        """Pop idle connections past `idle_timeout`; caller holds the lock and closes them."""
+        expired = []
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+        self._size -= len(expired)
+        self._stats['retired'] += len(expired)
+        return expired
+
+    @staticmethod
+    def _close(conns):
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _is_healthy(conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.acquire_timeout
+        waited = False
+        while True:
+            conn = None
+            create = False
+            expired = []
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    expired += self._retire_idle(now)
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._close(expired)
+                        raise TimeoutError(
+                            f"Timed out after {self.acquire_timeout}s waiting for a SQL connection "
+                            f"(pool size {self.max_size})")
+                    waited = True
+                    self._cond.wait(remaining)
+            self._close(expired)
+
+            if create:
+                try:
+                    with span("connect"):
+                        conn = self._connect(self.conn_string)
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats['created'] += 1
+                break
+
+            if now - last_used <= self.health_check_interval or self._is_healthy(conn):
+                break
+            # stale connection, drop it and try again
+            with self._cond:
+                self._size -= 1
+                self._stats['health_check_failures'] += 1
+                self._cond.notify()
+            self._close([conn])
+
+        wait = time.monotonic() - start
+        with self._cond:
+            self._stats['acquired'] += 1
+            self._stats['wait_total_s'] += wait
+            self._stats['wait_max_s'] = max(self._stats['wait_max_s'], wait)
+            self._stats['waited'] += int(waited)
+        return conn
+
+    def release(self, conn, discard: bool = False):
+        """Return a connection to the pool, or close it if it is broken."""
+        with self._cond:
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            self._close([conn])
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            self.release(conn, discard=True)
+            raise
+        else:
+            self.release(conn)
+
+    def prefill(self, n: int) -> int:
+        """Open up to `n` connections in parallel and leave them idle, return how many are idle."""
+        n = min(n, self.max_size)
+        if n <= 0:
+            return 0
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            futures = [pool.submit(self.acquire) for _ in range(n)]
+        conns, errors = [], []
+        for future in futures:
+            try:
+                conns.append(future.result())
+            except Exception as e:
+                errors.append(e)
+        for conn in conns:
+            self.release(conn)
+        if errors and not conns:
+            raise errors[0]
+        return len(conns)
+
+    def close(self):
+        """Close all idle connections; connections in use are closed when released."""
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+        self._close(idle)
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+        stats['wait_avg_s'] = stats['wait_total_s'] / stats['acquired'] if stats['acquired'] else 0.0
+        return stats
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(conn_string: str, **kwargs) -> ConnectionPool:
+    """
+    Return the process-wide pool for `conn_string`, creating it on first use.
+
+    Keyword arguments are passed to `ConnectionPool` and only apply when the pool is created.
+    """
+    pool = _pools.get(conn_string)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(conn_string)
+            if pool is None:
+                pool = ConnectionPool(conn_string, **kwargs)
+                _pools[conn_string] = pool
+    return pool
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_UTC = _EPOCH.replace(tzinfo=datetime.timezone.utc)
+_EPOCH_DATE = _EPOCH.date()
+_ONE_MS = datetime.timedelta(milliseconds=1)
+
+
+def _float_value(value):
+    value = float(value)
+    return None if value != value else round(value, FLOAT_PRECISION)
+
+
+def _datetime_value(value):
+    # epoch milliseconds, naive values are taken as UTC
+    return (value - (_EPOCH_UTC if value.tzinfo else _EPOCH)) // _ONE_MS
+
+
+def _date_value(value):
+    return (value - _EPOCH_DATE).days * 86400000
+
+
+def _to_json_value(value):
+    """Convert a single value the way DataFrame.to_json followed by json.loads would."""
+    if value is None or isinstance(value, (str, bool, int)):
+        return value
+    if isinstance(value, (float, decimal.Decimal)):
+        return _float_value(value)
+    if isinstance(value, datetime.datetime):
+        return _datetime_value(value)
+    if isinstance(value, datetime.date):
+        return _date_value(value)
+    if isinstance(value, datetime.time):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
+
+
+def _to_float(value):
+    return None if value is None else _float_value(value)
+
+
+# per column converters, picked when all non NULL values of a column share a type
+_COLUMN_CONVERTERS = {
+    float: _float_value,
+    decimal.Decimal: _float_value,
+    datetime.datetime: _datetime_value,
+    datetime.date: _date_value,
+}
+
+
+def _convert_column(values: tuple):
+    types = set(map(type, values))
+    has_null = type(None) in types
+    types.discard(type(None))
+
+    if types <= {str, bool} or types == {int} and not has_null:
+        return values
+    # a DataFrame stores an int column holding NULLs or floats as float64,
+    # so its ints come out as floats as well
+    if types in ({int}, {int, float}):
+        return [_to_float(v) for v in values]
+    if len(types) == 1:
+        converter = _COLUMN_CONVERTERS.get(next(iter(types)), _to_json_value)
+        return [None if v is None else converter(v) for v in values]
+    return [_to_json_value(v) for v in values]
+
+
+def rows_to_records(columns: list, rows: list) -> list:
+    """
+    Build a list of dicts from DB-API rows, matching the output of
+    `json.loads(pd.DataFrame(rows, columns=columns).to_json(orient="records"))`.
+
+    Decimals become floats, datetimes and dates become epoch milliseconds and NULLs become None.
+    """
+    if not rows:
+        return []
+    converted = [_convert_column(values) for values in zip(*rows)]
+    return [dict(zip(columns, values)) for values in zip(*converted)]
+
+
+def fetch_rows(cursor, batch_size: int = FETCH_BATCH_SIZE) -> tuple:
+    """Fetch the current result set of `cursor` in batches; return (column names, DB-API rows)."""
+    columns = [column[0] for column in cursor.description]
+    rows = []
+    with span("fetch") as fetch_span:
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            rows.extend(batch)
+        fetch_span.rows = len(rows)
+    return columns, rows
+
+
+def fetch_records(cursor, batch_size: int = FETCH_BATCH_SIZE) -> list:
+    """Fetch the current result set of `cursor` in batches and return it as a list of dicts."""
+    columns, rows = fetch_rows(cursor, batch_size)
+    with span("serialize") as serialize_span:
+        records = rows_to_records(columns, rows)
+        serialize_span.rows = len(records)
+    return records
+
+
+def execute_sql(sql_query: str, conn_db: CustomConnection, params: tuple = ()) -> list:
+    """Run `sql_query` with `?` placeholders bound to `params` on a pooled connection, return the rows as a list of dicts."""
+    pool = get_pool(conn_db['CONNECTION-STRING'])
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            with span("execute"):
+                cursor.execute(sql_query, *params)
+            return fetch_records(cursor)
+        finally:
+            cursor.close()
+
+
+def execute_sql_rows(sql_query: str, conn_db: CustomConnection, params: tuple = ()) -> tuple:
+    """Like `execute_sql`, but return (column names, DB-API rows) with the values as the driver returned them."""
+    pool = get_pool(conn_db['CONNECTION-STRING'])
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            with span("execute"):
+                cursor.execute(sql_query, *params)
+            return fetch_rows(cursor)
+        finally:
+            cursor.close()
+
+
+def execute_sql_multi(sql_batch: str, conn_db: CustomConnection, params: tuple = ()) -> list:
+    """
+    Run a batch of statements in one round-trip and return one list of dicts per result set.
+
+    Statements that produce no result set (e.g. SET NOCOUNT ON) are skipped.
+    """
+    pool = get_pool(conn_db['CONNECTION-STRING'])
+    results = []
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            with span("execute", statements="batch"):
+                cursor.execute(sql_batch, *params)
+            while True:
+                if cursor.description is not None:
+                    results.append(fetch_records(cursor))
+                if not cursor.nextset():
+                    break
+        finally:
+            cursor.close()
+
+    return results
+
+
+_async_executor = ThreadPoolExecutor(max_workers=SQL_POOL_MAX_SIZE, thread_name_prefix="sql")
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Run a blocking database call on the SQL thread pool without blocking the event loop.
+
+    pyodbc has no native async API, so async callers share a pool of threads
+    sized like the connection pool, and waiting requests queue here instead of
+    holding the loop. The caller's context is carried over so spans nest under its node.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_async_executor, functools.partial(context.run, fn, *args, **kwargs))
+
+
+async def execute_sql_async(sql_query: str, conn_db: CustomConnection, params: tuple = ()) -> list:
+    return await run_blocking(execute_sql, sql_query=sql_query, conn_db=conn_db, params=params)
@@ -2,6 +2,7 @@
 # Licensed under the MIT license.
 
 from promptflow.core import tool
+from instrumentation import instrument
 
 # English only product description
 query_prod_detail = """
@@ -25,27 +26,36 @@ query_prod_detail = """
                     )
                     """
 
-# Customer order history
-query_order = query_prod_detail + """
-                  SELECT p.Name, p.Category, p.Color, p.Size, p.Weight, p.ListPrice, p.Description
+# Id lists are bound as a single JSON array parameter, e.g. '[1, 2, 3]', so the query text
+# stays the same whatever the ids are and Azure SQL can reuse one cached plan per query
+list_ids_param = "(SELECT id FROM OPENJSON(?) WITH (id int '$'))"
+# (first name, last name) pairs bound as a JSON array of arrays, e.g. '[["Alan", "Brewer"]]'
+name_pairs_param = "OPENJSON(?) WITH (FirstName nvarchar(50) '$[0]', LastName nvarchar(50) '$[1]')"
+
+_order_columns = "p.Name, p.Category, p.Color, p.Size, p.Weight, p.ListPrice, p.Description"
+
+# Customer order history, most recent first
+_query_order = query_prod_detail + """
+                  SELECT {columns}
                   FROM prod_detail AS p
                   INNER JOIN
                   SalesLT.SalesOrderDetail AS sod
                   ON sod.ProductID = p.ProductID
                   INNER JOIN SalesLT.SalesOrderHeader AS soh
                   ON sod.SalesOrderID = soh.SalesOrderID
-                  WHERE soh.CustomerID IN {list_cust}"""
+                  WHERE soh.CustomerID IN {list_cust}
+                  ORDER BY soh.OrderDate DESC, sod.SalesOrderDetailID"""
 
-# product detail by id
-query_prod_byID = query_prod_detail + """
-                  SELECT p.Name, p.Category, p.Color, p.Size, p.Weight, p.ListPrice, p.Description, p.ProductCategoryID
+# product detail by id, ProductID lets get_product restore the search rank order
+_query_prod_byID = query_prod_detail + """
+                  SELECT p.ProductID, p.Name, p.Category, p.Color, p.Size, p.Weight, p.ListPrice, p.Description, p.ProductCategoryID
                   FROM prod_detail AS p
                   WHERE p.ProductID IN {list_product}"""
 
 # product sales stats by category id, returns top 5 most saled products for each category in the list
-query_sales_stat = query_prod_detail + """, prod_sales AS(
+_query_sales_stat = query_prod_detail + """, prod_sales AS(
                         SELECT p.Name, p.Category, p.Color, p.Size, p.Weight, p.ListPrice, p.Description, count(p.Name) as sales_count, p.ProductCategoryID,
-                                ROW_NUMBER() OVER(PARTITION BY p.ProductCategoryID ORDER BY count(p.Name) DESC) AS row_number
+                                ROW_NUMBER() OVER(PARTITION BY p.ProductCategoryID ORDER BY count(p.Name) DESC, p.Name) AS row_number
                         FROM prod_detail p
                         INNER JOIN SalesLT.SalesOrderDetail sod
                         ON p.ProductID = sod.ProductID
@@ -54,15 +64,102 @@ query_sales_stat = query_prod_detail + """, prod_sales AS(
                         WHERE pc.ProductCategoryID IN {list_cate}
                         GROUP BY p.Name, p.Category, p.Color, p.Size, p.Weight, p.ListPrice, p.Description, p.ProductCategoryID
                     )
-                    SELECT p.Name, p.Category, p.Color, p.Size, p.Weight, p.ListPrice, p.Description, p.sales_count
+                    SELECT {columns}
                     FROM prod_sales AS p
-                    WHERE p.row_number <= 5"""
+                    WHERE p.row_number <= 5
+                    ORDER BY p.ProductCategoryID, p.row_number"""
+_sales_stat_columns = "p.Name, p.Category, p.Color, p.Size, p.Weight, p.ListPrice, p.Description, p.sales_count"
+
+# parameter: JSON array of customer ids
+query_order = _query_order.replace("{columns}", _order_columns).replace("{list_cust}", list_ids_param)
+# parameter: JSON array of product ids
+query_prod_byID = _query_prod_byID.replace("{list_product}", list_ids_param)
+# parameter: JSON array of product category ids
+query_sales_stat = _query_sales_stat.replace("{columns}", _sales_stat_columns).replace("{list_cate}", list_ids_param)
+
+# columns of a customer the flow uses
+_customer_columns = "CustomerID, Title, FirstName, MiddleName, LastName"
+
+# customer lookup, names are bound as parameters
+query_customer = f"""SELECT {_customer_columns} FROM [SalesLT].[Customer]
+                    WHERE FirstName=? AND LastName=?"""
+
+# every customer, loaded by customer_index
+query_customer_index = f"SELECT {_customer_columns} FROM [SalesLT].[Customer]"
+
+# products with their category and English description, the documents of the search index
+# built by acs/product_ingestion.py
+_query_product_catalog = """SELECT PC.Name AS ProductCategoryName, SP.ProductID AS ProductId, SP.Name, SP.ProductNumber, SP.Color, SP.ListPrice, SP.Size, SP.ProductCategoryID, SP.ProductModelID, PD.ProductDescriptionID, PD.Description
+                    FROM [SalesLT].[Product] SP
+                    INNER JOIN SalesLT.ProductCategory PC ON PC.ProductCategoryID = SP.ProductCategoryID
+                    INNER JOIN [SalesLT].[ProductModelProductDescription] PMPD ON PMPD.ProductModelID = SP.ProductModelID
+                    INNER JOIN [SalesLT].[ProductDescription] PD ON PD.ProductDescriptionID = PMPD.ProductDescriptionID
+                    WHERE PMPD.Culture = 'en'{filter}
+                    ORDER BY SP.ProductID"""
+query_product_catalog = _query_product_catalog.replace("{filter}", "")
+# parameter: JSON array of product ids
+query_product_catalog_byID = _query_product_catalog.replace("{filter}", f" AND SP.ProductID IN {list_ids_param}")
+
+# change tracking of the tables the product documents are built from, used by acs/product_delta_sync.py
+product_change_tables = ("Product", "ProductCategory", "ProductModelProductDescription", "ProductDescription")
+query_change_tracking_version = "SELECT CHANGE_TRACKING_CURRENT_VERSION() AS version"
+# one column per table, NULL when change tracking is not enabled on it
+query_product_min_valid_versions = "SELECT " + ", ".join(
+    f"CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID('SalesLT.{table}')) AS {table}" for table in product_change_tables)
+# ids of the products whose document changed since a version, including deleted ones
+# parameters: the last synced version, once per table
+query_product_changes = """SELECT ct.ProductID FROM CHANGETABLE(CHANGES SalesLT.Product, ?) AS ct
+                    UNION
+                    SELECT p.ProductID FROM CHANGETABLE(CHANGES SalesLT.ProductCategory, ?) AS ct
+                    INNER JOIN SalesLT.Product AS p ON p.ProductCategoryID = ct.ProductCategoryID
+                    UNION
+                    SELECT p.ProductID FROM CHANGETABLE(CHANGES SalesLT.ProductModelProductDescription, ?) AS ct
+                    INNER JOIN SalesLT.Product AS p ON p.ProductModelID = ct.ProductModelID
+                    UNION
+                    SELECT p.ProductID FROM CHANGETABLE(CHANGES SalesLT.ProductDescription, ?) AS ct
+                    INNER JOIN SalesLT.ProductModelProductDescription AS pmpd ON pmpd.ProductDescriptionID = ct.ProductDescriptionID
+                    INNER JOIN SalesLT.Product AS p ON p.ProductModelID = pmpd.ProductModelID"""
+statements_enable_change_tracking = [
+    "ALTER DATABASE CURRENT SET CHANGE_TRACKING = ON (CHANGE_RETENTION = 2 DAYS, AUTO_CLEANUP = ON)",
+] + [f"ALTER TABLE SalesLT.{table} ENABLE CHANGE_TRACKING" for table in product_change_tables]
+
+# bulk variants for batch_retrieval, each row carries the key its lines are scattered by
+# parameter: JSON array of (first name, last name) pairs
+query_customer_bulk = f"""SELECT c.CustomerID, c.Title, c.FirstName, c.MiddleName, c.LastName
+                    FROM [SalesLT].[Customer] AS c
+                    INNER JOIN {name_pairs_param} AS n
+                    ON c.FirstName = n.FirstName AND c.LastName = n.LastName"""
+# parameter: JSON array of customer ids
+query_order_bulk = _query_order.replace("{columns}", "soh.CustomerID, " + _order_columns).replace("{list_cust}", list_ids_param)
+# parameter: JSON array of product category ids
+query_sales_stat_bulk = _query_sales_stat.replace("{columns}", _sales_stat_columns + ", p.ProductCategoryID").replace("{list_cate}", list_ids_param)
+
+# the snapshot of catalog_replica: every product of prod_detail, and the sales stats of every
+# category ranked by SQL itself, so ties and collation order are the same as query_sales_stat's
+query_catalog_products = query_prod_detail + """
+                  SELECT p.ProductID, p.Name, p.Category, p.Color, p.Size, p.Weight, p.ListPrice, p.Description, p.ProductCategoryID
+                  FROM prod_detail AS p
+                  ORDER BY p.ProductID"""
+query_catalog_sales_stat = _query_sales_stat.replace("{columns}", _sales_stat_columns + ", p.ProductCategoryID").replace(
+    "{list_cate}", "(SELECT ProductCategoryID FROM SalesLT.ProductCategory)")
+
+# single round-trip retrieval, returns three result sets: order history of the customers,
+# products by id and sales stats for the categories of those products; the customers
+# themselves come from customer_index.
+# Parameters are (customer_ids, product_ids, product_ids), ids as JSON arrays.
+query_retrieval_batch = "SET NOCOUNT ON;\n" + ";\n".join([
+    query_order,
+    query_prod_byID,
+    _query_sales_stat.replace("{columns}", _sales_stat_columns).replace("{list_cate}", f"(SELECT ProductCategoryID FROM prod_detail WHERE ProductID IN {list_ids_param})"),
+])
 
 @tool
+@instrument
 def sql_query_prep():
 
   return {
     'query_order': query_order,
     'query_prod_byID': query_prod_byID,
-    'query_sales_stat': query_sales_stat
+    'query_sales_stat': query_sales_stat,
+    'query_retrieval_batch': query_retrieval_batch
   }
\ No newline at end of file
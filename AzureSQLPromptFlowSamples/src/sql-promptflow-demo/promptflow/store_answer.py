@@ -0,0 +1,21 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from promptflow.core import tool
+from promptflow.connections import CustomConnection
+from answer_cache import ANSWER_CACHE, get_cache
+from embedding_cache import generate_embeddings, normalize_text
+from instrumentation import instrument
+
+# The answer of the turn: the cached one on a hit, when the chat node was bypassed
+# and `answer` is None, otherwise the chat node's, which is cached for the next
+# paraphrase of the question over the same data.
+@tool
+@instrument
+def store_answer(question: str, lookup: dict, conn: CustomConnection, answer: str = None) -> str:
+    if lookup["hit"]:
+        return lookup["answer"]
+    if ANSWER_CACHE and answer:
+        vector = generate_embeddings(text=question, conn=conn)
+        get_cache().store((lookup["customer"], lookup["data"]), normalize_text(question), vector, answer)
+    return answer
@@ -0,0 +1,131 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Warm-up of a serving instance before it reports ready.
+
+With FLOW_WARMUP=1 every gunicorn worker of the served flow calls `start`,
+from serving.init_worker, which runs `warm_up` on a background thread:
+
+- the connections the python nodes of flow.dag.yaml take are fetched with
+  PFClient from the connection provider promptflow serving uses
+  (PROMPTFLOW_CONNECTION_PROVIDER),
+- FLOW_WARMUP_SQL_CONNECTIONS pooled SQL connections are opened and the
+  customer index and the catalog replica are loaded,
+- one product search creates the embeddings client, opens the TLS connections
+  of the shared transport to the embeddings and search endpoints, and loads
+  the local index when SEARCH_ENGINE=local.
+
+Each worker opens its own pools and loads its own indexes. Until its warm-up
+finished, or for at most FLOW_WARMUP_TIMEOUT_S, the worker answers 503 to
+/ready; deploy_sdk.py points the readiness probe of the deployment there. A failed step is reported in the /ready body and
+does not keep the instance from becoming ready, requests then pay for it as
+they would without the warm-up. The chat node's client belongs to promptflow
+and the async clients to the event loop of each request, neither is warmed.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from instrumentation import register_readiness
+
+FLOW_WARMUP = os.environ.get("FLOW_WARMUP", "0") == "1"
+FLOW_WARMUP_SQL_CONNECTIONS = int(os.environ.get("FLOW_WARMUP_SQL_CONNECTIONS", "4"))
+FLOW_WARMUP_TIMEOUT_S = float(os.environ.get("FLOW_WARMUP_TIMEOUT_S", "120"))
+
+logger = logging.getLogger(__name__)
+
+FLOW_DIR = os.path.dirname(os.path.abspath(__file__))
+# tool inputs holding connections, see setup.py
+CONNECTION_INPUTS = ("conn_db", "conn")
+
+_state = {"started": None, "done": False, "steps": {}, "errors": {}}
+_lock = threading.Lock()
+
+
+def flow_connections(flow_path: str = os.path.join(FLOW_DIR, "flow.dag.yaml")) -> dict:
+    """Connection names of the python nodes of the flow, by input name."""
+    import yaml
+    with open(flow_path, encoding="utf-8") as f:
+        flow = yaml.safe_load(f)
+    names = {}
+    for node in flow["nodes"]:
+        if node["type"] == "python":
+            for key in CONNECTION_INPUTS:
+                value = node.get("inputs", {}).get(key)
+                if isinstance(value, str) and not value.startswith("${"):
+                    names.setdefault(key, value)
+    return names
+
+
+def resolve_connections(names: dict) -> dict:
+    """The connections of `names`, with their secrets, from the provider promptflow serving uses."""
+    from promptflow.client import PFClient
+    # unset for local serving, PFClient then uses the provider of the pf configuration
+    client = PFClient(connection_provider=os.environ.get("PROMPTFLOW_CONNECTION_PROVIDER") or None)
+    return {key: client.connections.get(name, with_secrets=True) for key, name in names.items()}
+
+
+def _step(name: str, fn):
+    start = time.perf_counter()
+    try:
+        result = fn()
+    except Exception as e:
+        _state["errors"][name] = f"{type(e).__name__}: {e}"
+        result = None
+    _state["steps"][name] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def warm_up(connections: dict = None) -> dict:
+    """
+    Warm the process for `connections`, by tool input name ("conn_db", "conn"),
+    resolved from flow.dag.yaml when None. Returns the seconds of each step and
+    the errors of the failed ones.
+    """
+    with _lock:
+        _state.update(started=_state["started"] or time.monotonic(), done=False, steps={}, errors={})
+    if connections is None:
+        connections = _step("connections", lambda: resolve_connections(flow_connections())) or {}
+    conn_db, conn = connections.get("conn_db"), connections.get("conn")
+    if conn_db is not None:
+        import customer_index
+        from sql_executor import get_pool
+        _step("sql_pool", lambda: get_pool(conn_db['CONNECTION-STRING']).prefill(FLOW_WARMUP_SQL_CONNECTIONS))
+        if customer_index.CUSTOMER_INDEX:
+            _step("customer_index", lambda: customer_index.get_index(conn_db))
+        import catalog_replica
+        if catalog_replica.CATALOG_REPLICA:
+            _step("catalog_replica", lambda: catalog_replica.get_replica(conn_db))
+    if conn is not None:
+        from get_product import search_products
+        _step("search", lambda: search_products("warm up", conn, 1))
+    _state["done"] = True
+    return {"steps": dict(_state["steps"]), "errors": dict(_state["errors"])}
+
+
+def status() -> tuple:
+    """(ready, details) for the /ready probe."""
+    started = _state["started"]
+    timed_out = started is not None and time.monotonic() - started > FLOW_WARMUP_TIMEOUT_S
+    ready = _state["done"] or timed_out
+    return ready, {"warmup": {"done": _state["done"], "timed_out": timed_out and not _state["done"],
+                              "steps": dict(_state["steps"]), "errors": dict(_state["errors"])}}
+
+
+def start() -> threading.Thread:
+    """Run `warm_up` in a daemon thread; /ready answers 503 until it finished."""
+    _state["started"] = time.monotonic()
+    register_readiness(status)
+
+    def run():
+        result = warm_up()
+        if result["errors"]:
+            logger.warning("warm-up finished with failed steps: %s", result)
+        else:
+            logger.info("warm-up finished: %s", result)
+    thread = threading.Thread(target=run, name="flow-warmup", daemon=True)
+    thread.start()
+    return thread
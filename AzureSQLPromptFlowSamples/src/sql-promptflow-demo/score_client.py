@@ -0,0 +1,112 @@
+"""
+Call the /score route of the served flow, with the answer buffered or streamed.
+
+Asked for `text/event-stream`, promptflow serving turns on `stream` for the chat
+node, the LLM node the `answer` output references, and replies with
+server-sent events: first one `data: {...}` event with the other outputs
+(`retrieved_documents`), then one `data: {"answer": "..."}` event per piece of
+the completion as Azure OpenAI generates it. Asked for JSON, it replies once the
+whole completion is in, as before, and so it does for flows whose answer does not
+come straight from the chat node. `score` handles both and returns the same
+outputs, with the time to the first answer token and to the end of the response.
+
+    python score_client.py --question "Can you recommend some home exercise products for me?"
+    python score_client.py --url https://<endpoint>.<region>.inference.ml.azure.com/score --key <key> --buffered
+
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import httpx
+
+SCORE_URL = os.environ.get("SCORE_URL", "http://localhost:8080/score")
+# read timeout between two events, or for the whole answer when buffered
+SCORE_TIMEOUT_S = float(os.environ.get("SCORE_TIMEOUT_S", "90"))
+
+
+def iter_events(lines):
+    """The JSON payloads of the `data:` lines of a server-sent event stream."""
+    for line in lines:
+        if line.startswith("data:"):
+            data = line[5:].strip()
+            if data:
+                yield json.loads(data)
+
+
+def score(payload: dict, url: str = SCORE_URL, key: str = None, deployment: str = None, stream: bool = True,
+          on_token=None, client: httpx.Client = None, timeout: float = SCORE_TIMEOUT_S):
+    """
+    POST `payload` (question, customer, chat_history) to `url`; return (outputs, timings).
+
+    `key` and `deployment` are the endpoint key and the deployment to route to for a
+    managed online endpoint. With `stream`, `on_token` is called with each piece
+    of the answer as it arrives, or once with the whole answer when the flow does
+    not stream. timings has `first_token_s`, the seconds until
+    the first non-empty piece of the answer (the whole response when buffered),
+    and `total_s`.
+    """
+    # promptflow answers 406 to text/event-stream alone when the flow has no streaming output
+    headers = {"Accept": "text/event-stream, application/json" if stream else "application/json"}
+    if key:
+        headers["Authorization"] = f"Bearer {key}"
+    if deployment:
+        headers["azureml-model-deployment"] = deployment
+    own_client = client is None
+    client = client or httpx.Client(timeout=httpx.Timeout(timeout, connect=10.0))
+    start = time.perf_counter()
+    first_token = None
+    try:
+        with client.stream("POST", url, json=payload, headers=headers) as response:
+            response.raise_for_status()
+            if not response.headers.get("content-type", "").startswith("text/event-stream"):
+                # the flow has no streaming output, or streaming was not asked for
+                outputs = json.loads(response.read())
+                if stream and on_token is not None and outputs.get("answer"):
+                    on_token(outputs["answer"])
+            else:
+                outputs, pieces = {}, []
+                for event in iter_events(response.iter_lines()):
+                    piece = event.pop("answer", None)
+                    outputs.update(event)
+                    if piece:
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                        pieces.append(piece)
+                        if on_token is not None:
+                            on_token(piece)
+                outputs["answer"] = "".join(pieces)
+    finally:
+        if own_client:
+            client.close()
+    total = time.perf_counter() - start
+    return outputs, {"first_token_s": total if first_token is None else first_token, "total_s": total}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ask the served flow a question, streaming the answer.")
+    parser.add_argument("--url", default=SCORE_URL)
+    parser.add_argument("--key", default=os.environ.get("SCORE_KEY"), help="endpoint key of a managed online endpoint")
+    parser.add_argument("--deployment", help="deployment of the endpoint to send the request to")
+    parser.add_argument("--question", default="Can you recommend some home exercise products for me?")
+    parser.add_argument("--customer", default="Donald Blanton")
+    parser.add_argument("--buffered", action="store_true", help="wait for the whole answer, as without streaming")
+    args = parser.parse_args()
+
+    def on_token(piece):
+        sys.stdout.write(piece)
+        sys.stdout.flush()
+
+    outputs, timings = score({"question": args.question, "customer": args.customer, "chat_history": []},
+                             url=args.url, key=args.key, deployment=args.deployment, stream=not args.buffered,
+                             on_token=on_token)
+    if args.buffered:
+        print(outputs["answer"])
+    print(f"\n\nretrieved_documents: {json.dumps(outputs.get('retrieved_documents'))[:200]}...")
+    print(f"first token after {timings['first_token_s'] * 1000:.0f} ms, answer complete after "
+          f"{timings['total_s'] * 1000:.0f} ms")
@@ -106,7 +106,10 @@ if __name__ == "__main__":
                 'AZURE_SEARCH_API_VERSION': config['AZURE_SEARCH_API_VERSION'],
                 'AZURE_SEARCH_ENDPOINT': config['AZURE_SEARCH_ENDPOINT'],
                 'AZURE_SEARCH_INDEX': config['AZURE_SEARCH_INDEX'],
-                'AZURE_OPENAI_API_EMB_DEPLOYMENT': config['AZURE_OPENAI_API_EMB_DEPLOYMENT']
+                'AZURE_OPENAI_API_EMB_DEPLOYMENT': config['AZURE_OPENAI_API_EMB_DEPLOYMENT'],
+                # 'local' searches the index exported by acs/azure_ai_search_prepare.ipynb in-process
+                'SEARCH_ENGINE': config.get('SEARCH_ENGINE') or 'remote',
+                'LOCAL_SEARCH_INDEX_PATH': config.get('LOCAL_SEARCH_INDEX_PATH') or 'local_index'
                 },
         secrets={'ACS-SEARCH-KEY': acs_key,
                 'AZURE_OPENAI_API_EMB_KEY': aoai_api_key_embed
@@ -119,7 +122,16 @@ if __name__ == "__main__":
     # %%
     # Load the yaml file to dictionary path is azure_openai.yml
     print("Setting up flow.dag.yaml.")
-    with open('./promptflow/flow.dag.sample.yaml') as f:
+    # PROMPTFLOW_RETRIEVAL_MODE=combined runs all SQL retrieval in a single round-trip,
+    # PROMPTFLOW_RETRIEVAL_MODE=async uses the async retrieval nodes for the serving endpoint,
+    # PROMPTFLOW_RETRIEVAL_MODE=cached puts the answer cache of answer_cache.py in front of the chat node
+    flow_samples = {
+        'combined': './promptflow/flow.dag.combined.sample.yaml',
+        'async': './promptflow/flow.dag.async.sample.yaml',
+        'cached': './promptflow/flow.dag.cached.sample.yaml',
+    }
+    flow_sample = flow_samples.get(config.get('PROMPTFLOW_RETRIEVAL_MODE'), './promptflow/flow.dag.sample.yaml')
+    with open(flow_sample) as f:
         config_flow = yaml.load(f, Loader=yaml.FullLoader)
     # import pdb; pdb.set_trace()
     # replace the deployment_name with the one you want to use